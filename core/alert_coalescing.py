@@ -0,0 +1,136 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .events import publish_event, EVENT_ALERT
+from .models import EmergencyAlert
+
+# Open alert state per safety session, and the lock serialising updates to it
+_OPEN_KEY = 'open-alert:{}'
+_LOCK_KEY = 'open-alert-lock:{}'
+LOCK_TIMEOUT = 10
+LOCK_WAIT_SECONDS = 2
+# Session locks this thread holds, and whether each was actually acquired
+_held = threading.local()
+
+# What the caller should send for a detection
+NOTIFY_INITIAL = 'initial'
+NOTIFY_FOLLOW_UP = 'follow_up'
+# Sent once per alert when location enrichment finishes after the first notification
+NOTIFY_LOCATION = 'location'
+NOTIFY_POLICE_STATIONS = 'police_stations'
+
+
+def _acquire(key):
+    """Take a cache lock shared by every worker process; False if it stays busy"""
+    deadline = time.monotonic() + LOCK_WAIT_SECONDS
+    while not cache.add(key, 1, LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def _held_locks():
+    if not hasattr(_held, 'sessions'):
+        _held.sessions = {}
+    return _held.sessions
+
+
+@contextmanager
+def session_alert_lock(session):
+    """Serialise detections on a safety session; yields whether the lock was taken.
+
+    Open it outside the caller's transaction.atomic() block, so the next
+    detection reads the open alert only after this one's row is committed
+    and never updates a row it cannot see.
+    """
+    held = _held_locks()
+    if session.id in held:
+        yield held[session.id]
+        return
+
+    lock_key = _LOCK_KEY.format(session.id)
+    locked = _acquire(lock_key)
+    if not locked:
+        # Never drop an emergency because the lock is contended
+        print(f"Alert lock busy for safety session {session.id}, raising a separate alert")
+    held[session.id] = locked
+    try:
+        yield locked
+    finally:
+        del held[session.id]
+        if locked:
+            cache.delete(lock_key)
+
+
+def coalesce_alert(session, description, location='', alert_type='voice'):
+    """Record a detection on a safety session, merging it into the open alert.
+
+    Detections less than ALERT_COALESCE_WINDOW seconds after the previous one
+    update that alert's count, description and location instead of creating
+    a new one. Returns (alert, notify), where notify is NOTIFY_INITIAL for a
+    new alert, NOTIFY_FOLLOW_UP once per ALERT_FOLLOW_UP_INTERVAL while it
+    stays open, and None otherwise. Callers running it in a transaction hold
+    `session_alert_lock` around that transaction.
+    """
+    with session_alert_lock(session) as locked:
+        now = time.time()
+        state = cache.get(_OPEN_KEY.format(session.id)) if locked else None
+        alert = None
+        notify = None
+
+        if state:
+            updates = {
+                'detection_count': F('detection_count') + 1,
+                'last_detected_at': timezone.now(),
+                'description': description,
+            }
+            if location:
+                updates['location'] = location
+            if EmergencyAlert.objects.filter(pk=state['alert_id']).update(**updates):
+                alert = EmergencyAlert.objects.get(pk=state['alert_id'])
+                if now - state['notified_at'] >= settings.ALERT_FOLLOW_UP_INTERVAL:
+                    state['notified_at'] = now
+                    notify = NOTIFY_FOLLOW_UP
+
+        if alert is None:
+            alert = EmergencyAlert.objects.create(
+                safety_session=session,
+                alert_type=alert_type,
+                location=location,
+                description=description,
+                shown_to_user=False,
+                last_detected_at=timezone.now(),
+            )
+            state = {'alert_id': alert.id, 'notified_at': now}
+            notify = NOTIFY_INITIAL
+            # Dashboards hear about the alert once it is committed and visible to their fetch
+            event = {'alert_id': alert.id, 'alert_type': alert_type, 'timestamp': alert.timestamp.isoformat()}
+            transaction.on_commit(lambda: publish_event(session.user_id, EVENT_ALERT, event))
+
+        if locked:
+            # The window slides: it closes ALERT_COALESCE_WINDOW seconds after the latest detection.
+            # Published once the alert row is committed, and never after a rollback
+            transaction.on_commit(
+                lambda: cache.set(_OPEN_KEY.format(session.id), state, settings.ALERT_COALESCE_WINDOW)
+            )
+        return alert, notify
+
+
+def notification_round(alert, notify):
+    """Name of the notification round a detection triggered, unique per alert"""
+    if notify == NOTIFY_FOLLOW_UP:
+        return f"{notify}-{alert.detection_count}"
+    return notify
+
+
+def close_open_alert(session_id):
+    """Stop merging detections into a session's open alert"""
+    cache.delete(_OPEN_KEY.format(session_id))
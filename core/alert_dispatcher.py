@@ -0,0 +1,428 @@
+import bisect
+import hashlib
+import hmac
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .alert_coalescing import notification_round, NOTIFY_INITIAL, NOTIFY_FOLLOW_UP, NOTIFY_LOCATION, NOTIFY_POLICE_STATIONS
+from .http_client import get_http_client
+from .mail_pool import get_mail_pool
+from .models import PushSubscription
+from .outbox import enqueue_notifications, mark_sent_late
+
+# Upper bounds (ms) of the per-channel delivery latency histogram buckets
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class DeadlineExceeded(Exception):
+    """Raised for notifications a channel could not send before its deadline"""
+
+
+class ChannelError(Exception):
+    """Raised when a channel's gateway rejects a notification"""
+
+
+def render_alert(alert, user, notify=NOTIFY_INITIAL, location=None, police_stations=None):
+    """The one alert message every channel renders from"""
+    name = user.get_full_name() or user.username
+    location = location or {}
+    lat = location.get('latitude')
+    lng = location.get('longitude')
+    map_link = f"https://maps.google.com/?q={lat},{lng}" if lat is not None and lng is not None else ''
+
+    if notify == NOTIFY_FOLLOW_UP:
+        title = f"EMERGENCY UPDATE: {name} still needs help!"
+        summary = f"Distress has now been detected {alert.detection_count} times."
+    elif notify == NOTIFY_LOCATION:
+        title = f"EMERGENCY UPDATE: {name}'s location"
+        summary = "Their location is now known. They may still be in danger."
+    elif notify == NOTIFY_POLICE_STATIONS:
+        title = f"EMERGENCY UPDATE: police stations near {name}"
+        summary = "The nearest police stations to their location are listed below."
+    else:
+        title = f"EMERGENCY ALERT: {name} needs help!"
+        summary = "They may be in danger and need immediate assistance."
+
+    lines = [
+        f"EMERGENCY ALERT from {name}!",
+        summary,
+        f"Description: {alert.description}",
+        f"Location: Latitude: {lat}, Longitude: {lng}\nGoogle Maps: {map_link}" if map_link else "Location: not available",
+    ]
+    nearest = police_stations[0] if police_stations else None
+    if nearest:
+        lines.append(
+            f"Nearest police station: {nearest['name']} ({nearest['distance']:.2f} km), "
+            f"https://maps.google.com/?q={nearest['lat']},{nearest['lon']}"
+        )
+    lines.append(f"Time: {timezone.localtime().strftime('%Y-%m-%d %H:%M:%S')}")
+    lines.append("\nPlease respond immediately!")
+
+    return {
+        'title': title,
+        'body': '\n'.join(lines),
+        'short': f"SirenShield: {title} {map_link}".strip(),
+        'payload': {
+            'alert_id': alert.id,
+            'user': name,
+            'type': notify,
+            'detection_count': alert.detection_count,
+            'description': alert.description,
+            'latitude': lat,
+            'longitude': lng,
+            'map_link': map_link,
+            'nearest_police_station': nearest,
+            'timestamp': timezone.now().isoformat(),
+        },
+    }
+
+
+class EmailChannel:
+    """Email to every contact with an address, over one pooled SMTP connection"""
+
+    name = 'email'
+    batched = True
+
+    def is_available(self):
+        return True
+
+    def wanted_by(self, profile):
+        return profile.email_notifications
+
+    def recipients(self, user, contacts):
+        return [contact.email for contact in contacts if contact.email]
+
+    def render(self, message):
+        return message['title'], message['body']
+
+    def send_batch(self, notifications, deadline):
+        """Send over one connection; returns {notification id: error or None}"""
+        results = {}
+        with get_mail_pool().connection() as connection:
+            # Build every message up front so the connection is only held for the sends
+            messages = [(notification, self._message(notification, connection)) for notification in notifications]
+            for notification, message in messages:
+                if notification.pk in results:
+                    continue
+                if time.monotonic() > deadline:
+                    results[notification.pk] = DeadlineExceeded('Email deadline exceeded')
+                    continue
+                try:
+                    connection.send_messages([message])
+                    results[notification.pk] = None
+                except Exception as e:
+                    results[notification.pk] = e
+                    # A dropped connection would fail every remaining message, so reconnect
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception as reconnect_error:
+                        for remaining, _ in messages:
+                            results.setdefault(remaining.pk, reconnect_error)
+        return results
+
+    def _message(self, notification, connection):
+        return EmailMessage(
+            notification.subject,
+            notification.body,
+            settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER,
+            [notification.recipient],
+            connection=connection,
+        )
+
+
+class _HttpChannel:
+    """Channels that POST one request per notification"""
+
+    batched = False
+
+    def _post(self, url, deadline, **kwargs):
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise DeadlineExceeded(f"{self.name} deadline exceeded")
+        response = get_http_client().post(url, timeout=timeout, **kwargs)
+        if response.status_code >= 400:
+            raise ChannelError(f"{self.name} gateway returned {response.status_code}")
+        return response
+
+
+class SmsChannel(_HttpChannel):
+    """Text message to every contact's phone through an HTTP SMS gateway"""
+
+    name = 'sms'
+
+    def is_available(self):
+        return bool(settings.SMS_GATEWAY_URL)
+
+    def wanted_by(self, profile):
+        return profile.sms_notifications
+
+    def recipients(self, user, contacts):
+        return [contact.phone_number for contact in contacts if contact.phone_number]
+
+    def render(self, message):
+        return message['title'], message['short']
+
+    def send(self, notification, deadline):
+        headers = {}
+        if settings.SMS_GATEWAY_TOKEN:
+            headers['Authorization'] = f"Bearer {settings.SMS_GATEWAY_TOKEN}"
+        self._post(
+            settings.SMS_GATEWAY_URL,
+            deadline,
+            json={'to': notification.recipient, 'message': notification.body},
+            headers=headers,
+        )
+
+
+class WebhookChannel(_HttpChannel):
+    """JSON alert payload to an operator webhook, signed with ALERT_WEBHOOK_SECRET"""
+
+    name = 'webhook'
+
+    def is_available(self):
+        return bool(settings.ALERT_WEBHOOK_URL)
+
+    def wanted_by(self, profile):
+        return True
+
+    def recipients(self, user, contacts):
+        return [settings.ALERT_WEBHOOK_URL]
+
+    def render(self, message):
+        return message['title'], json.dumps(message['payload'])
+
+    def send(self, notification, deadline):
+        body = notification.body.encode()
+        headers = {'Content-Type': 'application/json'}
+        if settings.ALERT_WEBHOOK_SECRET:
+            signature = hmac.new(settings.ALERT_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+            headers['X-SirenShield-Signature'] = f"sha256={signature}"
+        self._post(notification.recipient, deadline, data=body, headers=headers)
+
+
+class PushChannel:
+    """Web push to the browsers of contacts who are SirenShield users themselves"""
+
+    name = 'push'
+    batched = False
+
+    def is_available(self):
+        if not settings.WEBPUSH_VAPID_PRIVATE_KEY:
+            return False
+        try:
+            import pywebpush  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def wanted_by(self, profile):
+        return profile.push_notifications
+
+    def recipients(self, user, contacts):
+        # Only accounts that accepted the contact link; an email address proves nothing
+        linked = [contact.linked_user_id for contact in contacts if contact.linked_user_id]
+        subscriptions = PushSubscription.objects.filter(user_id__in=linked).values_list('id', flat=True)
+        return [f"subscription:{subscription_id}" for subscription_id in subscriptions]
+
+    def render(self, message):
+        return message['title'], json.dumps({'title': message['title'], 'body': message['short']})
+
+    def send(self, notification, deadline):
+        from pywebpush import webpush, WebPushException
+
+        # Runs on a long-lived delivery thread, so its connection must not outlive the send
+        close_old_connections()
+        try:
+            subscription = PushSubscription.objects.filter(pk=notification.recipient.split(':', 1)[1]).first()
+            if subscription is None:
+                raise ChannelError('Push subscription no longer exists')
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise DeadlineExceeded('push deadline exceeded')
+            try:
+                webpush(
+                    subscription_info=subscription.subscription_info(),
+                    data=notification.body,
+                    vapid_private_key=settings.WEBPUSH_VAPID_PRIVATE_KEY,
+                    vapid_claims={'sub': settings.WEBPUSH_VAPID_SUBJECT},
+                    timeout=timeout,
+                )
+            except WebPushException as e:
+                if e.response is not None and e.response.status_code in (404, 410):
+                    # The browser unsubscribed; stop sending to it
+                    subscription.delete()
+                raise ChannelError(str(e))
+        finally:
+            close_old_connections()
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with success and failure counts"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.failures = 0
+        self.deadline_misses = 0
+        self.total_ms = 0.0
+
+    def record(self, milliseconds, error=None):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total_ms += milliseconds
+        if error is not None:
+            self.failures += 1
+
+    def snapshot(self):
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'count': self.count,
+            'failures': self.failures,
+            'deadline_misses': self.deadline_misses,
+            'mean_ms': self.total_ms / self.count if self.count else 0.0,
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+def _record_late_sends(future):
+    """Mark notifications a timed-out send delivered after all, so they are not sent twice"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    sent = [pk for pk, error in future.result().items() if error is None]
+    if sent:
+        mark_sent_late(sent)
+
+
+class AlertDispatcher:
+    """One entry point for alert notifications on every channel.
+
+    dispatch() renders the alert once and queues a notification per channel
+    and recipient in the outbox; deliver() is called by the outbox workers and
+    sends a claimed batch on all channels concurrently. Each channel has its
+    own threads and a hard deadline, and anything it has not sent by then is
+    returned as failed and retried later, so one slow gateway never holds up
+    the others. Delivery is at least once: a send that completes after its
+    deadline is recorded on its row if the row has not been retried yet.
+    """
+
+    def __init__(self, channels, deadlines, workers):
+        self.channels = {channel.name: channel for channel in channels}
+        self.deadlines = deadlines
+        self._pools = {
+            name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'alert-{name}')
+            for name in self.channels
+        }
+        self._histograms = {name: LatencyHistogram() for name in self.channels}
+        self._lock = threading.Lock()
+
+    def dispatch(self, alert, user, notify=NOTIFY_INITIAL, location=None, police_stations=None):
+        """Queue the alert for every enabled channel; call inside the alert's transaction"""
+        profile = user.userprofile
+        contacts = list(profile.emergency_contacts.all())
+        message = render_alert(alert, user, notify, location, police_stations)
+        round_name = notification_round(alert, notify)
+
+        messages = []
+        for channel in self.channels.values():
+            if not channel.is_available() or not channel.wanted_by(profile):
+                continue
+            subject, body = channel.render(message)
+            for recipient in channel.recipients(user, contacts):
+                messages.append((channel.name, recipient, subject, body))
+        return enqueue_notifications(alert, messages, round_name)
+
+    def deliver(self, notifications):
+        """Send claimed notifications on their channels; returns {notification id: error or None}"""
+        started = time.monotonic()
+        by_channel = {}
+        for notification in notifications:
+            by_channel.setdefault(notification.channel, []).append(notification)
+
+        futures = {}
+        results = {}
+        for name, group in by_channel.items():
+            channel = self.channels.get(name)
+            if channel is None:
+                for notification in group:
+                    results[notification.pk] = ChannelError(f"Unknown channel: {name}")
+                continue
+
+            deadline = started + self.deadlines.get(name, settings.ALERT_CHANNEL_DEFAULT_DEADLINE)
+            pool = self._pools[name]
+            if channel.batched:
+                futures[pool.submit(self._run_batch, channel, group, deadline, started)] = (deadline, group)
+            else:
+                for notification in group:
+                    future = pool.submit(self._run_one, channel, notification, deadline, started)
+                    futures[future] = (deadline, [notification])
+
+        # Wait for each channel only until its own deadline
+        for future, (deadline, group) in sorted(futures.items(), key=lambda item: item[1][0]):
+            done, _ = wait([future], timeout=max(0.0, deadline - time.monotonic()))
+            if done:
+                results.update(future.result())
+                continue
+            # The send may still finish late; whatever it delivers is then marked sent
+            future.add_done_callback(_record_late_sends)
+            for notification in group:
+                results[notification.pk] = DeadlineExceeded(f"{notification.channel} deadline exceeded")
+
+        # Misses are counted here only, once per notification, whether the channel gave up
+        # on the deadline itself or was still sending when the wait ran out
+        with self._lock:
+            for notification in notifications:
+                if isinstance(results[notification.pk], DeadlineExceeded) and notification.channel in self._histograms:
+                    self._histograms[notification.channel].deadline_misses += 1
+        return results
+
+    def _run_batch(self, channel, group, deadline, started):
+        try:
+            results = channel.send_batch(group, deadline)
+        except Exception as e:
+            # No connection could be opened at all; every message in the batch is retried
+            results = {notification.pk: e for notification in group}
+        for notification in group:
+            self._record(channel.name, started, results[notification.pk])
+        return results
+
+    def _run_one(self, channel, notification, deadline, started):
+        error = None
+        try:
+            channel.send(notification, deadline)
+        except Exception as e:
+            error = e
+        self._record(channel.name, started, error)
+        return {notification.pk: error}
+
+    def _record(self, channel_name, started, error):
+        with self._lock:
+            self._histograms[channel_name].record((time.monotonic() - started) * 1000, error)
+
+    def stats(self):
+        with self._lock:
+            return {name: histogram.snapshot() for name, histogram in self._histograms.items()}
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_alert_dispatcher():
+    """Process-wide dispatcher with every channel, sized and timed from settings"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AlertDispatcher(
+                [EmailChannel(), SmsChannel(), WebhookChannel(), PushChannel()],
+                deadlines=settings.ALERT_CHANNEL_DEADLINES,
+                workers=settings.ALERT_DISPATCH_WORKERS,
+            )
+        return _dispatcher
@@ -0,0 +1,59 @@
+from django.db import transaction
+from .models import SafetySession
+from .alert_coalescing import coalesce_alert, session_alert_lock
+from .alert_dispatcher import get_alert_dispatcher
+from .geoip import client_ip, locate_ip
+
+
+def parse_location(location):
+    """Parse a "lat,lng" string into a location dict (empty if invalid)"""
+    if not location:
+        return {}
+    try:
+        lat, lng = location.split(',')
+        return {
+            'latitude': float(lat),
+            'longitude': float(lng)
+        }
+    except (ValueError, AttributeError):
+        return {}
+
+
+def request_location(request, location=''):
+    """The browser's "lat,lng" if it sent one, else the client IP's offline GeoIP location"""
+    if parse_location(location):
+        return location
+    found = locate_ip(client_ip(request))
+    return f"{found['latitude']},{found['longitude']}" if found else ''
+
+
+def raise_voice_alert(user, detected_text, location=''):
+    """Record a voice detection on the user's active safety session and notify their contacts.
+
+    Repeated detections are merged into the session's open alert, and contacts
+    only hear about them through throttled follow-ups. Returns the alert, or
+    None when safety mode is not active.
+    """
+    active_session = SafetySession.objects.filter(
+        user=user,
+        is_active=True
+    ).first()
+
+    if not active_session:
+        return None
+
+    # The alert and its queued notifications are stored together or not at all
+    with session_alert_lock(active_session), transaction.atomic():
+        alert, notify = coalesce_alert(
+            active_session,
+            f"Emergency phrase detected: '{detected_text}'",
+            location=location,
+        )
+        if notify is None:
+            print(f"Detection merged into alert {alert.id} ({alert.detection_count} detections)")
+            return alert
+
+        # Queue alerts to emergency contacts on every channel; delivery happens off the request path
+        get_alert_dispatcher().dispatch(alert, user, notify, parse_location(location))
+
+    return alert
@@ -0,0 +1,180 @@
+import glob
+import json
+import os
+
+from django.conf import settings
+
+# Archived tables: the datetime column that picks a row's monthly partition, the other
+# datetime columns, and the columns kept. Emergency alerts, fixes and notifications carry
+# the owning user_id so history can be read back per user without the live tables
+DATASETS = {
+    'sessions': {
+        'month_by': 'start_time',
+        'dates': ['start_time', 'end_time'],
+        'columns': ['id', 'user_id', 'start_time', 'end_time', 'location', 'client_ip'],
+    },
+    'emergency_alerts': {
+        'month_by': 'timestamp',
+        'dates': ['timestamp', 'last_detected_at'],
+        'columns': ['id', 'safety_session_id', 'user_id', 'timestamp', 'alert_type', 'status', 'location',
+                    'description', 'detection_count', 'last_detected_at', 'stage_timings'],
+    },
+    'location_fixes': {
+        'month_by': 'recorded_at',
+        'dates': ['recorded_at'],
+        'columns': ['id', 'safety_session_id', 'user_id', 'recorded_at', 'latitude', 'longitude', 'accuracy'],
+    },
+    'notifications': {
+        'month_by': 'created_at',
+        'dates': ['created_at', 'sent_at'],
+        'columns': ['id', 'alert_id', 'user_id', 'channel', 'recipient', 'subject', 'status', 'attempts',
+                    'sent_at', 'last_error', 'created_at'],
+    },
+    'alerts': {
+        'month_by': 'created_at',
+        'dates': ['created_at', 'notified_at'],
+        'columns': ['id', 'user_id', 'alert_type', 'location', 'status', 'created_at', 'notified_at'],
+    },
+}
+
+_EXTENSIONS = {'parquet': '.parquet', 'jsonl': '.jsonl.gz'}
+
+
+class ArchiveError(Exception):
+    """Raised when archive files cannot be written or read"""
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        try:
+            import fastparquet  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+
+def resolve_format(fmt=None):
+    """'parquet' or 'jsonl'; 'auto' picks Parquet when pyarrow or fastparquet is installed"""
+    fmt = fmt or settings.ARCHIVE_FORMAT
+    if fmt == 'auto':
+        return 'parquet' if parquet_available() else 'jsonl'
+    if fmt == 'parquet' and not parquet_available():
+        raise ArchiveError('Parquet archives need `pip install pyarrow`')
+    if fmt not in _EXTENSIONS:
+        raise ArchiveError(f"Unknown archive format {fmt!r}")
+    return fmt
+
+
+def _frame(dataset, rows):
+    import pandas as pd
+
+    spec = DATASETS[dataset]
+    frame = pd.DataFrame.from_records(rows, columns=spec['columns'])
+    if 'stage_timings' in frame:
+        # Free-form dicts become JSON text so every partition has the same schema
+        frame['stage_timings'] = frame['stage_timings'].map(lambda value: json.dumps(value or {}))
+    for column in spec['dates']:
+        frame[column] = pd.to_datetime(frame[column], utc=True)
+    return frame
+
+
+def write_rows(dataset, rows, fmt, root=None):
+    """Write rows (dicts) of a dataset into monthly partitions; returns the files written.
+
+    Files are named after the id range they hold and replaced atomically, so
+    re-archiving rows after an interrupted run rewrites the same file rather
+    than adding a second copy.
+    """
+    if not rows:
+        return []
+    root = root or settings.ARCHIVE_DIR
+    frame = _frame(dataset, rows)
+    months = frame[DATASETS[dataset]['month_by']].dt.strftime('%Y-%m')
+
+    paths = []
+    for month, part in frame.groupby(months):
+        directory = os.path.join(root, dataset, f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{part['id'].min():010d}-{part['id'].max():010d}{_EXTENSIONS[fmt]}")
+        temp_path = f"{path}.tmp"
+        if fmt == 'parquet':
+            part.to_parquet(temp_path, index=False)
+        else:
+            part.to_json(temp_path, orient='records', lines=True, date_format='iso', date_unit='us', compression='gzip')
+        with open(temp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        paths.append(path)
+    return paths
+
+
+def _read_file(path):
+    import pandas as pd
+
+    if path.endswith('.parquet'):
+        if not parquet_available():
+            raise ArchiveError(f"Reading {path} needs `pip install pyarrow`")
+        return pd.read_parquet(path)
+    return pd.read_json(path, orient='records', lines=True, compression='gzip', convert_dates=False)
+
+
+def partitions(dataset, root=None):
+    """Months with archived rows for a dataset, oldest first"""
+    root = root or settings.ARCHIVE_DIR
+    return sorted(
+        os.path.basename(directory).split('=', 1)[1]
+        for directory in glob.glob(os.path.join(root, dataset, 'month=*'))
+    )
+
+
+def _utc(value):
+    import pandas as pd
+
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    return value.tz_convert('UTC') if value.tzinfo else value.tz_localize('UTC')
+
+
+def read_archive(dataset, since=None, until=None, user_id=None, root=None):
+    """Archived rows of a dataset as a DataFrame, oldest first.
+
+    `since` and `until` (datetimes) bound the partition column, and only the
+    monthly partitions overlapping them are opened.
+    """
+    import pandas as pd
+
+    if dataset not in DATASETS:
+        raise ArchiveError(f"Unknown archive dataset {dataset!r}")
+    spec = DATASETS[dataset]
+    root = root or settings.ARCHIVE_DIR
+    since, until = _utc(since), _utc(until)
+
+    frames = []
+    for month in partitions(dataset, root):
+        if (since is not None and month < since.strftime('%Y-%m')) or (until is not None and month > until.strftime('%Y-%m')):
+            continue
+        for path in sorted(glob.glob(os.path.join(root, dataset, f"month={month}", 'part-*'))):
+            if not path.endswith('.tmp'):
+                frames.append(_read_file(path))
+    if not frames:
+        return _frame(dataset, [])
+
+    frame = pd.concat(frames, ignore_index=True)
+    for column in spec['dates']:
+        frame[column] = pd.to_datetime(frame[column], utc=True)
+    # A row archived twice by an interrupted run appears in two parts
+    frame = frame.drop_duplicates('id', keep='last')
+
+    month_by = frame[spec['month_by']]
+    keep = pd.Series(True, index=frame.index)
+    if since is not None:
+        keep &= month_by >= since
+    if until is not None:
+        keep &= month_by < until
+    if user_id is not None:
+        keep &= frame['user_id'] == user_id
+    return frame[keep].sort_values(spec['month_by'], kind='stable').reset_index(drop=True)
@@ -0,0 +1,225 @@
+import io
+import struct
+
+import numpy as np
+
+# Container names returned by sniff_container()
+WAV = 'wav'
+WEBM = 'webm'
+OGG = 'ogg'
+PCM16 = 'pcm16'
+
+# Headerless uploads are assumed to be 16 kHz mono PCM16 unless told otherwise
+DEFAULT_PCM_RATE = 16000
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class AudioDecodeError(Exception):
+    """Raised when an uploaded clip cannot be decoded"""
+
+
+class DecodedAudio:
+    """PCM16 samples decoded from a clip, shaped (frames, channels)"""
+
+    __slots__ = ('samples', 'sample_rate', 'channels', 'container')
+
+    def __init__(self, samples, sample_rate, channels, container):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.container = container
+
+    @property
+    def duration(self):
+        """Clip length in seconds"""
+        return self.samples.shape[0] / float(self.sample_rate)
+
+    def mono(self):
+        """Return the samples as a 1-D int16 array, downmixing if needed"""
+        if self.channels == 1:
+            return self.samples.reshape(-1)
+        return self.samples.mean(axis=1).astype(np.int16)
+
+    def to_audio_data(self):
+        """Wrap the samples in a speech_recognition AudioData"""
+        import speech_recognition as sr
+        return sr.AudioData(self.mono().tobytes(), self.sample_rate, 2)
+
+
+class _MemoryReader(io.RawIOBase):
+    """Seekable read-only file object over a memoryview, without copying it"""
+
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def readinto(self, buffer):
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        size = len(chunk)
+        buffer[:size] = chunk
+        self._pos += size
+        return size
+
+
+def as_memoryview(data):
+    """Return a byte memoryview over bytes, bytearray, BytesIO or an uploaded file"""
+    if isinstance(data, memoryview):
+        return data.cast('B') if data.format != 'B' else data
+    if isinstance(data, (bytes, bytearray)):
+        return memoryview(data)
+    if isinstance(data, io.BytesIO):
+        return data.getbuffer()
+    if hasattr(data, 'read'):
+        return memoryview(data.read())
+    raise AudioDecodeError(f"Unsupported audio buffer type: {type(data).__name__}")
+
+
+def sniff_container(view):
+    """Detect the container format from the first bytes of a clip"""
+    head = bytes(view[:12])
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return WAV
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return WEBM
+    if head[:4] == b'OggS':
+        return OGG
+    return PCM16
+
+
+def _wav_to_int16(data, sample_width, format_tag):
+    """Convert raw WAV sample bytes to int16, without copying 16-bit PCM"""
+    if format_tag == _WAVE_FORMAT_IEEE_FLOAT:
+        dtype = '<f4' if sample_width == 4 else '<f8'
+        floats = np.frombuffer(data, dtype=dtype)
+        return (np.clip(floats, -1.0, 1.0) * 32767).astype(np.int16)
+    if sample_width == 2:
+        return np.frombuffer(data, dtype='<i2')
+    if sample_width == 1:
+        unsigned = np.frombuffer(data, dtype=np.uint8)
+        return ((unsigned.astype(np.int16) - 128) << 8).astype(np.int16)
+    if sample_width == 3:
+        triplets = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        # The top two bytes of a little-endian 24-bit sample are its int16 value
+        return triplets[:, 1:].copy().view('<i2').reshape(-1)
+    if sample_width == 4:
+        return (np.frombuffer(data, dtype='<i4') >> 16).astype(np.int16)
+    raise AudioDecodeError(f"Unsupported WAV sample width: {sample_width * 8} bits")
+
+
+def _decode_wav(view):
+    fmt = None
+    data = None
+    pos = 12
+    end = len(view)
+
+    while pos + 8 <= end:
+        chunk_id = bytes(view[pos:pos + 4])
+        (size,) = struct.unpack_from('<I', view, pos + 4)
+        body = pos + 8
+
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack_from('<HHIIHH', view, body)
+            if fmt[0] == _WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                # The real format tag is the first field of the SubFormat GUID
+                (subformat,) = struct.unpack_from('<H', view, body + 24)
+                fmt = (subformat,) + fmt[1:]
+        elif chunk_id == b'data':
+            # Streaming writers leave the size at 0 or 0xFFFFFFFF
+            if size in (0, 0xFFFFFFFF) or body + size > end:
+                size = end - body
+            data = view[body:body + size]
+            if fmt is not None:
+                break
+
+        pos = body + size + (size & 1)
+
+    if fmt is None or data is None:
+        raise AudioDecodeError("WAV file is missing its fmt or data chunk")
+
+    format_tag, channels, sample_rate, _, block_align, bits = fmt
+    if format_tag not in (_WAVE_FORMAT_PCM, _WAVE_FORMAT_IEEE_FLOAT):
+        raise AudioDecodeError(f"Unsupported WAV format tag: {format_tag:#06x}")
+    if channels < 1 or block_align < 1:
+        raise AudioDecodeError("WAV header has an invalid channel layout")
+
+    usable = len(data) - len(data) % block_align
+    samples = _wav_to_int16(data[:usable], (bits + 7) // 8, format_tag)
+    return DecodedAudio(samples.reshape(-1, channels), sample_rate, channels, WAV)
+
+
+def _decode_pcm16(view, sample_rate, channels):
+    frame_bytes = 2 * channels
+    usable = len(view) - len(view) % frame_bytes
+    samples = np.frombuffer(view[:usable], dtype='<i2').reshape(-1, channels)
+    return DecodedAudio(samples, sample_rate, channels, PCM16)
+
+
+def _decode_compressed(view, container):
+    """Decode WebM/Ogg (Opus or Vorbis) clips in memory with PyAV"""
+    try:
+        import av
+    except ImportError:
+        raise AudioDecodeError(f"Decoding {container} audio requires PyAV (pip install av)")
+
+    try:
+        with av.open(_MemoryReader(view), mode='r') as source:
+            stream = source.streams.audio[0]
+            channels = stream.codec_context.channels or 1
+            sample_rate = stream.codec_context.sample_rate
+            resampler = av.AudioResampler(format='s16', layout=stream.layout.name, rate=sample_rate)
+
+            chunks = []
+            for frame in source.decode(stream):
+                for packed in resampler.resample(frame):
+                    chunks.append(packed.to_ndarray().reshape(-1))
+            for packed in resampler.resample(None):
+                chunks.append(packed.to_ndarray().reshape(-1))
+    except (av.error.FFmpegError, IndexError) as e:
+        raise AudioDecodeError(f"Could not decode {container} audio: {e}")
+
+    if not chunks:
+        raise AudioDecodeError(f"No audio frames found in {container} clip")
+
+    samples = np.concatenate(chunks).reshape(-1, channels)
+    return DecodedAudio(samples, sample_rate, channels, container)
+
+
+def decode_audio(data, sample_rate=DEFAULT_PCM_RATE, channels=1):
+    """Decode a clip held in memory into PCM16 samples.
+
+    `data` may be bytes, a bytearray, a memoryview, a BytesIO or an uploaded
+    file. WAV and raw PCM16 are decoded without copying the sample bytes;
+    `sample_rate` and `channels` only apply to headerless PCM16.
+    """
+    view = as_memoryview(data)
+    if len(view) == 0:
+        raise AudioDecodeError("Audio clip is empty")
+
+    container = sniff_container(view)
+    if container == WAV:
+        return _decode_wav(view)
+    if container in (WEBM, OGG):
+        return _decode_compressed(view, container)
+    return _decode_pcm16(view, sample_rate, channels)
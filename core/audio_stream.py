@@ -0,0 +1,217 @@
+import threading
+import time
+
+import numpy as np
+
+from .audio_decoding import DecodedAudio, PCM16
+from .alerts import raise_voice_alert
+from .voice_detection import VoiceSpeechDetector, get_voice_gate
+
+# Streams carry 16 kHz mono PCM16, little endian
+STREAM_SAMPLE_RATE = 16000
+
+# Each detection looks at the last WINDOW_SECONDS, every HOP_SECONDS of new audio
+WINDOW_SECONDS = 3.0
+HOP_SECONDS = 1.0
+
+# Completed windows stay in the buffer this many hops after they end, so windows
+# whose detection was refused while recognition was busy are caught up on later
+BACKLOG_HOPS = 2
+
+# Streams with no frames for this long are dropped
+STREAM_IDLE_SECONDS = 60
+
+
+class StreamError(Exception):
+    """Raised for malformed streaming frames"""
+
+
+class AudioRingBuffer:
+    """Fixed-capacity ring buffer of PCM16 samples"""
+
+    def __init__(self, capacity):
+        self._buffer = np.zeros(capacity, dtype=np.int16)
+        self._capacity = capacity
+        self._write = 0
+        self.available = 0
+
+    def write(self, samples):
+        """Append samples, overwriting the oldest ones when full"""
+        n = len(samples)
+        if n >= self._capacity:
+            self._buffer[:] = samples[-self._capacity:]
+            self._write = 0
+            self.available = self._capacity
+            return
+
+        first = min(n, self._capacity - self._write)
+        self._buffer[self._write:self._write + first] = samples[:first]
+        self._buffer[:n - first] = samples[first:]
+        self._write = (self._write + n) % self._capacity
+        self.available = min(self._capacity, self.available + n)
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def read_latest(self, out, back=0):
+        """Copy the len(out) samples ending `back` samples before the newest into `out`, oldest first"""
+        n = len(out)
+        start = (self._write - back - n) % self._capacity
+        first = min(n, self._capacity - start)
+        out[:first] = self._buffer[start:start + first]
+        out[first:] = self._buffer[:n - first]
+        return out
+
+    def clear(self):
+        self.available = 0
+
+
+class AudioStream:
+    """Sliding-window emergency phrase detection over one safety session's audio.
+
+    Buffering and detection are separate steps: append() only copies frames
+    into the ring buffer and is cheap enough for the request path, while the
+    windows it completes are detected later, typically on the recognition
+    executor. Audio is therefore never lost when recognition is busy.
+    """
+
+    def __init__(self, user, session_id, detector=None,
+                 window_seconds=WINDOW_SECONDS, hop_seconds=HOP_SECONDS, backlog_hops=BACKLOG_HOPS):
+        self.user = user
+        self.session_id = session_id
+        self._detector = detector
+        self.window_length = int(window_seconds * STREAM_SAMPLE_RATE)
+        self.hop_length = int(hop_seconds * STREAM_SAMPLE_RATE)
+        self.ring = AudioRingBuffer(self.window_length + backlog_hops * self.hop_length)
+        self.samples_received = 0
+        self._since_last_window = 0
+        # Detection never looks before this sample, which moves on after every detection
+        self._start = 0
+        # End positions of completed windows that have not been detected yet
+        self._pending = []
+        self.location = ''
+        self.last_frame_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def detector(self):
+        # Built on first detection, off the request path
+        if self._detector is None:
+            self._detector = VoiceSpeechDetector(gate=get_voice_gate(self.user.id), user_id=self.user.id)
+        return self._detector
+
+    def _window_start(self, end):
+        return max(self._start, end - self.window_length)
+
+    def _detectable(self, end):
+        start = self._window_start(end)
+        return end - start >= self.hop_length and self.samples_received - start <= self.ring.capacity
+
+    def append(self, payload):
+        """Buffer PCM16 frames; returns how many completed windows await detection"""
+        if len(payload) % 2:
+            raise StreamError("PCM16 frames must contain an even number of bytes")
+        samples = np.frombuffer(payload, dtype='<i2')
+        self.last_frame_at = time.monotonic()
+
+        self.ring.write(samples)
+        first_end = self.samples_received + self.hop_length - self._since_last_window
+        self.samples_received += len(samples)
+        self._since_last_window = (self._since_last_window + len(samples)) % self.hop_length
+
+        # A large payload leaves only its last windows in the buffer; the rest are skipped
+        self._pending.extend(range(first_end, self.samples_received + 1, self.hop_length))
+        self._pending = [end for end in self._pending if self._detectable(end)]
+        return len(self._pending)
+
+    def take_windows(self):
+        """Copy out the windows awaiting detection, oldest first"""
+        windows = []
+        for end in self._pending:
+            window = np.empty(end - self._window_start(end), dtype=np.int16)
+            windows.append(self.ring.read_latest(window, self.samples_received - end))
+        self._pending = []
+        return windows
+
+    def detect(self, windows):
+        """Run detection over windows, oldest first, stopping at the first emergency"""
+        result = None
+        detected = 0
+        for window in windows:
+            detected += 1
+            result = self.detector.detect_in_audio(DecodedAudio(window.reshape(-1, 1), STREAM_SAMPLE_RATE, 1, PCM16))
+            if result['is_emergency']:
+                break
+
+        return {
+            'windows': detected,
+            'is_emergency': bool(result and result['is_emergency']),
+            'detected_text': result['text'] if result else '',
+        }
+
+    def clear(self):
+        """Start afresh after a detection, so overlapping windows do not fire again"""
+        self.ring.clear()
+        self._start = self.samples_received
+        self._pending = []
+
+    def feed(self, payload):
+        """Buffer frames and detect the windows they complete, in the calling thread"""
+        self.append(payload)
+        result = self.detect(self.take_windows())
+        if result['is_emergency']:
+            self.clear()
+        return result
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def _purge_idle_streams(now):
+    for session_id, stream in list(_streams.items()):
+        if now - stream.last_frame_at > STREAM_IDLE_SECONDS:
+            del _streams[session_id]
+
+
+def get_stream(user, session_id):
+    """Return the audio stream for a safety session, creating it if needed"""
+    with _streams_lock:
+        _purge_idle_streams(time.monotonic())
+        stream = _streams.get(session_id)
+        if stream is None or stream.user.id != user.id:
+            stream = AudioStream(user, session_id)
+            _streams[session_id] = stream
+        return stream
+
+
+def close_stream(session_id):
+    """Drop the buffered audio of a safety session"""
+    with _streams_lock:
+        _streams.pop(session_id, None)
+
+
+def buffer_frames(user, session_id, payload, location=''):
+    """Buffer streamed frames for a session; returns the stream and its count of windows awaiting detection"""
+    stream = get_stream(user, session_id)
+    with stream.lock:
+        if location:
+            stream.location = location
+        return stream, stream.append(payload)
+
+
+def detect_windows(user, stream):
+    """Detect a stream's pending windows and raise an alert on detection; runs on the recognition executor"""
+    with stream.lock:
+        windows = stream.take_windows()
+    result = stream.detect(windows)
+
+    result['alert_sent'] = False
+    if result['is_emergency']:
+        with stream.lock:
+            stream.clear()
+        print(f"Emergency phrase detected in stream: {result['detected_text']}")
+        alert = raise_voice_alert(user, result['detected_text'], stream.location)
+        result['alert_sent'] = alert is not None
+    return result
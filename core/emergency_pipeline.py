@@ -0,0 +1,147 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+from django.conf import settings
+from django.db import transaction
+
+from .alert_coalescing import coalesce_alert, session_alert_lock, NOTIFY_LOCATION, NOTIFY_POLICE_STATIONS
+from .alert_dispatcher import get_alert_dispatcher
+from .models import EmergencyAlert
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.EMERGENCY_PIPELINE_WORKERS,
+                thread_name_prefix='emergency-enrichment',
+            )
+        return _executor
+
+
+class EmergencyPipeline:
+    """Raise an emergency alert first and enrich it with location afterwards.
+
+    The alert is stored and its first notification queued before any network
+    lookup. Geolocation starts at the same moment on the enrichment pool,
+    followed by the police station lookup, each bounded by what is left of
+    the pipeline's time budget. Contacts get a follow-up as each enrichment
+    lands, and the duration of every stage is saved on the alert.
+    """
+
+    def __init__(self, user, session, detected_text, locate, find_police_stations, budget=None, grace=None):
+        self.user = user
+        self.session = session
+        self.detected_text = detected_text
+        self.locate = locate
+        self.find_police_stations = find_police_stations
+        self.budget = budget or settings.EMERGENCY_PIPELINE_BUDGET
+        self.grace = grace if grace is not None else settings.EMERGENCY_ENRICHMENT_GRACE
+        self.timings = {}
+        self.timed_out = []
+
+    def _elapsed_ms(self):
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+    def _remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def _await(self, stage, future, timeout):
+        """Result of an enrichment stage, or None if it fails or misses its deadline"""
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            self.timed_out.append(stage)
+            print(f"Emergency {stage} missed its {timeout:.1f}s deadline")
+        except Exception as e:
+            print(f"Emergency {stage} failed: {e}")
+        return None
+
+    def _timed(self, stage, func, *args):
+        """Run func on the enrichment pool, recording how long it took to finish"""
+        def run():
+            start = time.monotonic()
+            try:
+                return func(*args)
+            finally:
+                self.timings[f'{stage}_ms'] = round((time.monotonic() - start) * 1000, 1)
+        return _get_executor().submit(run)
+
+    def run(self):
+        """Returns the alert, or None when the detection merged into an open alert without notifying"""
+        self.started = time.monotonic()
+        self.deadline = self.started + self.budget
+        location_future = self._timed('geolocation', self.locate, self.budget)
+
+        with session_alert_lock(self.session), transaction.atomic():
+            alert, notify = coalesce_alert(
+                self.session,
+                f"Emergency phrase detected: '{self.detected_text}'. Locating...",
+            )
+            if notify is not None:
+                get_alert_dispatcher().dispatch(alert, self.user, notify)
+        self.timings['first_notification_ms'] = self._elapsed_ms()
+
+        if notify is None:
+            print(f"Detection merged into alert {alert.id} ({alert.detection_count} detections)")
+            location_future.cancel()
+            return None
+        print(f"Emergency alert {alert.id} queued after {self.timings['first_notification_ms']} ms")
+
+        try:
+            self._enrich(alert, location_future)
+        finally:
+            self.timings['total_ms'] = self._elapsed_ms()
+            if self.timed_out:
+                self.timings['timed_out'] = self.timed_out
+            EmergencyAlert.objects.filter(pk=alert.pk).update(stage_timings=self.timings)
+        return alert
+
+    def _enrich(self, alert, location_future):
+        location = self._await('geolocation', location_future, self._remaining())
+        # The hard-coded default location would only mislead contacts
+        if not location or location.get('source') == 'default' or not location.get('latitude') or not location.get('longitude'):
+            print("Location unavailable, contacts keep the first alert only")
+            return
+
+        lat, lon = location['latitude'], location['longitude']
+        stations_future = self._timed('police_lookup', self.find_police_stations, lat, lon)
+
+        description = (
+            f"Emergency phrase detected: '{self.detected_text}'. Location: {location.get('city', 'Unknown')}, "
+            f"{location.get('country', 'Unknown')}. Coordinates: {lat}, {lon}"
+        )
+
+        # Give the station lookup a moment so one update can carry both; it is usually a local index hit
+        wait([stations_future], timeout=min(self.grace, self._remaining()))
+        if stations_future.done():
+            stations = self._await('police_lookup', stations_future, 0)
+            self._update(alert, NOTIFY_LOCATION, location, stations, description=description, location=f"{lat},{lon}")
+        else:
+            self._update(alert, NOTIFY_LOCATION, location, None, description=description, location=f"{lat},{lon}")
+            stations = self._await('police_lookup', stations_future, self._remaining())
+            if stations:
+                self._update(alert, NOTIFY_POLICE_STATIONS, location, stations)
+
+        if stations:
+            print(f"Found {len(stations)} nearby police stations, nearest: {stations[0]['name']} ({stations[0]['distance']:.2f} km)")
+
+    def _update(self, alert, notify, location_data, stations, **fields):
+        """Store enrichment on the alert and queue the matching follow-up"""
+        with transaction.atomic():
+            if fields:
+                EmergencyAlert.objects.filter(pk=alert.pk).update(**fields)
+                for name, value in fields.items():
+                    setattr(alert, name, value)
+            get_alert_dispatcher().dispatch(alert, self.user, notify, location_data, stations)
+        self.timings[f'{notify}_update_ms'] = self._elapsed_ms()
+
+
+def run_emergency_pipeline(user, session, detected_text, locate, find_police_stations):
+    """Alert first, then enrich; see EmergencyPipeline"""
+    return EmergencyPipeline(user, session, detected_text, locate, find_police_stations).run()
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from .poll_state import bump_epoch
+
+# Event names pushed to dashboards
+EVENT_ALERT = 'alert'
+EVENT_MONITORING = 'monitoring'
+# Sent instead of events a slow client missed; it should refetch its state
+EVENT_RESYNC = 'resync'
+
+
+class Subscription:
+    """One connected client's queue, fed from any thread and drained on its event loop"""
+
+    def __init__(self, user_id, loop, size):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def _put(self, message):
+        if self.queue.full():
+            self.overflowed = True
+        else:
+            self.queue.put_nowait(message)
+
+    def put(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The client's event loop has already shut down
+            pass
+
+    async def next(self, timeout):
+        """The next event, a resync event after an overflow, or None after `timeout` seconds of quiet"""
+        if self.overflowed and self.queue.empty():
+            self.overflowed = False
+            return {'event': EVENT_RESYNC, 'data': {}}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    """Per-user pub/sub fan-out to the dashboards connected to this process.
+
+    Events published here are delivered to local subscribers directly and,
+    when a Redis URL is configured, relayed through a Redis channel so that
+    subscribers connected to other worker processes receive them too.
+    """
+
+    def __init__(self, queue_size, redis_url='', channel='sireshield-events'):
+        self.queue_size = queue_size
+        self.redis_url = redis_url
+        self.channel = channel
+        self._origin = uuid.uuid4().hex
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._stats = Counter()
+        self._redis = None
+        self._listener = None
+
+    def subscribe(self, user_id):
+        """Register a client on the running event loop"""
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+            self._stats['subscribed'] += 1
+            if self.redis_url and self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='event-relay', daemon=True)
+                self._listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event, data=None):
+        """Push an event to every dashboard of a user; safe to call from any thread"""
+        message = {'event': event, 'data': data or {}}
+        self._deliver(user_id, message)
+        if self.redis_url:
+            try:
+                self._client().publish(self.channel, json.dumps({'origin': self._origin, 'user_id': user_id, **message}))
+            except Exception as e:
+                with self._lock:
+                    self._stats['relay_errors'] += 1
+                print(f"Event relay publish failed: {e}")
+
+    def _deliver(self, user_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+            self._stats['published'] += 1
+            self._stats['delivered'] += len(subscribers)
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def _client(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=1, socket_connect_timeout=1)
+        return self._redis
+
+    def _listen(self):
+        """Relay events published by other processes to local subscribers, reconnecting on failure"""
+        import redis
+
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(self.redis_url, health_check_interval=30).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for raw in pubsub.listen():
+                    message = json.loads(raw['data'])
+                    if message.pop('origin', None) == self._origin:
+                        continue
+                    self._deliver(message.pop('user_id'), message)
+            except Exception as e:
+                with self._lock:
+                    self._stats['relay_errors'] += 1
+                print(f"Event relay connection lost: {e}")
+                time.sleep(1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._subscribers),
+                'subscribers': sum(len(subscribers) for subscribers in self._subscribers.values()),
+                'relay': 'redis' if self.redis_url else None,
+                **self._stats,
+            }
+
+
+def format_event(message):
+    """A message in text/event-stream framing"""
+    return f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_event_broker():
+    """Process-wide event broker configured from settings"""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = EventBroker(settings.EVENTS_QUEUE_SIZE, settings.EVENTS_REDIS_URL, settings.EVENTS_CHANNEL)
+        return _broker
+
+
+def publish_event(user_id, event, data=None):
+    """Push an event to a user's connected dashboards, in this and (with Redis) every other process"""
+    # Bumped first: a dashboard reacting to the event must not be told nothing changed
+    bump_epoch(user_id)
+    get_event_broker().publish(user_id, event, data)
@@ -0,0 +1,212 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Kilometres per degree of latitude
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180.0
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distance in km from one point to each of `lats`/`lons` (scalars or arrays)"""
+    lat = np.radians(lat)
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lats - lat
+    dlon = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def degrees_for_km(km, lat):
+    """Latitude and longitude spans, in degrees, of `km` around latitude `lat`"""
+    dlat = km / KM_PER_DEGREE
+    dlon = km / (KM_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+    return dlat, min(dlon, 360.0)
+
+
+def bbox_mask(lat, lon, lats, lons, km):
+    """Cheap prefilter: which of `lats`/`lons` fall in the box enclosing a `km` circle around the point"""
+    dlat, dlon = degrees_for_km(km, lat)
+    lats = np.asarray(lats)
+    # Longitude difference wrapped into [-180, 180) so the box can cross the antimeridian
+    lon_offset = np.abs((np.asarray(lons, dtype=np.float64) - lon + 180.0) % 360.0 - 180.0)
+    return (np.abs(lats - lat) <= dlat) & (lon_offset <= dlon)
+
+
+def _smallest(distances, k):
+    """Positions of the k smallest distances along the last axis, nearest first"""
+    k = min(k, distances.shape[-1])
+    if k < distances.shape[-1]:
+        # Partial selection is O(n); only the k survivors get sorted
+        part = np.argpartition(distances, k - 1, axis=-1)[..., :k]
+    else:
+        part = np.broadcast_to(np.arange(k), distances.shape[:-1] + (k,))
+    order = np.argsort(np.take_along_axis(distances, part, axis=-1), axis=-1)
+    return np.take_along_axis(part, order, axis=-1)
+
+
+def nearest_k(lat, lon, lats, lons, k=5, radius_km=None):
+    """Indexes and distances (km) of the k targets nearest to one point, nearest first.
+
+    With `radius_km`, targets outside a bounding box of that radius are dropped
+    before any trigonometry, and the result holds only targets within it.
+    """
+    lats = np.asarray(lats)
+    lons = np.asarray(lons)
+    candidates = np.arange(len(lats))
+    if radius_km is not None:
+        candidates = np.flatnonzero(bbox_mask(lat, lon, lats, lons, radius_km))
+        lats, lons = lats[candidates], lons[candidates]
+    if not len(candidates) or k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    distances = haversine_km(lat, lon, lats, lons)
+    if radius_km is not None:
+        within = np.flatnonzero(distances <= radius_km)
+        candidates, distances = candidates[within], distances[within]
+        if not len(candidates):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+    best = _smallest(distances, k)
+    return candidates[best], distances[best]
+
+
+def haversine_matrix(query_lats, query_lons, lats, lons):
+    """Distances (km) from every query point (rows) to every target (columns)"""
+    query_lats = np.radians(np.asarray(query_lats, dtype=np.float64))[:, None]
+    query_lons = np.radians(np.asarray(query_lons, dtype=np.float64))[:, None]
+    lats = np.radians(np.asarray(lats, dtype=np.float64))[None, :]
+    lons = np.radians(np.asarray(lons, dtype=np.float64))[None, :]
+    a = (np.sin((lats - query_lats) / 2) ** 2
+         + np.cos(query_lats) * np.cos(lats) * np.sin((lons - query_lons) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def nearest_k_batch(query_lats, query_lons, lats, lons, k=5, max_cells=4_000_000):
+    """k nearest targets for many query points at once.
+
+    Returns (indexes, distances), both shaped (queries, k), nearest first.
+    Queries are processed in chunks so the distance matrix stays under
+    `max_cells` entries (32 MB at the default).
+    """
+    query_lats = np.asarray(query_lats, dtype=np.float64)
+    query_lons = np.asarray(query_lons, dtype=np.float64)
+    k = min(k, len(lats))
+    indexes = np.empty((len(query_lats), k), dtype=np.int64)
+    distances = np.empty((len(query_lats), k))
+    chunk = max(1, max_cells // max(len(lats), 1))
+    for start in range(0, len(query_lats), chunk):
+        rows = slice(start, start + chunk)
+        matrix = haversine_matrix(query_lats[rows], query_lons[rows], lats, lons)
+        best = _smallest(matrix, k)
+        indexes[rows] = best
+        distances[rows] = np.take_along_axis(matrix, best, axis=-1)
+    return indexes, distances
+
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(lat, lon, precision=6):
+    """Geohash cell of a point; nearby points share a prefix"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, five per character
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(cell):
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = _GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def _project_m(lats, lons):
+    """Local equirectangular projection of a track to metres, accurate over a city-sized area"""
+    lats = np.asarray(lats, dtype=np.float64)
+    # Unwrapped so a track crossing the antimeridian stays continuous
+    lons = np.degrees(np.unwrap(np.radians(np.asarray(lons, dtype=np.float64))))
+    metres_per_degree = KM_PER_DEGREE * 1000.0
+    x = lons * metres_per_degree * np.cos(np.radians(lats.mean()))
+    return x, lats * metres_per_degree
+
+
+def track_ranks(lats, lons):
+    """Douglas-Peucker significance of every point of a track, in metres.
+
+    Douglas-Peucker with tolerance t keeps exactly the points ranked above t,
+    so ranking once serves every resolution; the endpoints rank infinite.
+    Each pass splits every open segment at its farthest point at once, so
+    the number of passes is the depth of the split tree rather than the
+    number of points.
+    """
+    n = len(lats)
+    ranks = np.zeros(n)
+    if not n:
+        return ranks
+    x, y = _project_m(lats, lons)
+    ranks[[0, -1]] = np.inf
+    splits = np.array([0, n - 1])
+    candidates = np.arange(1, n - 1)
+    while len(candidates):
+        segment = np.searchsorted(splits, candidates) - 1
+        left, right = splits[segment], splits[segment + 1]
+        dx, dy = x[right] - x[left], y[right] - y[left]
+        px, py = x[candidates] - x[left], y[candidates] - y[left]
+        length = np.hypot(dx, dy)
+        # Perpendicular distance to the segment's chord, or to its start when both ends coincide
+        distances = np.where(
+            length > 0,
+            np.abs(dx * py - dy * px) / np.where(length > 0, length, 1.0),
+            np.hypot(px, py),
+        )
+
+        # Farthest candidate of each segment: segments are contiguous runs of candidates
+        starts = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1]])
+        farthest = np.lexsort((-distances, segment))[starts]
+        chosen = candidates[farthest]
+        # A split never outranks the split that created its segment
+        ranks[chosen] = np.minimum(distances[farthest], np.minimum(ranks[left[farthest]], ranks[right[farthest]]))
+
+        splits = np.sort(np.concatenate([splits, chosen]))
+        candidates = np.delete(candidates, farthest)
+    return ranks
+
+
+def simplify_track(lats, lons, tolerance_m=0.0, max_points=None, ranks=None):
+    """Indexes of the points Douglas-Peucker keeps at `tolerance_m`, in track order.
+
+    With `max_points`, the tolerance is raised as far as needed to keep at
+    most that many (never fewer than the two endpoints).
+    """
+    if ranks is None:
+        ranks = track_ranks(lats, lons)
+    keep = np.flatnonzero(ranks > tolerance_m)
+    if max_points is not None and len(keep) > max(max_points, 2):
+        keep = np.sort(_smallest(-ranks, max(max_points, 2)))
+    return keep
@@ -0,0 +1,261 @@
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+# Database layout (little endian): header, then 8-byte aligned arrays
+#   IPv4 ranges      start, end uint32[n4], location uint32[n4]
+#   IPv6 ranges      start and end as (high, low) uint64 pairs [n6], location uint32[n6]
+#   locations        lat, lon float32[n_locations], metadata offsets uint32[n_locations + 1]
+#   blob             UTF-8 JSON objects with city, region, country, postal and timezone
+# Ranges are sorted by start and do not overlap, so a lookup is one binary search.
+GEOIP_MAGIC = b'SSGEOIP1'
+GEOIP_VERSION = 1
+_HEADER = struct.Struct('<8sIIII')
+_LOCATION_FIELDS = ('city', 'region', 'country', 'postal', 'timezone')
+_LOW_MASK = (1 << 64) - 1
+
+
+class GeoIPError(Exception):
+    """Raised when a GeoIP database file is missing or malformed"""
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def client_ip(request):
+    """The requesting client's IP address, or None if it is not a valid one.
+
+    X-Forwarded-For is honoured only for the GEOIP_TRUSTED_PROXIES proxies in
+    front of the app: the address they appended is taken, anything further
+    left came from the client and could be forged.
+    """
+    ip = request.META.get('REMOTE_ADDR', '')
+    proxies = settings.GEOIP_TRUSTED_PROXIES
+    forwarded = [entry.strip() for entry in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if entry.strip()]
+    if proxies and forwarded:
+        ip = forwarded[-min(proxies, len(forwarded))]
+    try:
+        return str(ipaddress.ip_address(ip))
+    except ValueError:
+        return None
+
+
+def routable_ip(ip):
+    """ipaddress object for a public address, or None for private or invalid ones"""
+    try:
+        address = ipaddress.ip_address(str(ip).strip())
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    if address.is_private or address.is_loopback or address.is_link_local or address.is_multicast:
+        return None
+    return address
+
+
+def write_geoip_database(path, ranges):
+    """Write (start_ip, end_ip, location) ranges to a database file.
+
+    `location` is a dict with latitude, longitude and any of city, region,
+    country, postal and timezone; identical locations are stored once.
+    The file is replaced atomically.
+    """
+    locations = {}
+    v4, v6 = [], []
+    for start, end, location in ranges:
+        start, end = ipaddress.ip_address(start), ipaddress.ip_address(end)
+        key = (float(location['latitude']), float(location['longitude'])) + tuple(
+            location.get(field) or '' for field in _LOCATION_FIELDS
+        )
+        index = locations.setdefault(key, len(locations))
+        (v4 if start.version == 4 else v6).append((int(start), int(end), index))
+    v4.sort()
+    v6.sort()
+
+    keys = list(locations)
+    blobs = [json.dumps(dict(zip(_LOCATION_FIELDS, key[2:]))).encode() for key in keys]
+    meta = np.zeros(len(blobs) + 1, dtype=np.uint32)
+    np.cumsum([len(blob) for blob in blobs], out=meta[1:])
+
+    def column(rows, i, dtype, shift=0):
+        return np.array([(row[i] >> shift) & _LOW_MASK for row in rows], dtype=dtype)
+
+    sections = [
+        column(v4, 0, '<u4'), column(v4, 1, '<u4'), column(v4, 2, '<u4'),
+        column(v6, 0, '<u8', 64), column(v6, 0, '<u8'), column(v6, 1, '<u8', 64), column(v6, 1, '<u8'),
+        column(v6, 2, '<u4'),
+        np.array([key[0] for key in keys], dtype='<f4'), np.array([key[1] for key in keys], dtype='<f4'),
+        meta.astype('<u4'),
+    ]
+
+    temp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(GEOIP_MAGIC, GEOIP_VERSION, len(v4), len(v6), len(keys)))
+        for section in sections:
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(section.tobytes())
+        f.write(b''.join(blobs))
+    os.replace(temp_path, path)
+
+
+class GeoIPDatabase:
+    """Memory-mapped IP range to location database, shared by worker processes via the page cache"""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise GeoIPError(f"Cannot open GeoIP database {path}: {e}")
+        self.mtime = os.stat(path).st_mtime
+
+        if len(self._map) < _HEADER.size:
+            raise GeoIPError(f"GeoIP database {path} is truncated")
+        magic, version, n4, n6, n_locations = _HEADER.unpack_from(self._map)
+        if magic != GEOIP_MAGIC or version != GEOIP_VERSION:
+            raise GeoIPError(f"{path} is not a version {GEOIP_VERSION} GeoIP database")
+        self.ranges = n4 + n6
+        self.locations = n_locations
+
+        offset = _HEADER.size
+        arrays = []
+        layout = [('<u4', n4)] * 3 + [('<u8', n6)] * 4 + [('<u4', n6), ('<f4', n_locations), ('<f4', n_locations),
+                                                          ('<u4', n_locations + 1)]
+        for dtype, count in layout:
+            offset = _align(offset)
+            arrays.append(np.frombuffer(self._map, dtype=dtype, count=count, offset=offset))
+            offset += arrays[-1].nbytes
+        (self.v4_start, self.v4_end, self.v4_location,
+         self.v6_start_high, self.v6_start_low, self.v6_end_high, self.v6_end_low, self.v6_location,
+         self.lats, self.lons, self.meta) = arrays
+        self._blob_offset = offset
+
+    def _find(self, address):
+        """Location index of the range holding address, or None"""
+        value = int(address)
+        if address.version == 4:
+            i = int(np.searchsorted(self.v4_start, value, side='right')) - 1
+            if i >= 0 and value <= self.v4_end[i]:
+                return int(self.v4_location[i])
+            return None
+
+        high, low = value >> 64, value & _LOW_MASK
+        # Last range starting at or before (high, low): search the high words, then the low
+        # words among ranges sharing this high word
+        first = int(np.searchsorted(self.v6_start_high, high, side='left'))
+        last = int(np.searchsorted(self.v6_start_high, high, side='right'))
+        i = first + int(np.searchsorted(self.v6_start_low[first:last], low, side='right')) - 1
+        if i >= 0 and (int(self.v6_end_high[i]), int(self.v6_end_low[i])) >= (high, low):
+            return int(self.v6_location[i])
+        return None
+
+    def lookup(self, ip):
+        """Location dict for an IP address, or None if it is private or not covered"""
+        address = routable_ip(ip)
+        if address is None:
+            return None
+        index = self._find(address)
+        if index is None:
+            return None
+        start = self._blob_offset + int(self.meta[index])
+        end = self._blob_offset + int(self.meta[index + 1])
+        details = json.loads(self._map[start:end])
+        return {
+            'latitude': float(self.lats[index]),
+            'longitude': float(self.lons[index]),
+            'city': details['city'] or 'Unknown',
+            'country': details['country'] or 'Unknown',
+            'region': details['region'] or 'Unknown',
+            'postal': details['postal'],
+            'timezone': details['timezone'] or 'Unknown',
+            'accuracy': 'IP-based (city level)',
+            'source': 'geoip',
+        }
+
+
+class GeoIPLocator:
+    """GeoIP lookups with an LRU of recent results, reloading the database when it is replaced"""
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._database = None
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def database(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            if self._database is None or self._database.mtime != mtime:
+                # The replaced mapping is not closed: a lookup may still be reading it, and it
+                # is unmapped once the last reference to it goes
+                try:
+                    self._database = GeoIPDatabase(self.path)
+                except GeoIPError as e:
+                    print(f"GeoIP database unavailable: {e}")
+                    self._database = None
+                self._recent.clear()
+            return self._database
+
+    def locate(self, ip):
+        """Location dict for a client IP from the local database, or None"""
+        database = self.database()
+        if database is None or not ip:
+            return None
+        with self._lock:
+            if ip in self._recent:
+                self._recent.move_to_end(ip)
+                self._stats['hits'] += 1
+                return self._recent[ip]
+
+        location = database.lookup(ip)
+        with self._lock:
+            self._stats['misses'] += 1
+            self._recent[ip] = location
+            while len(self._recent) > self.max_entries:
+                self._recent.popitem(last=False)
+        return location
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'database': self._database.path if self._database else None,
+                'ranges': self._database.ranges if self._database else 0,
+                'cached': len(self._recent),
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+                'hit_rate': self._stats['hits'] / lookups if lookups else 0.0,
+            }
+
+
+_locator = None
+_locator_lock = threading.Lock()
+
+
+def get_geoip_locator():
+    """Process-wide GeoIP locator configured from settings"""
+    global _locator
+    with _locator_lock:
+        if _locator is None:
+            _locator = GeoIPLocator(settings.GEOIP_DATABASE_PATH, settings.GEOIP_CACHE_SIZE)
+        return _locator
+
+
+def locate_ip(ip):
+    """Offline location of an IP address, or None; never touches the network"""
+    return get_geoip_locator().locate(ip)
@@ -0,0 +1,289 @@
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+# Methods that are safe to send again after a connection error or 5xx
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class HttpClientError(Exception):
+    """Raised when an outbound request is refused or fails"""
+
+
+class CircuitOpenError(HttpClientError):
+    """Raised without contacting the host while its circuit breaker is open"""
+
+
+class UpstreamError(HttpClientError):
+    """Raised when a host keeps answering with server errors"""
+
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class CircuitBreaker:
+    """Fails fast once a host has failed `threshold` times in a row.
+
+    After `reset_timeout` seconds one trial request is let through; its
+    success closes the breaker again, its failure re-opens it.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Token bucket limiting retries to a fraction of a host's traffic.
+
+    Every request deposits `ratio` tokens and every retry spends one, so a
+    failing host sees at most about `ratio` extra requests per request
+    instead of a retry storm.
+    """
+
+    def __init__(self, ratio, max_tokens):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class HostMetrics:
+    """Request counts and recent latencies for one host"""
+
+    def __init__(self, window=500):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, milliseconds, error):
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(milliseconds)
+            if error:
+                self.errors += 1
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': self.errors / self.requests if self.requests else 0.0,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': latencies[-1] if latencies else 0.0,
+        }
+
+
+class _Host:
+    def __init__(self, client):
+        self.breaker = CircuitBreaker(client.breaker_threshold, client.breaker_reset)
+        self.budget = RetryBudget(client.retry_budget_ratio, client.retry_budget_max)
+        self.metrics = HostMetrics()
+
+
+class HttpClient:
+    """Shared outbound HTTP client for geolocation, Overpass and alert gateways.
+
+    One requests.Session keeps pooled keep-alive connections per host. Every
+    request gets a (connect, read) timeout, so a hung upstream cannot pin the
+    calling thread; a caller's `timeout` only ever tightens the defaults.
+    Idempotent requests are retried on connection errors and 5xx within the
+    host's retry budget, and each host has a circuit breaker.
+    """
+
+    def __init__(self, pool_size, connect_timeout, read_timeout, retries,
+                 retry_budget_ratio, retry_budget_max, breaker_threshold, breaker_reset):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.retry_budget_ratio = retry_budget_ratio
+        self.retry_budget_max = retry_budget_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self._session = None
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # requests is imported on first use, keeping it off the boot path
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def _host(self, url):
+        netloc = urlsplit(url).netloc
+        with self._lock:
+            if netloc not in self._hosts:
+                self._hosts[netloc] = _Host(self)
+            return netloc, self._hosts[netloc]
+
+    def request(self, method, url, timeout=None, retries=None, **kwargs):
+        """Send a request; raises CircuitOpenError, UpstreamError or a requests exception"""
+        import requests
+
+        method = method.upper()
+        name, host = self._host(url)
+        if retries is None:
+            retries = self.retries if method in IDEMPOTENT_METHODS else 0
+        deadline = time.monotonic() + (timeout or self.connect_timeout + self.read_timeout)
+        host.budget.deposit()
+
+        attempt = 0
+        while True:
+            if not host.breaker.allow():
+                host.metrics.count('rejected')
+                raise CircuitOpenError(f"Circuit open for {name}, not sending {method} {url}")
+
+            remaining = deadline - time.monotonic()
+            start = time.monotonic()
+            error = None
+            response = None
+            try:
+                if remaining <= 0:
+                    raise requests.Timeout(f"Deadline exceeded before {method} {url}")
+                response = self.session.request(
+                    method, url,
+                    timeout=(min(self.connect_timeout, remaining), min(self.read_timeout, remaining)),
+                    **kwargs,
+                )
+                if response.status_code >= 500:
+                    error = UpstreamError(f"{name} returned {response.status_code}", response)
+            except requests.RequestException as e:
+                error = e
+            except BaseException:
+                # Anything else still settles the breaker, or a HALF_OPEN trial would block the host for good
+                host.metrics.record((time.monotonic() - start) * 1000, True)
+                host.breaker.record_failure()
+                raise
+
+            host.metrics.record((time.monotonic() - start) * 1000, error)
+            if error is None:
+                host.breaker.record_success()
+                return response
+            host.breaker.record_failure()
+
+            attempt += 1
+            backoff = min(0.1 * 2 ** attempt, 2.0) * random.uniform(0.5, 1.0)
+            if attempt > retries or time.monotonic() + backoff >= deadline or not host.budget.withdraw():
+                raise error
+            host.metrics.count('retries')
+            time.sleep(backoff)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Per-host latency, error and breaker metrics"""
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {
+            name: dict(host.metrics.snapshot(), circuit=host.breaker.state, retry_tokens=round(host.budget.tokens, 2))
+            for name, host in hosts.items()
+        }
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Process-wide HTTP client configured from settings"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(
+                pool_size=settings.HTTP_POOL_SIZE,
+                connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+                read_timeout=settings.HTTP_READ_TIMEOUT,
+                retries=settings.HTTP_RETRIES,
+                retry_budget_ratio=settings.HTTP_RETRY_BUDGET_RATIO,
+                retry_budget_max=settings.HTTP_RETRY_BUDGET_MAX,
+                breaker_threshold=settings.HTTP_BREAKER_THRESHOLD,
+                breaker_reset=settings.HTTP_BREAKER_RESET,
+            )
+        return _client
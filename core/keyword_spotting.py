@@ -0,0 +1,195 @@
+import os
+import threading
+
+import numpy as np
+
+from .audio_decoding import decode_audio, AudioDecodeError
+
+# Feature extraction parameters (25 ms windows every 10 ms)
+FRAME_SECONDS = 0.025
+HOP_SECONDS = 0.010
+N_MELS = 40
+N_MFCC = 13
+
+# Extra cost for a template frame that re-uses the previous clip frame
+STALL_PENALTY = 0.1
+
+_matrix_cache = {}
+_matrix_lock = threading.Lock()
+
+
+def _mel_filterbank(sample_rate, n_fft, n_mels):
+    """Triangular mel filterbank of shape (n_fft // 2 + 1, n_mels)"""
+    key = ('mel', sample_rate, n_fft, n_mels)
+    with _matrix_lock:
+        if key in _matrix_cache:
+            return _matrix_cache[key]
+
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+    mel_points = np.linspace(hz_to_mel(0.0), hz_to_mel(sample_rate / 2.0), n_mels + 2)
+    bins = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    edges = mel_to_hz(mel_points)
+
+    lower = edges[:-2][None, :]
+    center = edges[1:-1][None, :]
+    upper = edges[2:][None, :]
+    freqs = bins[:, None]
+    rising = (freqs - lower) / (center - lower)
+    falling = (upper - freqs) / (upper - center)
+    filterbank = np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+    with _matrix_lock:
+        _matrix_cache[key] = filterbank
+    return filterbank
+
+
+def _dct_matrix(n_mels, n_mfcc):
+    """Orthonormal DCT-II basis of shape (n_mels, n_mfcc)"""
+    key = ('dct', n_mels, n_mfcc)
+    with _matrix_lock:
+        if key in _matrix_cache:
+            return _matrix_cache[key]
+
+    n = np.arange(n_mels)[:, None]
+    k = np.arange(n_mfcc)[None, :]
+    basis = np.cos(np.pi / n_mels * (n + 0.5) * k) * np.sqrt(2.0 / n_mels)
+    basis[:, 0] /= np.sqrt(2.0)
+    basis = basis.astype(np.float32)
+
+    with _matrix_lock:
+        _matrix_cache[key] = basis
+    return basis
+
+
+def log_mel_spectrogram(samples, sample_rate, n_mels=N_MELS):
+    """Log-mel energies of shape (frames, n_mels) for 1-D PCM16 samples"""
+    frame_length = int(round(FRAME_SECONDS * sample_rate))
+    hop_length = int(round(HOP_SECONDS * sample_rate))
+    n_fft = 1 << (frame_length - 1).bit_length()
+
+    signal = np.asarray(samples, dtype=np.float32) / 32768.0
+    if signal.size < frame_length:
+        signal = np.pad(signal, (0, frame_length - signal.size))
+
+    # Pre-emphasis, then frame the signal as a strided view
+    emphasized = np.empty_like(signal)
+    emphasized[0] = signal[0]
+    np.subtract(signal[1:], 0.97 * signal[:-1], out=emphasized[1:])
+    frames = np.lib.stride_tricks.sliding_window_view(emphasized, frame_length)[::hop_length]
+
+    window = np.hamming(frame_length).astype(np.float32)
+    power = np.abs(np.fft.rfft(frames * window, n=n_fft)) ** 2
+    mel = power @ _mel_filterbank(sample_rate, n_fft, n_mels)
+    return np.log(mel + 1e-10, dtype=np.float32)
+
+
+def mfcc(samples, sample_rate, n_mfcc=N_MFCC):
+    """Mean-normalized MFCCs (without c0) of shape (frames, n_mfcc - 1)"""
+    log_mel = log_mel_spectrogram(samples, sample_rate)
+    coefficients = log_mel @ _dct_matrix(log_mel.shape[1], n_mfcc)
+    coefficients = coefficients[:, 1:]
+    coefficients -= coefficients.mean(axis=0)
+    return coefficients
+
+
+def _unit_rows(features):
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.maximum(norms, 1e-8)
+
+
+def subsequence_dtw(template, features):
+    """Best match of `template` anywhere inside `features`.
+
+    Both inputs are unit-normalized feature matrices. Each template frame may
+    advance the clip by 0, 1 or 2 frames, so every row of the cost table only
+    depends on the previous one and is computed as one vectorized step.
+    Returns (average cosine distance along the path, end frame).
+    """
+    cost = 1.0 - template @ features.T
+    n_frames = features.shape[0]
+
+    accumulated = cost[0].copy()
+    candidates = np.empty((3, n_frames), dtype=cost.dtype)
+    for row in cost[1:]:
+        candidates[0] = accumulated + STALL_PENALTY
+        candidates[1, 0] = np.inf
+        candidates[1, 1:] = accumulated[:-1]
+        candidates[2, :2] = np.inf
+        candidates[2, 2:] = accumulated[:-2]
+        accumulated = row + candidates.min(axis=0)
+
+    end = int(np.argmin(accumulated))
+    return float(accumulated[end]) / template.shape[0], end
+
+
+class KeywordSpotter:
+    """Template-matching keyword spotter over MFCC features"""
+
+    def __init__(self, templates=None, threshold=0.35):
+        # Maps phrase -> list of unit-normalized MFCC templates
+        self.templates = {}
+        self.threshold = threshold
+        for phrase, samples, sample_rate in templates or []:
+            self.add_template(phrase, samples, sample_rate)
+
+    @property
+    def is_ready(self):
+        return bool(self.templates)
+
+    def add_template(self, phrase, samples, sample_rate):
+        """Enroll one recording of `phrase`"""
+        features = _unit_rows(mfcc(samples, sample_rate))
+        self.templates.setdefault(phrase.lower(), []).append(features)
+
+    @classmethod
+    def from_directory(cls, path, threshold=0.35):
+        """Load templates from `<path>/<phrase_with_underscores>/*.wav`"""
+        from .voice_detection import normalize_audio
+
+        spotter = cls(threshold=threshold)
+        if not path or not os.path.isdir(path):
+            return spotter
+
+        for phrase_dir in sorted(os.listdir(path)):
+            full_dir = os.path.join(path, phrase_dir)
+            if not os.path.isdir(full_dir):
+                continue
+            phrase = phrase_dir.replace('_', ' ')
+            for filename in sorted(os.listdir(full_dir)):
+                if not filename.lower().endswith('.wav'):
+                    continue
+                try:
+                    with open(os.path.join(full_dir, filename), 'rb') as f:
+                        audio = decode_audio(f.read())
+                    # Templates are compared frame by frame with 16 kHz mono clips
+                    audio = normalize_audio(audio)
+                    spotter.add_template(phrase, audio.mono(), audio.sample_rate)
+                except (OSError, AudioDecodeError) as e:
+                    print(f"Skipping keyword template {filename}: {e}")
+        return spotter
+
+    def spot(self, samples, sample_rate):
+        """Return the best matching phrase and its score, or None"""
+        if not self.templates:
+            return None
+
+        features = _unit_rows(mfcc(samples, sample_rate))
+        best = None
+        for phrase, templates in self.templates.items():
+            for template in templates:
+                if features.shape[0] < template.shape[0] // 2:
+                    continue
+                distance, end = subsequence_dtw(template, features)
+                if best is None or distance < best['distance']:
+                    best = {'phrase': phrase, 'distance': distance, 'end_frame': end}
+
+        if best is None or best['distance'] > self.threshold:
+            return None
+        # Map distance 0 -> 1.0 and distance == threshold -> 0.5
+        best['confidence'] = 1.0 - 0.5 * best['distance'] / self.threshold
+        return best
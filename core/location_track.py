@@ -0,0 +1,93 @@
+import math
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .geo import simplify_track
+from .models import LocationFix, SafetySession
+
+
+class TrackError(ValueError):
+    """Raised when a batch of location fixes cannot be accepted"""
+
+
+def _timestamp(value):
+    """Aware datetime from epoch milliseconds (the browser's position.timestamp) or an ISO string"""
+    if value is None:
+        return timezone.now()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value / 1000.0, tz=dt_timezone.utc)
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        raise ValueError(f"Invalid timestamp {value!r}")
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+
+
+def _fix(session, item):
+    """LocationFix for one {lat, lon, accuracy, timestamp} item, or None if it is unusable"""
+    try:
+        lat = float(item.get('lat', item.get('latitude')))
+        lon = float(item.get('lon', item.get('longitude')))
+        accuracy = item.get('accuracy')
+        accuracy = float(accuracy) if accuracy is not None else None
+        recorded_at = _timestamp(item.get('timestamp'))
+    except (AttributeError, TypeError, ValueError, OverflowError, OSError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (accuracy is not None and not accuracy >= 0):
+        return None
+    if accuracy is not None and math.isinf(accuracy):
+        accuracy = None
+    return LocationFix(safety_session=session, recorded_at=recorded_at, latitude=lat, longitude=lon, accuracy=accuracy)
+
+
+def record_fixes(session, items):
+    """Store a batch of fixes for a safety session with one bulk insert.
+
+    Unusable fixes are skipped rather than failing the batch, and fixes
+    already stored for the same instant (a retried batch) are dropped. The
+    session's location follows its newest fix. Returns (stored, duplicates, rejected).
+    """
+    if not isinstance(items, list):
+        raise TrackError('fixes must be a list')
+    if len(items) > settings.LOCATION_TRACK_MAX_BATCH:
+        raise TrackError(f"At most {settings.LOCATION_TRACK_MAX_BATCH} fixes per request")
+
+    valid = [fix for fix in (_fix(session, item) for item in items) if fix is not None]
+    fixes = list({fix.recorded_at: fix for fix in reversed(valid)}.values())[::-1]
+    if fixes:
+        stored = set(session.location_fixes.filter(
+            recorded_at__range=(min(fix.recorded_at for fix in fixes), max(fix.recorded_at for fix in fixes)),
+        ).values_list('recorded_at', flat=True))
+        fixes = [fix for fix in fixes if fix.recorded_at not in stored]
+    if fixes:
+        # A concurrent retry of the same batch is left to the unique constraint
+        LocationFix.objects.bulk_create(fixes, batch_size=settings.LOCATION_TRACK_MAX_BATCH, ignore_conflicts=True)
+        newest = max(fixes, key=lambda fix: fix.recorded_at)
+        # A batch buffered offline can arrive after fresher ones
+        if not session.location_fixes.filter(recorded_at__gt=newest.recorded_at).exists():
+            SafetySession.objects.filter(pk=session.pk).update(location=f"{newest.latitude},{newest.longitude}")
+    return len(fixes), len(valid) - len(fixes), len(items) - len(valid)
+
+
+def session_track(session, tolerance_m=None, max_points=None):
+    """A session's track simplified with Douglas-Peucker, ready for a map polyline"""
+    tolerance_m = settings.LOCATION_TRACK_TOLERANCE_M if tolerance_m is None else tolerance_m
+    max_points = min(max_points or settings.LOCATION_TRACK_MAX_POINTS, settings.LOCATION_TRACK_MAX_POINTS)
+
+    rows = list(session.location_fixes.order_by('recorded_at', 'id').values_list('latitude', 'longitude', 'recorded_at'))
+    lats = np.array([row[0] for row in rows], dtype=np.float64)
+    lons = np.array([row[1] for row in rows], dtype=np.float64)
+    keep = simplify_track(lats, lons, tolerance_m, max_points)
+    return {
+        'session_id': session.id,
+        'is_active': session.is_active,
+        'tolerance_m': tolerance_m,
+        'total_points': len(rows),
+        'returned_points': len(keep),
+        # Six decimals is about 10 cm, well below GPS accuracy
+        'points': [[round(float(lats[i]), 6), round(float(lons[i]), 6)] for i in keep],
+        'timestamps': [rows[i][2].isoformat() for i in keep],
+    }
@@ -0,0 +1,110 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+
+class MailConnectionPool:
+    """Warm email backend connections shared by the delivery workers.
+
+    Each connection stays open between alerts, so a fan-out costs one TCP and
+    TLS handshake per pooled connection instead of one per message. An idle
+    SMTP connection is checked with NOOP before reuse and reopened if the
+    server has dropped it; connections idle longer than `max_idle` are closed.
+    """
+
+    def __init__(self, size, keepalive, max_idle):
+        self.size = size
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'reused': 0, 'reconnected': 0}
+
+    def _open(self):
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        with self._lock:
+            self._stats['opened'] += 1
+        return connection
+
+    def _is_alive(self, connection):
+        """NOOP the SMTP server; backends without a socket are always alive"""
+        smtp = getattr(connection, 'connection', None)
+        if smtp is None:
+            return not hasattr(connection, 'connection')
+        try:
+            return smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _checkout(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, idle_since = self._idle.pop()
+            idle = now - idle_since
+            if idle > self.max_idle:
+                connection.close()
+                continue
+            if idle > self.keepalive and not self._is_alive(connection):
+                connection.close()
+                with self._lock:
+                    self._stats['reconnected'] += 1
+                continue
+            with self._lock:
+                self._stats['reused'] += 1
+            return connection
+        return self._open()
+
+    def _checkin(self, connection):
+        if getattr(connection, 'connection', True) is None:
+            # The backend lost its socket; let the next checkout open a fresh one
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow an open connection; it is discarded rather than returned if sending failed"""
+        connection = self._checkout()
+        try:
+            yield connection
+        except Exception:
+            connection.close()
+            raise
+        self._checkin(connection)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            connection.close()
+
+    def stats(self):
+        with self._lock:
+            return {'idle': len(self._idle), 'size': self.size, **self._stats}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_mail_pool():
+    """Process-wide pool of email connections sized from settings"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = MailConnectionPool(
+                size=settings.EMAIL_POOL_SIZE,
+                keepalive=settings.EMAIL_POOL_KEEPALIVE,
+                max_idle=settings.EMAIL_POOL_MAX_IDLE,
+            )
+        return _pool
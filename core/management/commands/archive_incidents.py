@@ -0,0 +1,110 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.archive import ArchiveError, DATASETS, resolve_format, write_rows
+from core.models import Alert, EmergencyAlert, LocationFix, NotificationOutbox, SafetySession
+
+
+class Command(BaseCommand):
+    help = 'Move old safety sessions and alerts out of the live tables into monthly archive files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None,
+                            help='Archive rows older than this many days (default: ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Sessions or alerts read and archived per chunk')
+        parser.add_argument('--delete-batch', type=int, default=500,
+                            help='Rows deleted per statement, so each lock is held briefly')
+        parser.add_argument('--format', choices=('auto', 'parquet', 'jsonl'), default=None,
+                            help='Archive file format (default: ARCHIVE_FORMAT)')
+        parser.add_argument('--output', default=None, help='Archive directory (default: ARCHIVE_DIR)')
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be archived and stop')
+
+    def handle(self, *args, **options):
+        days = options['older_than'] if options['older_than'] is not None else settings.ARCHIVE_AFTER_DAYS
+        if days < 1:
+            raise CommandError('--older-than must be at least 1 day')
+        try:
+            self.format = resolve_format(options['format'])
+        except ArchiveError as e:
+            raise CommandError(str(e))
+        self.root = options['output'] or settings.ARCHIVE_DIR
+        self.chunk_size = options['chunk_size']
+        self.delete_batch = options['delete_batch']
+        cutoff = timezone.now() - timedelta(days=days)
+
+        # Ended sessions go with everything hanging off them; active ones are never touched
+        sessions = SafetySession.objects.filter(is_active=False).filter(
+            Q(end_time__lt=cutoff) | Q(end_time__isnull=True, start_time__lt=cutoff)
+        )
+        alerts = Alert.objects.filter(created_at__lt=cutoff).exclude(status='active')
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"Would archive {sessions.count()} safety sessions "
+                f"({EmergencyAlert.objects.filter(safety_session__in=sessions).count()} emergency alerts, "
+                f"{LocationFix.objects.filter(safety_session__in=sessions).count()} location fixes) "
+                f"and {alerts.count()} alerts older than {cutoff:%Y-%m-%d}"
+            )
+            return
+
+        start = time.perf_counter()
+        self.counts = dict.fromkeys(DATASETS, 0)
+        self.files = set()
+        for chunk in self._chunks(sessions):
+            self._archive_sessions(chunk)
+        for chunk in self._chunks(alerts):
+            self._archive(chunk, 'alerts', chunk.values(*DATASETS['alerts']['columns']))
+            self._delete(chunk)
+
+        summary = ', '.join(f"{count} {dataset.replace('_', ' ')}" for dataset, count in self.counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {summary} older than {cutoff:%Y-%m-%d} as {self.format} "
+            f"({len(self.files)} files under {self.root}) in {time.perf_counter() - start:.1f}s"
+        ))
+
+    def _chunks(self, queryset):
+        """Keyset pagination: each chunk is the next id range, re-queried after the last was deleted"""
+        last_id = 0
+        while True:
+            ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:self.chunk_size])
+            if not ids:
+                return
+            yield queryset.filter(id__gt=last_id, id__lte=ids[-1])
+            last_id = ids[-1]
+
+    def _archive(self, chunk, dataset, values):
+        rows = list(values.iterator(chunk_size=self.chunk_size))
+        self.files.update(write_rows(dataset, rows, self.format, self.root))
+        self.counts[dataset] += len(rows)
+
+    def _archive_sessions(self, sessions):
+        alerts = EmergencyAlert.objects.filter(safety_session__in=sessions)
+        fixes = LocationFix.objects.filter(safety_session__in=sessions)
+        notifications = NotificationOutbox.objects.filter(alert__safety_session__in=sessions)
+
+        # Everything is on disk before anything is deleted
+        self._archive(sessions, 'sessions', sessions.values(*DATASETS['sessions']['columns']))
+        self._archive(alerts, 'emergency_alerts', alerts.annotate(user_id=F('safety_session__user_id')).values(
+            *DATASETS['emergency_alerts']['columns']))
+        self._archive(fixes, 'location_fixes', fixes.annotate(user_id=F('safety_session__user_id')).values(
+            *DATASETS['location_fixes']['columns']))
+        self._archive(notifications, 'notifications', notifications.annotate(
+            user_id=F('alert__safety_session__user_id')).values(*DATASETS['notifications']['columns']))
+
+        # Children first, so no cascade ever deletes more than one batch at a time
+        for queryset in (notifications, fixes, alerts, sessions):
+            self._delete(queryset)
+
+    def _delete(self, queryset):
+        """Delete in short batches, each its own statement and transaction"""
+        while True:
+            ids = list(queryset.values_list('id', flat=True)[:self.delete_batch])
+            if not ids:
+                return
+            queryset.model.objects.filter(id__in=ids).delete()
@@ -0,0 +1,140 @@
+import io
+import os
+import statistics
+import tempfile
+import time
+import wave
+
+import numpy as np
+import speech_recognition as sr
+from django.core.management.base import BaseCommand
+
+from core.audio_decoding import decode_audio, AudioDecodeError
+from core.voice_detection import normalize_audio, TARGET_SAMPLE_RATE
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-clip audio decoding latency (tempfile round-trip vs in-memory) and normalization'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clips', type=int, default=200, help='Number of clips to decode')
+        parser.add_argument('--duration', type=float, default=5.0, help='Clip length in seconds')
+        parser.add_argument('--rate', type=int, default=16000, help='Clip sample rate')
+        parser.add_argument('--source-rate', type=int, default=48000,
+                            help='Sample rate of the browser-style stereo clips used for the normalization benchmark')
+
+    def handle(self, *args, **options):
+        clips = options['clips']
+        wav_clip = self._synthesize_wav(options['duration'], options['rate'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Decoding {clips} x {options['duration']}s WAV clips ({len(wav_clip)} bytes each)"
+        ))
+
+        legacy = self._time(self._decode_with_tempfile, wav_clip, clips)
+        in_memory = self._time(self._decode_in_memory, wav_clip, clips)
+        self._report('tempfile + sr.AudioFile', legacy)
+        self._report('decode_audio (in-memory)', in_memory)
+        self.stdout.write(f"  Speedup: {statistics.median(legacy) / statistics.median(in_memory):.1f}x")
+
+        self._benchmark_normalization(options['duration'], options['source_rate'], clips)
+
+        webm_clip = self._encode_webm(wav_clip)
+        if webm_clip is None:
+            self.stdout.write(self.style.WARNING('PyAV not installed, skipping WebM/Opus benchmark'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"\nDecoding {clips} WebM/Opus clips ({len(webm_clip)} bytes each)"))
+        try:
+            self._decode_with_tempfile(webm_clip)
+        except Exception as e:
+            self.stdout.write(f"  tempfile + sr.AudioFile: fails ({type(e).__name__})")
+        self._report('decode_audio (in-memory)', self._time(self._decode_in_memory, webm_clip, clips))
+
+    def _benchmark_normalization(self, duration, rate, clips):
+        """Cost and savings of normalizing browser-style stereo clips to 16 kHz mono"""
+        source = decode_audio(self._synthesize_wav(duration, rate, channels=2))
+        normalized = normalize_audio(source)
+        before = source.samples.nbytes
+        after = normalized.samples.nbytes
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nNormalizing {clips} x {duration}s {rate} Hz stereo clips to {TARGET_SAMPLE_RATE} Hz mono"
+        ))
+        self._report('normalize_audio', self._time(normalize_audio, source, clips))
+        self.stdout.write(
+            f"  PCM per clip: {before} -> {after} bytes ({before - after} bytes saved, {after / before:.0%} of original)"
+        )
+
+        # What a recognizer gets handed for the clip, before and after normalization
+        raw = self._time(lambda audio: audio.to_audio_data().get_wav_data(), source, clips)
+        compact = self._time(lambda audio: audio.to_audio_data().get_wav_data(), normalized, clips)
+        self._report('recognizer payload, unnormalized', raw)
+        self._report('recognizer payload, normalized', compact)
+        self.stdout.write(
+            f"  Recognizer payload: {len(source.to_audio_data().get_wav_data())} -> "
+            f"{len(normalized.to_audio_data().get_wav_data())} bytes, "
+            f"{statistics.median(raw) - statistics.median(compact):.3f} ms saved per clip"
+        )
+
+    def _synthesize_wav(self, duration, rate, channels=1):
+        t = np.arange(int(duration * rate)) / rate
+        signal = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * np.random.default_rng(0).standard_normal(t.size)
+        samples = np.repeat((signal * 32767).astype(np.int16)[:, None], channels, axis=1)
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            wav.writeframes(samples.tobytes())
+        return buffer.getvalue()
+
+    def _encode_webm(self, wav_clip):
+        try:
+            import av
+        except ImportError:
+            return None
+
+        decoded = decode_audio(wav_clip)
+        output = io.BytesIO()
+        with av.open(output, mode='w', format='webm') as container:
+            stream = container.add_stream('libopus', rate=48000)
+            stream.layout = 'mono'
+            frame = av.AudioFrame.from_ndarray(decoded.samples.reshape(1, -1), format='s16', layout='mono')
+            frame.sample_rate = decoded.sample_rate
+            for packet in stream.encode(frame):
+                container.mux(packet)
+            for packet in stream.encode(None):
+                container.mux(packet)
+        return output.getvalue()
+
+    def _decode_with_tempfile(self, clip):
+        """The previous VoiceSpeechDetector path"""
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
+            temp_file.write(clip)
+            temp_file_path = temp_file.name
+        try:
+            with sr.AudioFile(temp_file_path) as source:
+                return sr.Recognizer().record(source)
+        finally:
+            os.unlink(temp_file_path)
+
+    def _decode_in_memory(self, clip):
+        return decode_audio(clip).to_audio_data()
+
+    def _time(self, decode, clip, clips):
+        timings = []
+        for _ in range(clips):
+            start = time.perf_counter()
+            try:
+                decode(clip)
+            except AudioDecodeError as e:
+                raise SystemExit(f"Decoding failed: {e}")
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def _report(self, label, timings):
+        self.stdout.write(
+            f"  {label}: median {statistics.median(timings):.3f} ms, "
+            f"mean {statistics.mean(timings):.3f} ms, max {max(timings):.3f} ms per clip"
+        )
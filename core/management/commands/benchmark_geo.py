@@ -0,0 +1,78 @@
+import math
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from core.geo import haversine_km, nearest_k, nearest_k_batch
+
+
+class Command(BaseCommand):
+    help = 'Benchmark nearest-station selection: per-element haversine + sort vs vectorized top-k'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000,100000,1000000',
+                            help='Comma-separated target counts')
+        parser.add_argument('--k', type=int, default=5, help='Stations to select')
+        parser.add_argument('--radius', type=float, default=5.0, help='Search radius in km for the bbox prefilter')
+        parser.add_argument('--queries', type=int, default=256, help='Query points for the batch benchmark')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+        # Query around Delhi; targets scattered over a ~200 km square like a city-region extract
+        lat, lon = 28.6139, 77.2090
+
+        self.stdout.write(self.style.SUCCESS(f"Selecting the {k} nearest targets (median ms per query)"))
+        self.stdout.write(f"  {'targets':>9}  {'loop+sort':>10}  {'vectorized':>10}  {'argpartition':>12}  {'+bbox':>8}  {'speedup':>8}")
+        for size in (int(value) for value in options['sizes'].split(',')):
+            lats = rng.uniform(lat - 1, lat + 1, size)
+            lons = rng.uniform(lon - 1, lon + 1, size)
+
+            # The per-element loop gets fewer repetitions at large sizes; it is seconds per call
+            runs = max(1, min(20, 200_000 // size))
+            loop = self._time(lambda: self._loop_and_sort(lat, lon, lats.tolist(), lons.tolist(), k), runs)
+            vectorized = self._time(lambda: np.argsort(haversine_km(lat, lon, lats, lons))[:k], 20)
+            partition = self._time(lambda: nearest_k(lat, lon, lats, lons, k), 20)
+            bbox = self._time(lambda: nearest_k(lat, lon, lats, lons, k, radius_km=options['radius']), 20)
+
+            expected = sorted(self._loop_and_sort(lat, lon, lats.tolist(), lons.tolist(), k))
+            if not np.allclose(expected, np.sort(nearest_k(lat, lon, lats, lons, k)[1])):
+                self.stdout.write(self.style.ERROR(f"  {size}: top-k does not match the reference"))
+            self.stdout.write(
+                f"  {size:>9}  {loop:>10.3f}  {vectorized:>10.3f}  {partition:>12.3f}  {bbox:>8.3f}  {loop / min(partition, bbox):>7.0f}x"
+            )
+
+        queries = options['queries']
+        self.stdout.write(self.style.SUCCESS(f"\nBatch: {queries} query points, total ms"))
+        for size in (1000, 10000):
+            lats = rng.uniform(lat - 1, lat + 1, size)
+            lons = rng.uniform(lon - 1, lon + 1, size)
+            query_lats = rng.uniform(lat - 1, lat + 1, queries)
+            query_lons = rng.uniform(lon - 1, lon + 1, queries)
+            one_by_one = self._time(lambda: [nearest_k(a, b, lats, lons, k) for a, b in zip(query_lats, query_lons)], 5)
+            batch = self._time(lambda: nearest_k_batch(query_lats, query_lons, lats, lons, k), 5)
+            self.stdout.write(
+                f"  {size:>9} targets: nearest_k per query {one_by_one:8.2f}, "
+                f"nearest_k_batch {batch:8.2f} ({one_by_one / batch:.1f}x)"
+            )
+
+    def _loop_and_sort(self, lat, lon, lats, lons, k):
+        """The previous approach: haversine one station at a time, then a full sort"""
+        distances = []
+        for target_lat, target_lon in zip(lats, lons):
+            lat1, lon1, lat2, lon2 = map(math.radians, [lat, lon, target_lat, target_lon])
+            a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+            distances.append(6371 * 2 * math.asin(math.sqrt(a)))
+        distances.sort()
+        return distances[:k]
+
+    def _time(self, func, runs):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
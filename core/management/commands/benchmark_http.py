@@ -0,0 +1,143 @@
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from core.http_client import HttpClient, CircuitOpenError
+
+
+class Command(BaseCommand):
+    help = 'Exercise the outbound HTTP client against a local stand-in server: pooling, timeouts and circuit breaking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Requests per scenario')
+        parser.add_argument('--handshake-ms', type=float, default=20.0,
+                            help='Simulated connection setup cost (TCP + TLS) added by the server')
+
+    def handle(self, *args, **options):
+        import requests
+
+        server = _StandInServer(options['handshake_ms'] / 1000.0)
+        base = server.start()
+        count = options['requests']
+        try:
+            self.stdout.write(self.style.SUCCESS(f"Stand-in upstream at {base}, {count} requests per scenario"))
+
+            server.reset()
+            unpooled = self._time(lambda: requests.get(f"{base}/ok", timeout=5), count)
+            self.stdout.write(
+                f"  requests.get per call:   median {unpooled:6.2f} ms, {server.connections} connections"
+            )
+
+            client = self._client()
+            server.reset()
+            pooled = self._time(lambda: client.get(f"{base}/ok"), count)
+            self.stdout.write(
+                f"  pooled HttpClient:       median {pooled:6.2f} ms, {server.connections} connections "
+                f"({unpooled / pooled:.1f}x)"
+            )
+
+            # A hung upstream is cut off by the read timeout instead of pinning the thread
+            start = time.perf_counter()
+            try:
+                client.get(f"{base}/hang", timeout=0.5, retries=0)
+            except Exception as e:
+                self.stdout.write(
+                    f"  hung upstream:           gave up after {(time.perf_counter() - start) * 1000:6.0f} ms "
+                    f"({type(e).__name__})"
+                )
+
+            # A failing upstream opens the breaker, after which calls fail fast
+            client = self._client()
+            server.reset()
+            outcomes = []
+            for _ in range(count):
+                start = time.perf_counter()
+                try:
+                    client.get(f"{base}/error")
+                    outcome = 'ok'
+                except CircuitOpenError:
+                    outcome = 'rejected'
+                except Exception:
+                    outcome = 'failed'
+                outcomes.append((outcome, (time.perf_counter() - start) * 1000))
+            rejected = [ms for outcome, ms in outcomes if outcome == 'rejected']
+            self.stdout.write(
+                f"  failing upstream:        {server.requests} requests reached it for {count} calls, "
+                f"{len(rejected)} rejected locally in median {statistics.median(rejected or [0]):.3f} ms"
+            )
+
+            self.stdout.write(self.style.SUCCESS('\nPer-host metrics'))
+            self.stdout.write(json.dumps(client.stats(), indent=2))
+        finally:
+            server.stop()
+
+    def _client(self):
+        return HttpClient(
+            pool_size=4, connect_timeout=1, read_timeout=2, retries=2,
+            retry_budget_ratio=0.2, retry_budget_max=10, breaker_threshold=5, breaker_reset=30,
+        )
+
+    def _time(self, func, runs):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+
+class _StandInServer:
+    """Local HTTP server with /ok, /hang and /error endpoints, counting connections"""
+
+    def __init__(self, handshake_seconds):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Send headers and body in one segment; unbuffered writes stall on delayed ACKs
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stand_in.lock:
+                    stand_in.connections += 1
+                time.sleep(handshake_seconds)
+
+            def do_GET(self):
+                with stand_in.lock:
+                    stand_in.requests += 1
+                if self.path == '/hang':
+                    time.sleep(5)
+                status = 500 if self.path == '/error' else 200
+                body = b'{"elements": []}'
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.reset()
+
+    def reset(self):
+        self.connections = 0
+        self.requests = 0
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
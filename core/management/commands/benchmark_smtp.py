@@ -0,0 +1,119 @@
+import asyncio
+import socket
+import statistics
+import time
+
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from core.mail_pool import MailConnectionPool
+
+
+class Command(BaseCommand):
+    help = 'Benchmark emergency email fan-out against a local SMTP server (requires aiosmtpd)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alerts', type=int, default=20, help='Number of alerts to fan out')
+        parser.add_argument('--contacts', type=int, default=5, help='Contacts notified per alert')
+        parser.add_argument('--handshake-ms', type=float, default=50.0,
+                            help='Simulated connection setup cost (TCP + TLS) added by the server')
+
+    def handle(self, *args, **options):
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError:
+            self.stdout.write(self.style.WARNING('aiosmtpd not installed, run `pip install aiosmtpd` to benchmark SMTP'))
+            return
+
+        handler = _CountingHandler(options['handshake_ms'] / 1000.0)
+        port = self._free_port()
+        controller = Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        try:
+            smtp_settings = {
+                'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+                'EMAIL_HOST': '127.0.0.1',
+                'EMAIL_PORT': port,
+                'EMAIL_USE_TLS': False,
+                'EMAIL_HOST_USER': '',
+                'EMAIL_HOST_PASSWORD': '',
+                'DEFAULT_FROM_EMAIL': 'alerts@sirenshield.local',
+            }
+            with override_settings(**smtp_settings):
+                self._run(handler, options['alerts'], options['contacts'])
+        finally:
+            controller.stop()
+
+    def _free_port(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            return probe.getsockname()[1]
+
+    def _run(self, handler, alerts, contacts):
+        self.stdout.write(self.style.SUCCESS(
+            f"Fanning out {alerts} alerts to {contacts} contacts each ({alerts * contacts} emails)"
+        ))
+        pool = MailConnectionPool(size=1, keepalive=30, max_idle=300)
+        strategies = [
+            ('send_mail per contact', self._send_mail_per_contact),
+            ('one connection per alert', self._connection_per_alert),
+            ('pooled warm connection', lambda recipients: self._pooled(pool, recipients)),
+        ]
+        baseline = None
+        for label, fan_out in strategies:
+            handler.reset()
+            timings = []
+            for alert in range(alerts):
+                recipients = [f"contact{alert}-{i}@example.com" for i in range(contacts)]
+                start = time.perf_counter()
+                fan_out(recipients)
+                timings.append((time.perf_counter() - start) * 1000)
+            median = statistics.median(timings)
+            baseline = baseline or median
+            self.stdout.write(
+                f"  {label}: median {median:.1f} ms per alert, {handler.connections} connections, "
+                f"{handler.messages} messages ({baseline / median:.1f}x)"
+            )
+        pool.close_all()
+
+    def _message(self, recipient, connection=None):
+        return EmailMessage('EMERGENCY ALERT - SirenShield', 'Benchmark message', None, [recipient], connection=connection)
+
+    def _send_mail_per_contact(self, recipients):
+        """The previous behaviour: a fresh connection and handshake per contact"""
+        for recipient in recipients:
+            send_mail('EMERGENCY ALERT - SirenShield', 'Benchmark message', None, [recipient], fail_silently=False)
+
+    def _connection_per_alert(self, recipients):
+        with get_connection(fail_silently=False) as connection:
+            for recipient in recipients:
+                connection.send_messages([self._message(recipient, connection)])
+
+    def _pooled(self, pool, recipients):
+        with pool.connection() as connection:
+            for recipient in recipients:
+                connection.send_messages([self._message(recipient, connection)])
+
+
+class _CountingHandler:
+    """aiosmtpd handler that accepts everything, counting connections and messages"""
+
+    def __init__(self, handshake_seconds):
+        self.handshake_seconds = handshake_seconds
+        self.reset()
+
+    def reset(self):
+        self.connections = 0
+        self.messages = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        # EHLO happens once per connection, standing in for the TCP + TLS setup
+        self.connections += 1
+        await asyncio.sleep(self.handshake_seconds)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return '250 Message accepted for delivery'
@@ -0,0 +1,87 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Run in a fresh interpreter so nothing is already imported
+BOOT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+urls = time.perf_counter()
+from django.core.handlers.wsgi import WSGIHandler
+WSGIHandler()
+handler = time.perf_counter()
+heavy = [name for name in ('speech_recognition', 'pyaudio', 'requests', 'av') if name in sys.modules]
+print(json.dumps({
+    'django.setup()': setup - start,
+    'URLconf': urls - setup,
+    'request handler': handler - urls,
+    'total': handler - start,
+    'heavy_modules_loaded': heavy,
+}))
+"""
+
+# Modules whose import we want to keep off the boot path
+HEAVY_MODULES = ('speech_recognition', 'pyaudio', 'requests', 'av')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark process boot time and per-module import cost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Number of cold boots to time')
+        parser.add_argument('--top', type=int, default=15, help='Number of slowest imports to list')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'sireshield.settings'))
+        cwd = str(settings.BASE_DIR)
+
+        phases = []
+        for _ in range(options['runs']):
+            result = subprocess.run([sys.executable, '-c', BOOT_SCRIPT], env=env, cwd=cwd,
+                                    capture_output=True, text=True)
+            if result.returncode != 0:
+                self.stdout.write(self.style.ERROR(f"Boot failed:\n{result.stderr}"))
+                return
+            phases.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+        self.stdout.write(self.style.SUCCESS(f"Cold boot over {options['runs']} runs (median)"))
+        for phase in ('django.setup()', 'URLconf', 'request handler', 'total'):
+            self.stdout.write(f"  {phase:<18} {statistics.median(run[phase] for run in phases) * 1000:8.1f} ms")
+
+        loaded = phases[-1]['heavy_modules_loaded']
+        if loaded:
+            self.stdout.write(self.style.WARNING(f"  Loaded at boot: {', '.join(loaded)}"))
+        else:
+            self.stdout.write(f"  Not loaded at boot: {', '.join(HEAVY_MODULES)}")
+
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT], env=env, cwd=cwd,
+                                capture_output=True, text=True)
+        imports = self._parse_importtime(result.stderr)
+        self.stdout.write(self.style.SUCCESS(f"\nSlowest imports (cumulative, {len(imports)} modules)"))
+        for module, (self_us, cumulative_us) in sorted(imports.items(), key=lambda item: -item[1][1])[:options['top']]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {module}")
+
+        project = {module: times for module, times in imports.items() if module.split('.')[0] in ('core', 'sireshield')}
+        self.stdout.write(self.style.SUCCESS('\nProject modules'))
+        for module, (self_us, cumulative_us) in sorted(project.items(), key=lambda item: -item[1][1]):
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {module}")
+
+    def _parse_importtime(self, output):
+        """Map module name to (self, cumulative) microseconds from -X importtime output"""
+        imports = {}
+        for line in output.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, module = line[len('import time:'):].split('|')
+            imports[module.strip()] = (int(self_us), int(cumulative_us))
+        return imports
@@ -0,0 +1,116 @@
+import csv
+import gzip
+import ipaddress
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.geoip import write_geoip_database, GeoIPDatabase
+
+FORMATS = ('dbip', 'ip2location', 'geolite2', 'csv')
+
+
+class Command(BaseCommand):
+    help = 'Build the offline GeoIP database from a city-level IP range CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file, optionally gzipped')
+        parser.add_argument('--format', choices=FORMATS, default='dbip',
+                            help='dbip: DB-IP city lite; ip2location: IP2Location LITE DB5; '
+                                 'geolite2: GeoLite2-City-Blocks CSV (with --locations); '
+                                 'csv: header with start,end or network, latitude, longitude, city, region, country')
+        parser.add_argument('--locations', default=None, help='GeoLite2-City-Locations CSV for --format geolite2')
+        parser.add_argument('--output', default=None, help='Database file to write (default: GEOIP_DATABASE_PATH)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        output = options['output'] or settings.GEOIP_DATABASE_PATH
+
+        start = time.perf_counter()
+        reader = getattr(self, f"_read_{options['format']}")
+        if options['format'] == 'geolite2':
+            if not options['locations']:
+                raise CommandError('--format geolite2 needs --locations GeoLite2-City-Locations-en.csv')
+            ranges = list(reader(path, options['locations']))
+        else:
+            ranges = list(reader(path))
+        if not ranges:
+            raise CommandError(f"No IP ranges with coordinates found in {path}")
+
+        write_geoip_database(output, ranges)
+        database = GeoIPDatabase(output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {database.ranges} IP ranges ({database.locations} distinct locations, "
+            f"{os.path.getsize(output) / 1024 / 1024:.1f} MiB) to {output} in {time.perf_counter() - start:.1f}s"
+        ))
+
+    def _open(self, path):
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8', newline='')
+        return open(path, encoding='utf-8', newline='')
+
+    def _location(self, latitude, longitude, **details):
+        try:
+            return dict(details, latitude=float(latitude), longitude=float(longitude))
+        except (TypeError, ValueError):
+            return None
+
+    def _read_dbip(self, path):
+        """ip_start, ip_end, continent, country, stateprov, city, latitude, longitude"""
+        with self._open(path) as f:
+            for row in csv.reader(f):
+                location = self._location(row[6], row[7], country=row[3], region=row[4], city=row[5])
+                if location:
+                    yield row[0], row[1], location
+
+    def _read_ip2location(self, path):
+        """ip_from, ip_to (integers), country_code, country_name, region, city, latitude, longitude"""
+        with self._open(path) as f:
+            for row in csv.reader(f):
+                location = self._location(row[6], row[7], country=row[3], region=row[4], city=row[5])
+                if not location or row[2] == '-':
+                    continue
+                start, end = ipaddress.ip_address(int(row[0])), ipaddress.ip_address(int(row[1]))
+                # The IPv6 edition stores IPv4 as ::ffff:a.b.c.d
+                if start.version == 6 and start.ipv4_mapped and end.ipv4_mapped:
+                    start, end = start.ipv4_mapped, end.ipv4_mapped
+                yield start, end, location
+
+    def _read_geolite2(self, path, locations_path):
+        """network, geoname_id, ..., postal_code, latitude, longitude joined with the locations file"""
+        places = {}
+        with self._open(locations_path) as f:
+            for row in csv.DictReader(f):
+                places[row['geoname_id']] = {
+                    'city': row.get('city_name', ''),
+                    'region': row.get('subdivision_1_name', ''),
+                    'country': row.get('country_name', ''),
+                    'timezone': row.get('time_zone', ''),
+                }
+        with self._open(path) as f:
+            for row in csv.DictReader(f):
+                place = places.get(row['geoname_id']) or places.get(row.get('registered_country_geoname_id'), {})
+                location = self._location(row['latitude'], row['longitude'], postal=row.get('postal_code', ''), **place)
+                if location:
+                    network = ipaddress.ip_network(row['network'])
+                    yield network[0], network[-1], location
+
+    def _read_csv(self, path):
+        """Header row naming start,end or network, latitude, longitude and optional details"""
+        with self._open(path) as f:
+            for row in csv.DictReader(f):
+                location = self._location(
+                    row.get('latitude'), row.get('longitude'),
+                    **{field: row.get(field, '') for field in ('city', 'region', 'country', 'postal', 'timezone')}
+                )
+                if not location:
+                    continue
+                if row.get('network'):
+                    network = ipaddress.ip_network(row['network'], strict=False)
+                    yield network[0], network[-1], location
+                else:
+                    yield row['start'], row['end'], location
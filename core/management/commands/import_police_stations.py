@@ -0,0 +1,128 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.police_stations import write_index, PoliceStationIndex
+
+
+class Command(BaseCommand):
+    help = 'Build the offline police station index from an OSM (.osm.pbf) or GeoJSON extract'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='.osm.pbf / .osm extract (requires osmium), GeoJSON, or Overpass JSON file')
+        parser.add_argument('--output', default=None, help='Index file to write (default: POLICE_INDEX_PATH)')
+        parser.add_argument('--bbox', default=None,
+                            help='Region the extract covers as min_lat,min_lon,max_lat,max_lon '
+                                 '(default: bounding box of the imported stations)')
+        parser.add_argument('--cell-degrees', type=float, default=None,
+                            help='Grid cell size in degrees (default: POLICE_INDEX_CELL_DEGREES)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        output = options['output'] or settings.POLICE_INDEX_PATH
+        cell_degrees = options['cell_degrees'] or settings.POLICE_INDEX_CELL_DEGREES
+
+        bbox = None
+        if options['bbox']:
+            try:
+                bbox = tuple(float(value) for value in options['bbox'].split(','))
+            except ValueError:
+                bbox = ()
+            if len(bbox) != 4:
+                raise CommandError('--bbox must be min_lat,min_lon,max_lat,max_lon')
+
+        start = time.perf_counter()
+        if path.endswith(('.pbf', '.osm', '.osm.bz2', '.osm.gz')):
+            stations = self._read_osm(path)
+        else:
+            stations = self._read_json(path)
+        if not stations:
+            raise CommandError(f"No police stations found in {path}")
+
+        write_index(output, stations, cell_degrees=cell_degrees, bbox=bbox)
+        index = PoliceStationIndex(output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {index.size} police stations in {len(index.cells)} cells "
+            f"({os.path.getsize(output) / 1024:.1f} KiB) to {output} in {time.perf_counter() - start:.1f}s"
+        ))
+        index.close()
+
+    def _station(self, osm_id, lat, lon, tags):
+        return {
+            'id': osm_id,
+            'lat': lat,
+            'lon': lon,
+            'name': tags.get('name', 'Police Station'),
+            'address': tags.get('addr:street', ''),
+            'phone': tags.get('phone', ''),
+        }
+
+    def _read_json(self, path):
+        """GeoJSON FeatureCollection or raw Overpass API output"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+
+        stations = []
+        for element in data.get('elements', []):
+            tags = element.get('tags', {})
+            lat = element.get('lat', element.get('center', {}).get('lat'))
+            lon = element.get('lon', element.get('center', {}).get('lon'))
+            if lat is not None and lon is not None and tags.get('amenity', 'police') == 'police':
+                stations.append(self._station(element.get('id'), lat, lon, tags))
+
+        for feature in data.get('features', []):
+            tags = feature.get('properties') or {}
+            geometry = feature.get('geometry') or {}
+            if tags.get('amenity', 'police') != 'police' or not geometry.get('coordinates'):
+                continue
+            # Buildings mapped as polygons are reduced to the mean of their first ring
+            points = geometry['coordinates']
+            while isinstance(points[0], list) and isinstance(points[0][0], list):
+                points = points[0]
+            if not isinstance(points[0], list):
+                points = [points]
+            lon = sum(point[0] for point in points) / len(points)
+            lat = sum(point[1] for point in points) / len(points)
+            stations.append(self._station(tags.get('@id', feature.get('id')), lat, lon, tags))
+        return stations
+
+    def _read_osm(self, path):
+        """amenity=police nodes, and the centroids of police ways, from an OSM extract"""
+        try:
+            import osmium
+        except ImportError:
+            raise CommandError('osmium not installed, run `pip install osmium` to import OSM extracts')
+
+        command = self
+
+        class PoliceHandler(osmium.SimpleHandler):
+            def __init__(self):
+                super().__init__()
+                self.stations = []
+
+            def node(self, node):
+                if node.tags.get('amenity') == 'police' and node.location.valid():
+                    self.stations.append(command._station(
+                        node.id, node.location.lat, node.location.lon, dict(node.tags)
+                    ))
+
+            def way(self, way):
+                if way.tags.get('amenity') != 'police':
+                    return
+                points = [(node.lat, node.lon) for node in way.nodes if node.location.valid()]
+                if points:
+                    self.stations.append(command._station(
+                        way.id,
+                        sum(lat for lat, _ in points) / len(points),
+                        sum(lon for _, lon in points) / len(points),
+                        dict(way.tags),
+                    ))
+
+        handler = PoliceHandler()
+        handler.apply_file(path, locations=True)
+        return handler.stations
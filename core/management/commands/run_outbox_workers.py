@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.outbox import DeliveryWorkers, drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emergency notifications from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of delivery threads')
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE,
+                            help='Notifications claimed per round trip')
+        parser.add_argument('--poll-interval', type=float, default=settings.OUTBOX_POLL_INTERVAL,
+                            help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Deliver everything due and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            sent, failed = drain_outbox(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Sent {sent} notifications, {failed} failed'))
+            return
+
+        workers = DeliveryWorkers(options['workers'], options['poll_interval'], options['batch_size'])
+        workers.start()
+        self.stdout.write(self.style.SUCCESS(f"Delivering notifications with {options['workers']} workers"))
+        try:
+            workers.join()
+        except KeyboardInterrupt:
+            self.stdout.write('\nStopping outbox workers...')
+            workers.stop()
+            workers.join()
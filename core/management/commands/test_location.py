@@ -4,13 +4,16 @@ from core.voice_monitor import VoiceMonitor
 class Command(BaseCommand):
     help = 'Test the location detection functionality'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--ip', default=None, help='Client IP address to locate')
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Testing location detection...'))
         
         monitor = VoiceMonitor()
         
         # Test location detection
-        location = monitor._get_user_location()
+        location = monitor._get_user_location(client_ip=options['ip'])
         
         if location:
             self.stdout.write(self.style.SUCCESS(f'Location detected successfully:'))
@@ -19,6 +22,7 @@ class Command(BaseCommand):
             self.stdout.write(f'  Latitude: {location["latitude"]}')
             self.stdout.write(f'  Longitude: {location["longitude"]}')
             self.stdout.write(f'  Accuracy: {location["accuracy"]}')
+            self.stdout.write(f'  Source: {location["source"]}')
             
             # Test police station detection
             self.stdout.write(self.style.SUCCESS('\nTesting police station detection...'))
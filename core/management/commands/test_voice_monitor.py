@@ -37,5 +37,5 @@ class Command(BaseCommand):
             self.stdout.write('\nStopping voice monitoring...')
         finally:
             # Stop monitoring
-            stop_voice_monitoring()
+            stop_voice_monitoring(user)
             self.stdout.write(self.style.SUCCESS('Voice monitoring stopped')) 
\ No newline at end of file
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_emergencyalert_shown_to_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='safe_words',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='voice_languages',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_userprofile_safe_words_voice_languages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencyalert',
+            name='detection_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='emergencyalert',
+            name='last_detected_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_pushsubscription'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencyalert',
+            name='stage_timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
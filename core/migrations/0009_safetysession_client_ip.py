@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_emergencyalert_stage_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='safetysession',
+            name='client_ip',
+            field=models.GenericIPAddressField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-17 11:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_safetysession_client_ip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationFix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('accuracy', models.FloatField(blank=True, null=True)),
+                ('safety_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_fixes', to='core.safetysession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['safety_session', 'recorded_at'], name='core_locati_safety__d79f53_idx')],
+            },
+        ),
+    ]
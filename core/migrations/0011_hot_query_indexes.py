@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-17 12:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+from django.utils import timezone
+
+
+def close_duplicate_active_sessions(apps, schema_editor):
+    """Keep each user's newest active safety session; end the older ones"""
+    SafetySession = apps.get_model('core', 'SafetySession')
+    newest = (
+        SafetySession.objects.filter(is_active=True)
+        .values('user').annotate(newest=Max('id')).values_list('newest', flat=True)
+    )
+    SafetySession.objects.filter(is_active=True).exclude(id__in=list(newest)).update(
+        is_active=False, end_time=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_locationfix'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['user', 'status'], name='core_alert_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyalert',
+            index=models.Index(condition=models.Q(('shown_to_user', False)), fields=['safety_session', 'alert_type', '-timestamp'], name='core_alert_unshown_idx'),
+        ),
+        migrations.RunPython(close_duplicate_active_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='safetysession',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('user',), name='core_one_active_session_per_user'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 12:43
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicate_fixes(apps, schema_editor):
+    """Keep the first stored fix of each session and instant; retried batches stored the rest"""
+    LocationFix = apps.get_model('core', 'LocationFix')
+    first = (
+        LocationFix.objects.values('safety_session', 'recorded_at')
+        .annotate(first=Min('id')).values_list('first', flat=True)
+    )
+    LocationFix.objects.exclude(id__in=list(first)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_emergencycontact_linked_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_fixes, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='locationfix',
+            name='core_locati_safety__d79f53_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='locationfix',
+            constraint=models.UniqueConstraint(fields=('safety_session', 'recorded_at'), name='core_one_fix_per_instant'),
+        ),
+    ]
@@ -1,6 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 
@@ -18,6 +18,8 @@ class UserProfile(models.Model):
     email_notifications = models.BooleanField(default=True)
     sms_notifications = models.BooleanField(default=True)
     push_notifications = models.BooleanField(default=True)
+    safe_words = models.TextField(blank=True, default='')  # One extra emergency phrase per line
+    voice_languages = models.CharField(max_length=100, blank=True, default='')  # Comma-separated language codes
     
     def __str__(self):
         return f"{self.user.email}'s Profile"
@@ -35,6 +37,8 @@ class EmergencyContact(models.Model):
     phone_number = models.CharField(max_length=15)
     email = models.EmailField(blank=True, null=True)
     address = models.TextField(blank=True, null=True)
+    # The contact's own account, set only when they accept the guardian's link; receives web push
+    linked_user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='contact_links')
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -47,10 +51,33 @@ class SafetySession(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     location = models.CharField(max_length=255, null=True, blank=True)
+    client_ip = models.GenericIPAddressField(null=True, blank=True)  # Used to locate the user when the browser gives no coordinates
+    
+    class Meta:
+        constraints = [
+            # Also the index behind every "active session of this user" lookup
+            models.UniqueConstraint(fields=['user'], condition=models.Q(is_active=True), name='core_one_active_session_per_user'),
+        ]
     
     def __str__(self):
         return f"Safety Session for {self.user.email} - {self.start_time}"
 
+class LocationFix(models.Model):
+    safety_session = models.ForeignKey(SafetySession, on_delete=models.CASCADE, related_name='location_fixes')
+    recorded_at = models.DateTimeField()  # When the device took the fix, not when it reached us
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    accuracy = models.FloatField(null=True, blank=True)  # Radius in metres, as reported by the browser
+    
+    class Meta:
+        constraints = [
+            # A device takes one fix per instant, so a repeat is a retried batch; also the track's index
+            models.UniqueConstraint(fields=['safety_session', 'recorded_at'], name='core_one_fix_per_instant'),
+        ]
+    
+    def __str__(self):
+        return f"{self.latitude},{self.longitude} at {self.recorded_at}"
+
 class EmergencyAlert(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -65,6 +92,15 @@ class EmergencyAlert(models.Model):
     location = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     shown_to_user = models.BooleanField(default=False)  # Track if alert has been shown to user
+    detection_count = models.PositiveIntegerField(default=1)  # Detections merged into this alert
+    last_detected_at = models.DateTimeField(null=True, blank=True)
+    stage_timings = models.JSONField(default=dict, blank=True)  # Emergency pipeline stage durations in ms
+    
+    class Meta:
+        indexes = [
+            # Dashboards only ever look for alerts they have not shown yet
+            models.Index(fields=['safety_session', 'alert_type', '-timestamp'], condition=models.Q(shown_to_user=False), name='core_alert_unshown_idx'),
+        ]
     
     def __str__(self):
         return f"Emergency Alert for {self.safety_session.user.email} - {self.timestamp}"
@@ -83,9 +119,55 @@ class Alert(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     notified_at = models.DateTimeField(null=True, blank=True)
     
+    class Meta:
+        indexes = [models.Index(fields=['user', 'status'], name='core_alert_user_status_idx')]
+    
     def __str__(self):
         return f"Alert for {self.user.email} - {self.created_at}"
 
+class PushSubscription(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='push_subscriptions')
+    endpoint = models.URLField(max_length=500, unique=True)
+    p256dh = models.CharField(max_length=200)
+    auth = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def subscription_info(self):
+        """The subscription in the shape the Web Push protocol expects"""
+        return {'endpoint': self.endpoint, 'keys': {'p256dh': self.p256dh, 'auth': self.auth}}
+    
+    def __str__(self):
+        return f"Push subscription for {self.user.email}"
+
+class NotificationOutbox(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed')
+    ]
+    
+    alert = models.ForeignKey(EmergencyAlert, on_delete=models.CASCADE, related_name='notifications')
+    channel = models.CharField(max_length=20, default='email')
+    recipient = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    idempotency_key = models.CharField(max_length=64, unique=True)  # One row per alert, round and recipient
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)  # Set by the worker delivering the row
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+    
+    def __str__(self):
+        return f"{self.channel} to {self.recipient} for alert {self.alert_id} ({self.status})"
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -94,3 +176,22 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.userprofile.save()
+
+@receiver(post_init, sender=UserProfile)
+def remember_safety_mode(sender, instance, **kwargs):
+    # Read from __dict__ so profiles loaded with .only() do not fetch the field
+    instance._loaded_safety_mode = instance.__dict__.get('is_safety_mode_active')
+
+@receiver(post_save, sender=UserProfile)
+def bump_user_epoch(sender, instance, created, update_fields=None, **kwargs):
+    # Safety mode is the only profile field polls report; other saves (every login saves the
+    # profile) must not make clients refetch
+    if update_fields is not None and 'is_safety_mode_active' not in update_fields:
+        return
+    if not created and instance.is_safety_mode_active == instance._loaded_safety_mode:
+        return
+    instance._loaded_safety_mode = instance.is_safety_mode_active
+    # Bumped once committed, or a poll in between would be told the old state is current
+    from .poll_state import bump_epoch
+    user_id = instance.user_id
+    transaction.on_commit(lambda: bump_epoch(user_id))
@@ -0,0 +1,243 @@
+import hashlib
+import random
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import NotificationOutbox, EmergencyAlert, Alert
+
+# Rows stuck in 'sending' this long belong to a crashed worker and are retried
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def idempotency_key(alert, round_name, channel, recipient):
+    """Stable key for one notification, so enqueueing it twice is a no-op"""
+    return hashlib.sha256(f"{alert.id}:{round_name}:{channel}:{recipient}".encode()).hexdigest()
+
+
+def enqueue_notifications(alert, messages, round_name='initial'):
+    """Queue notifications for delivery once the current transaction commits.
+
+    `messages` are (channel, recipient, subject, body) tuples; any already
+    queued for this alert and round are skipped, so enqueueing twice is a
+    no-op. Costs one lookup and one insert however many recipients there
+    are. Call inside the transaction that created or updated `alert`, so the
+    alert and its notifications are stored together or not at all. Returns
+    how many were queued.
+    """
+    rows = {}
+    for channel, recipient, subject, body in messages:
+        if recipient:
+            key = idempotency_key(alert, round_name, channel, recipient)
+            rows.setdefault(key, NotificationOutbox(
+                alert=alert,
+                channel=channel,
+                recipient=recipient,
+                subject=subject[:255],
+                body=body,
+                idempotency_key=key,
+            ))
+    if not rows:
+        return 0
+
+    existing = set(NotificationOutbox.objects.filter(idempotency_key__in=rows).values_list('idempotency_key', flat=True))
+    new = [row for key, row in rows.items() if key not in existing]
+    if new:
+        # A concurrent enqueue of the same key loses quietly to the unique constraint
+        NotificationOutbox.objects.bulk_create(new, ignore_conflicts=True)
+        transaction.on_commit(wake_delivery_workers)
+    return len(new)
+
+
+def enqueue_notification(alert, recipient, subject, body, round_name='initial', channel='email'):
+    """Queue a single notification; see enqueue_notifications"""
+    return enqueue_notifications(alert, [(channel, recipient, subject, body)], round_name)
+
+
+def claim_batch(batch_size):
+    """Atomically take up to `batch_size` due notifications for this worker"""
+    now = timezone.now()
+    due = NotificationOutbox.objects.filter(
+        Q(status='pending', next_attempt_at__lte=now) |
+        Q(status='sending', claimed_at__lt=now - CLAIM_TIMEOUT)
+    )
+    ids = list(due.order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+
+    # The conditional update lets exactly one worker win each row
+    token = uuid.uuid4().hex
+    due.filter(id__in=ids).update(status='sending', claim_token=token, claimed_at=now)
+    return list(NotificationOutbox.objects.filter(claim_token=token, status='sending').select_related('alert__safety_session'))
+
+
+def _backoff(attempts):
+    """Exponential backoff with jitter before retry number `attempts`"""
+    delay = settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.OUTBOX_RETRY_MAX_SECONDS) * random.uniform(0.8, 1.2))
+
+
+def deliver_batch(notifications):
+    """Send claimed notifications and record the outcomes; returns (sent, failed) counts"""
+    if not notifications:
+        return 0, 0
+
+    from .alert_dispatcher import get_alert_dispatcher
+
+    # Every channel in the batch sends concurrently, each bounded by its own deadline
+    results = get_alert_dispatcher().deliver(notifications)
+
+    now = timezone.now()
+    sent = [notification for notification in notifications if results[notification.pk] is None]
+    failed = [notification for notification in notifications if results[notification.pk] is not None]
+
+    if sent:
+        # One query marks the whole batch delivered
+        NotificationOutbox.objects.filter(
+            pk__in=[notification.pk for notification in sent],
+            claim_token=notifications[0].claim_token,
+        ).update(status='sent', attempts=F('attempts') + 1, sent_at=now, last_error='')
+        for notification in sent:
+            print(f"Emergency {notification.channel} sent to {notification.recipient}")
+
+        # Keep the legacy alert log in step with delivery
+        Alert.objects.filter(
+            user_id__in={notification.alert.safety_session.user_id for notification in sent},
+            status='active',
+        ).update(status='notified', notified_at=now)
+
+    for notification in failed:
+        attempts = notification.attempts + 1
+        # A late send may already have marked the row sent
+        NotificationOutbox.objects.filter(pk=notification.pk, claim_token=notification.claim_token, status='sending').update(
+            status='failed' if attempts >= settings.OUTBOX_MAX_ATTEMPTS else 'pending',
+            attempts=attempts,
+            next_attempt_at=now + _backoff(attempts),
+            last_error=str(results[notification.pk]),
+        )
+        print(f"Error sending notification {notification.pk} to {notification.recipient} (attempt {attempts}): {results[notification.pk]}")
+
+    for alert_id in {notification.alert_id for notification in notifications}:
+        update_alert_status(alert_id)
+    return len(sent), len(failed)
+
+
+def deliver(notification):
+    """Send one claimed notification and record the outcome; returns True on success"""
+    return deliver_batch([notification])[0] == 1
+
+
+def mark_sent_late(notification_ids):
+    """Record notifications whose send finished after deliver_batch had given up on them.
+
+    Rows not yet retried are marked sent; a row another worker has already
+    claimed again may still go out twice, so delivery is at least once.
+    """
+    try:
+        rows = NotificationOutbox.objects.filter(pk__in=notification_ids, status__in=('sending', 'pending'))
+        alert_ids = set(rows.values_list('alert_id', flat=True))
+        rows.update(status='sent', sent_at=timezone.now(), last_error='')
+        for alert_id in alert_ids:
+            update_alert_status(alert_id)
+    finally:
+        close_old_connections()
+
+
+def update_alert_status(alert_id):
+    """Drive EmergencyAlert.status: sent once anyone was reached, failed once nobody can be"""
+    counts = NotificationOutbox.objects.filter(alert_id=alert_id).aggregate(
+        total=Count('id'),
+        sent=Count('id', filter=Q(status='sent')),
+        failed=Count('id', filter=Q(status='failed')),
+    )
+    if counts['sent']:
+        status = 'sent'
+    elif counts['total'] and counts['failed'] == counts['total']:
+        status = 'failed'
+    else:
+        return
+    EmergencyAlert.objects.filter(pk=alert_id).exclude(status=status).update(status=status)
+
+
+def drain_outbox(batch_size=None):
+    """Deliver every due notification; returns (sent, failed) counts"""
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    sent = failed = 0
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return sent, failed
+        batch_sent, batch_failed = deliver_batch(batch)
+        sent += batch_sent
+        failed += batch_failed
+
+
+class DeliveryWorkers:
+    """Threads that drain the outbox, polling and also woken whenever a notification is queued"""
+
+    def __init__(self, workers, poll_interval, batch_size):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'outbox-{len(self._threads)}')
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent, failed = drain_outbox(self.batch_size)
+            except Exception as e:
+                print(f"Error draining notification outbox: {e}")
+                sent = failed = 0
+            finally:
+                close_old_connections()
+
+            if not sent and not failed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+
+_workers = None
+_workers_lock = threading.Lock()
+
+
+def wake_delivery_workers():
+    """Start this process's delivery threads if configured, and nudge them"""
+    global _workers
+    if settings.OUTBOX_IN_PROCESS_WORKERS <= 0:
+        return
+    with _workers_lock:
+        if _workers is None:
+            _workers = DeliveryWorkers(
+                settings.OUTBOX_IN_PROCESS_WORKERS,
+                settings.OUTBOX_POLL_INTERVAL,
+                settings.OUTBOX_BATCH_SIZE,
+            )
+            _workers.start()
+    _workers.wake()
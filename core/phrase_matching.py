@@ -0,0 +1,234 @@
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+# Built-in emergency phrases and variants, by language code
+EMERGENCY_PHRASES = {
+    'en': ['help me', 'somebody help', 'someone help', 'save me', 'call the police'],
+    'hi': ['bachao', 'mujhe bachao', 'madad karo', 'बचाओ', 'मुझे बचाओ', 'मदद करो'],
+    'es': ['ayuda', 'ayúdame', 'socorro'],
+    'fr': ['au secours', 'aidez moi', 'à l aide'],
+    'de': ['hilfe', 'hilf mir'],
+}
+
+LANGUAGE_NAMES = {
+    'en': 'English',
+    'hi': 'Hindi',
+    'es': 'Spanish',
+    'fr': 'French',
+    'de': 'German',
+}
+
+def normalize(text):
+    """Lowercase and strip punctuation, keeping letters, digits and combining marks"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    return ''.join(c if unicodedata.category(c)[0] in 'LNM' else ' ' for c in text)
+
+
+def max_edits(word):
+    """Edit distance tolerated for a vocabulary word of this length"""
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 6:
+        return 1
+    return 2
+
+
+def _deletions(word, distance):
+    """All strings reachable from `word` by deleting up to `distance` characters"""
+    results = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+def bounded_levenshtein(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 if it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class PhraseAutomaton:
+    """Aho-Corasick automaton over the words of a set of phrases.
+
+    Transcript words are first mapped onto the phrase vocabulary, tolerating
+    a few typos per word through a deletion index, and the resulting word
+    sequence is scanned once, so matching costs O(transcript length) however
+    many phrases are compiled in.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = []
+        self.vocabulary = {}
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._deletion_index = {}
+        self._lookup_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        for phrase in phrases:
+            words = normalize(phrase).split()
+            if words and words not in self.phrases:
+                self._add(words)
+        self._build_failure_links()
+        self._build_deletion_index()
+
+    def _add(self, words):
+        index = len(self.phrases)
+        self.phrases.append(words)
+        state = 0
+        for word in words:
+            word_id = self.vocabulary.setdefault(word, len(self.vocabulary))
+            if word_id not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][word_id] = len(self._goto) - 1
+            state = self._goto[state][word_id]
+        self._output[state].append(index)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word_id, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and word_id not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(word_id, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def _build_deletion_index(self):
+        for word, word_id in self.vocabulary.items():
+            for variant in _deletions(word, max_edits(word)):
+                self._deletion_index.setdefault(variant, set()).add(word_id)
+
+    def _lookup(self, word):
+        """Map a transcript word to (vocabulary id, edits), or (None, 0)"""
+        with self._lock:
+            if word in self._lookup_cache:
+                self._lookup_cache.move_to_end(word)
+                return self._lookup_cache[word]
+
+        if word in self.vocabulary:
+            found = (self.vocabulary[word], 0)
+        else:
+            found = (None, 0)
+            words = list(self.vocabulary)
+            candidates = set()
+            for variant in _deletions(word, 2):
+                candidates |= self._deletion_index.get(variant, set())
+            for word_id in candidates:
+                target = words[word_id]
+                limit = max_edits(target)
+                distance = bounded_levenshtein(word, target, limit)
+                if distance <= limit and (found[0] is None or distance < found[1]):
+                    found = (word_id, distance)
+
+        with self._lock:
+            self._lookup_cache[word] = found
+            if len(self._lookup_cache) > 4096:
+                self._lookup_cache.popitem(last=False)
+        return found
+
+    def search(self, text):
+        """Yield (phrase, edits) for every phrase found in `text`"""
+        state = 0
+        edits = []
+        for word in normalize(text).split():
+            word_id, distance = self._lookup(word)
+            edits.append(distance)
+            while state and word_id not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word_id, 0)
+            for index in self._output[state]:
+                words = self.phrases[index]
+                yield ' '.join(words), sum(edits[-len(words):])
+
+
+class PhraseMatcher:
+    """Scores N-best transcripts against a user's emergency phrases"""
+
+    def __init__(self, phrases, threshold=None):
+        self.automaton = PhraseAutomaton(phrases)
+        self.threshold = settings.EMERGENCY_MATCH_THRESHOLD if threshold is None else threshold
+
+    def match(self, alternatives):
+        """Best phrase match over (transcript, confidence) alternatives.
+
+        A match scores 1 minus the fraction of its characters that had to be
+        edited, scaled by the recognizer's confidence in that alternative.
+        """
+        best = {'phrase': '', 'transcript': '', 'confidence': 0.0}
+        for transcript, confidence in alternatives:
+            for phrase, edits in self.automaton.search(transcript):
+                length = len(phrase.replace(' ', ''))
+                score = max(0.0, 1.0 - edits / float(length)) * confidence
+                if score > best['confidence']:
+                    best = {'phrase': phrase, 'transcript': transcript, 'confidence': score}
+
+        best['is_emergency'] = best['confidence'] >= self.threshold
+        return best
+
+
+def phrases_for(profile=None):
+    """Built-in phrases for the user's languages plus their own safe words"""
+    languages = settings.EMERGENCY_PHRASE_LANGUAGES
+    safe_words = []
+    if profile is not None:
+        languages = [code.strip() for code in (profile.voice_languages or '').split(',') if code.strip()] or languages
+        safe_words = [line.strip() for line in (profile.safe_words or '').splitlines() if line.strip()]
+
+    phrases = []
+    for code in languages:
+        phrases.extend(EMERGENCY_PHRASES.get(code, []))
+    return phrases + safe_words
+
+
+# Compiled matchers for recently active users, with the phrases they were built from
+_matchers = OrderedDict()
+_matchers_lock = threading.Lock()
+MAX_CACHED_MATCHERS = 1024
+
+
+def get_phrase_matcher(user_id=None):
+    """Compiled matcher for a user, rebuilt only after their phrases change.
+
+    The phrases are read from the profile row on every call, so an edit is
+    seen by every process at once and nothing can be evicted into reusing a
+    stale matcher; only compiling is cached.
+    """
+    profile = None
+    if user_id:
+        from .models import UserProfile
+        profile = UserProfile.objects.filter(user_id=user_id).only('safe_words', 'voice_languages').first()
+    phrases = tuple(phrases_for(profile))
+
+    with _matchers_lock:
+        cached = _matchers.get(user_id)
+        if cached and cached[0] == phrases:
+            _matchers.move_to_end(user_id)
+            return cached[1]
+
+    matcher = PhraseMatcher(phrases)
+    with _matchers_lock:
+        _matchers[user_id] = (phrases, matcher)
+        if len(_matchers) > MAX_CACHED_MATCHERS:
+            _matchers.popitem(last=False)
+    return matcher
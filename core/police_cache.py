@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .geo import geohash, geohash_bounds, haversine_km
+
+_KEY_PREFIX = 'police-stations:'
+
+
+class _Flight:
+    """One upstream request that concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PoliceStationCache:
+    """Overpass police station results by geohash cell, shared through a Django cache.
+
+    Each cell is fetched once, centred on the cell and widened by its half
+    diagonal, so it answers a radius search from anywhere inside the cell.
+    Entries are fresh for `ttl` seconds and then served stale for up to
+    `stale_ttl` more while one background refresh runs. Concurrent misses
+    for a cell share one upstream request: threads wait on the in-process
+    flight and other processes on a cache lock.
+    """
+
+    def __init__(self, alias, precision, ttl, stale_ttl, fetch_timeout):
+        self.alias = alias
+        self.precision = precision
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.fetch_timeout = fetch_timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def cell(self, lat, lon, radius_km):
+        """Cache key, cell centre and query radius covering any point of the cell"""
+        cell = geohash(lat, lon, self.precision)
+        min_lat, min_lon, max_lat, max_lon = geohash_bounds(cell)
+        centre_lat, centre_lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+        half_diagonal = float(haversine_km(centre_lat, centre_lon, max_lat, max_lon))
+        return f"{_KEY_PREFIX}{cell}:{radius_km:g}", centre_lat, centre_lon, radius_km + half_diagonal
+
+    def get(self, lat, lon, radius_km, fetch):
+        """Stations around the point's cell; `fetch(lat, lon, radius_km)` queries upstream on a miss"""
+        key, centre_lat, centre_lon, query_radius = self.cell(lat, lon, radius_km)
+
+        def load():
+            return self._load(key, lambda: fetch(centre_lat, centre_lon, query_radius))
+
+        entry = self.cache.get(key)
+        if entry is None:
+            self._count('misses')
+            return self._single_flight(key, load)
+
+        if time.time() - entry['fetched_at'] < self.ttl:
+            self._count('hits')
+        else:
+            self._count('stale_hits')
+            self._refresh_in_background(key, load)
+        return entry['stations']
+
+    def _single_flight(self, key, load):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            if not flight.done.wait(self.fetch_timeout * 2):
+                raise TimeoutError(f"Timed out waiting for police station lookup {key}")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = load()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _load(self, key, fetch):
+        """Fetch and store one cell, unless another process is already doing so"""
+        lock_key = f"{key}:lock"
+        owner = self.cache.add(lock_key, 1, self.fetch_timeout * 2)
+        if not owner:
+            # Another process holds the cell; wait for its result rather than querying too
+            deadline = time.monotonic() + self.fetch_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.1)
+                entry = self.cache.get(key)
+                if entry is not None and time.time() - entry['fetched_at'] < self.ttl:
+                    self._count('coalesced')
+                    return entry['stations']
+            self._count('lock_timeouts')
+
+        try:
+            stations = fetch()
+            self._count('fetches')
+            self.cache.set(key, {'stations': stations, 'fetched_at': time.time()}, self.ttl + self.stale_ttl)
+            return stations
+        finally:
+            if owner:
+                self.cache.delete(lock_key)
+
+    def _refresh_in_background(self, key, load):
+        with self._lock:
+            if key in self._flights:
+                return
+        self._count('refreshes')
+
+        def refresh():
+            try:
+                self._single_flight(key, load)
+            except Exception as e:
+                # The stale entry stays in place and the next lookup tries again
+                print(f"Error refreshing police stations for {key}: {e}")
+
+        thread = threading.Thread(target=refresh, name=f'police-refresh-{key}')
+        thread.daemon = True
+        thread.start()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['stale_hits'] + self._stats['misses']
+            return {
+                'precision': self.precision,
+                'ttl': self.ttl,
+                'stale_ttl': self.stale_ttl,
+                'hits': self._stats['hits'],
+                'stale_hits': self._stats['stale_hits'],
+                'misses': self._stats['misses'],
+                'coalesced': self._stats['coalesced'],
+                'fetches': self._stats['fetches'],
+                'refreshes': self._stats['refreshes'],
+                'lock_timeouts': self._stats['lock_timeouts'],
+                'hit_rate': (self._stats['hits'] + self._stats['stale_hits']) / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_police_station_cache():
+    """Process-wide Overpass cache configured from settings"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PoliceStationCache(
+                alias=settings.POLICE_CACHE_ALIAS,
+                precision=settings.POLICE_CACHE_GEOHASH_PRECISION,
+                ttl=settings.POLICE_CACHE_TTL,
+                stale_ttl=settings.POLICE_CACHE_STALE_TTL,
+                fetch_timeout=settings.OVERPASS_TIMEOUT,
+            )
+        return _cache
@@ -0,0 +1,263 @@
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .geo import degrees_for_km, nearest_k
+from .http_client import get_http_client
+from .police_cache import get_police_station_cache
+
+# Index file layout (little endian): header, then 8-byte aligned arrays
+#   cells   int64[n_cells]      sorted grid cell keys that hold stations
+#   starts  int32[n_cells + 1]  first station of each cell
+#   lat/lon float32[n]          station coordinates, grouped by cell
+#   meta    uint32[n + 1]       offsets of each station's JSON metadata in the blob
+#   blob    bytes               UTF-8 JSON objects with id, name, address and phone
+INDEX_MAGIC = b'SSPOLIDX'
+INDEX_VERSION = 1
+_HEADER = struct.Struct('<8sIIIdddddd')
+
+DEFAULT_CELL_DEGREES = 0.05
+
+
+class PoliceIndexError(Exception):
+    """Raised when a police station index file is missing or malformed"""
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _grid_columns(cell_degrees):
+    return int(math.ceil(360.0 / cell_degrees))
+
+
+def _cell_keys(lats, lons, cell_degrees):
+    rows = np.floor((np.asarray(lats, dtype=np.float64) + 90.0) / cell_degrees).astype(np.int64)
+    cols = np.floor((np.asarray(lons, dtype=np.float64) + 180.0) / cell_degrees).astype(np.int64)
+    return rows * _grid_columns(cell_degrees) + cols % _grid_columns(cell_degrees)
+
+
+def write_index(path, stations, cell_degrees=DEFAULT_CELL_DEGREES, bbox=None):
+    """Write stations ({'lat', 'lon', 'id', 'name', 'address', 'phone'} dicts) to an index file.
+
+    `bbox` is the (min_lat, min_lon, max_lat, max_lon) region the extract
+    covers; lookups outside it fall back to Overpass. It defaults to the
+    stations' own bounding box. The file is replaced atomically, so running
+    processes keep using the old index until they notice the new one.
+    """
+    lats = np.array([station['lat'] for station in stations], dtype=np.float32)
+    lons = np.array([station['lon'] for station in stations], dtype=np.float32)
+    keys = _cell_keys(lats, lons, cell_degrees)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    cells, starts = np.unique(keys, return_index=True)
+    starts = np.append(starts, len(keys)).astype(np.int32)
+
+    blobs = [
+        json.dumps({field: stations[i].get(field, '') for field in ('id', 'name', 'address', 'phone')}).encode()
+        for i in order
+    ]
+    meta = np.zeros(len(blobs) + 1, dtype=np.uint32)
+    np.cumsum([len(blob) for blob in blobs], out=meta[1:])
+
+    if bbox is None:
+        bbox = (float(lats.min()), float(lons.min()), float(lats.max()), float(lons.max())) if len(stations) else (0, 0, 0, 0)
+
+    header = _HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(stations), len(cells), cell_degrees, *bbox, 0.0)
+    sections = [cells.astype('<i8'), starts.astype('<i4'), lats[order].astype('<f4'), lons[order].astype('<f4'), meta.astype('<u4')]
+
+    temp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        for section in sections:
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(section.tobytes())
+        f.write(b''.join(blobs))
+    os.replace(temp_path, path)
+
+
+class PoliceStationIndex:
+    """Memory-mapped grid index of police stations.
+
+    Stations are bucketed into square grid cells; a lookup reads only the
+    cells around the query point, so it costs microseconds and no network.
+    The file is mapped read-only, so every worker process on a host shares
+    one copy of it through the page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise PoliceIndexError(f"Cannot open police station index {path}: {e}")
+        self.mtime = os.stat(path).st_mtime
+
+        if len(self._map) < _HEADER.size:
+            raise PoliceIndexError(f"Police station index {path} is truncated")
+        magic, version, n, n_cells, self.cell_degrees, *bbox, _ = _HEADER.unpack_from(self._map)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise PoliceIndexError(f"{path} is not a version {INDEX_VERSION} police station index")
+        self.size = n
+        self.bbox = tuple(bbox)
+        self.columns = _grid_columns(self.cell_degrees)
+
+        offset = _HEADER.size
+        arrays = []
+        for dtype, count in (('<i8', n_cells), ('<i4', n_cells + 1), ('<f4', n), ('<f4', n), ('<u4', n + 1)):
+            offset = _align(offset)
+            arrays.append(np.frombuffer(self._map, dtype=dtype, count=count, offset=offset))
+            offset += arrays[-1].nbytes
+        self.cells, self.starts, self.lats, self.lons, self.meta = arrays
+        self._blob_offset = offset
+
+    def covers(self, lat, lon):
+        """Whether the imported extract covers this point"""
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        return self.size > 0 and min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+
+    def _candidates(self, lat, lon, radius_km):
+        """Indexes of stations in the grid cells overlapping the search radius"""
+        dlat, dlon = degrees_for_km(radius_km, lat)
+        row = int((lat + 90.0) // self.cell_degrees)
+        col = int((lon + 180.0) // self.cell_degrees)
+        row_span = int(math.ceil(dlat / self.cell_degrees))
+        col_span = min(int(math.ceil(dlon / self.cell_degrees)), self.columns // 2)
+
+        # Cells of one grid row are adjacent in key order, so each row of the
+        # search window is a single slice of the station arrays
+        first, last = col - col_span, col + col_span
+        if first < 0:
+            intervals = [(first + self.columns, self.columns - 1), (0, last)]
+        elif last >= self.columns:
+            intervals = [(first, self.columns - 1), (0, last - self.columns)]
+        else:
+            intervals = [(first, last)]
+        rows = np.arange(row - row_span, row + row_span + 1, dtype=np.int64) * self.columns
+        lows = np.concatenate([rows + low for low, _ in intervals])
+        highs = np.concatenate([rows + high for _, high in intervals])
+
+        begin = self.starts[np.searchsorted(self.cells, lows, side='left')]
+        end = self.starts[np.searchsorted(self.cells, highs, side='right')]
+        return np.concatenate([np.arange(b, e) for b, e in zip(begin, end) if e > b] or [np.empty(0, dtype=np.int64)])
+
+    def station(self, index):
+        """Metadata of one station as stored at import time"""
+        start = self._blob_offset + int(self.meta[index])
+        end = self._blob_offset + int(self.meta[index + 1])
+        return json.loads(self._map[start:end])
+
+    def nearest(self, lat, lon, k=5, radius_km=5.0):
+        """Up to k stations within radius_km, nearest first, with 'distance' in km"""
+        candidates = self._candidates(lat, lon, radius_km)
+        if not len(candidates):
+            return []
+        best, distances = nearest_k(lat, lon, self.lats[candidates], self.lons[candidates], k, radius_km)
+
+        stations = []
+        for i, distance in zip(candidates[best], distances):
+            station = self.station(int(i))
+            station.update({
+                'lat': float(self.lats[i]),
+                'lon': float(self.lons[i]),
+                'distance': float(distance),
+            })
+            stations.append(station)
+        return stations
+
+    def close(self):
+        # The arrays are views into the mapping and must go before it can be unmapped
+        self.cells = self.starts = self.lats = self.lons = self.meta = None
+        self._map.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_police_index():
+    """The police station index for this process, or None if none was imported.
+
+    The file is re-mapped when import_police_stations replaces it.
+    """
+    global _index
+    path = settings.POLICE_INDEX_PATH
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+
+    with _index_lock:
+        if _index is None or _index.path != path or _index.mtime != mtime:
+            try:
+                _index = PoliceStationIndex(path)
+            except PoliceIndexError as e:
+                print(f"Police station index unavailable: {e}")
+                _index = None
+        return _index
+
+
+def _fetch_overpass(lat, lon, radius_km):
+    """Police stations within radius_km from the live Overpass API"""
+    query = f"""
+    [out:json][timeout:25];
+    (
+      node["amenity"="police"](around:{int(radius_km * 1000)},{lat},{lon});
+    );
+    out body;
+    >;
+    out skel qt;
+    """
+    response = get_http_client().get(settings.OVERPASS_URL, params={'data': query}, timeout=settings.OVERPASS_TIMEOUT)
+    # Raise rather than return nothing, so a failed query is never cached as "no stations"
+    response.raise_for_status()
+
+    stations = []
+    for element in response.json().get('elements', []):
+        if element.get('lat') is None or element.get('lon') is None:
+            continue
+        tags = element.get('tags', {})
+        stations.append({
+            'id': element.get('id'),
+            'lat': element['lat'],
+            'lon': element['lon'],
+            'name': tags.get('name', 'Police Station'),
+            'address': tags.get('addr:street', ''),
+            'phone': tags.get('phone', ''),
+        })
+    return stations
+
+
+def _overpass_stations(lat, lon, k, radius_km):
+    """Overpass results for the point's geohash cell, used only where no local index covers it"""
+    stations = get_police_station_cache().get(lat, lon, radius_km, _fetch_overpass)
+    # The cell's result covers the whole cell; narrow it to this point
+    best, distances = nearest_k(
+        lat, lon,
+        [station['lat'] for station in stations],
+        [station['lon'] for station in stations],
+        k, radius_km,
+    )
+    return [dict(stations[i], distance=float(distance)) for i, distance in zip(best, distances)]
+
+
+def find_nearby_police_stations(lat, lon, k=5, radius_km=None):
+    """Nearest police stations, from the local index when it covers the point"""
+    radius_km = radius_km or settings.POLICE_SEARCH_RADIUS_KM
+    index = get_police_index()
+    if index is not None and index.covers(lat, lon):
+        return index.nearest(lat, lon, k, radius_km)
+
+    try:
+        return _overpass_stations(lat, lon, k, radius_km)
+    except Exception as e:
+        print(f"Error finding police stations: {e}")
+        return []
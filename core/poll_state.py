@@ -0,0 +1,88 @@
+import functools
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.cache import add_never_cache_headers
+
+# Per-user counter bumped whenever an alert is raised or monitoring state changes
+_EPOCH_KEY = 'user-epoch:{}'
+EPOCH_TIMEOUT = 24 * 3600
+_signer = signing.TimestampSigner(salt='core.poll-epoch')
+
+
+def _seed():
+    # An evicted counter restarts from the clock, past any epoch a client has already seen
+    return time.time_ns() // 1000
+
+
+def current_epoch(user_id):
+    """The user's state epoch, starting one if the cache has none"""
+    key = _EPOCH_KEY.format(user_id)
+    epoch = cache.get(key)
+    if epoch is None:
+        cache.add(key, _seed(), EPOCH_TIMEOUT)
+        epoch = cache.get(key)
+    return epoch
+
+
+def bump_epoch(user_id):
+    """Mark the user's alert and monitoring state as changed"""
+    key = _EPOCH_KEY.format(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), EPOCH_TIMEOUT)
+        return cache.get(key)
+
+
+def epoch_token(user_id, epoch):
+    """Signed token naming a user's epoch, handed to polling clients"""
+    return _signer.sign(f"{user_id}:{epoch}")
+
+
+def _client_token(request):
+    token = request.GET.get('epoch')
+    if token:
+        return token
+    # If-None-Match may list several quoted, possibly weak, ETags; ours is the first
+    etag = request.headers.get('If-None-Match', '').split(',')[0].strip()
+    return etag.removeprefix('W/').strip('"') or None
+
+
+def _unchanged(request):
+    """Whether the client's token names its user's current epoch"""
+    token = _client_token(request)
+    if not token or not settings.POLL_FAST_PATH:
+        return False
+    try:
+        user_id, epoch = _signer.unsign(token, max_age=settings.POLL_TOKEN_MAX_AGE).split(':')
+        return int(epoch) == current_epoch(int(user_id))
+    except (signing.BadSignature, ValueError):
+        return False
+
+
+def not_modified_unless_changed(view):
+    """Answer GET polls 304 from the cache alone while the client's epoch is current.
+
+    The signed token stands in for the session, so an unchanged poll touches
+    neither the session store nor the database; anything else goes through
+    to the view, which must tag its response with `tag_epoch`.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method == 'GET' and _unchanged(request):
+            response = HttpResponseNotModified()
+            add_never_cache_headers(response)
+            return response
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def tag_epoch(response, token):
+    """Hand the client its next token; the browser's own HTTP cache stays out of it"""
+    response['ETag'] = f'"{token}"'
+    add_never_cache_headers(response)
+    return response
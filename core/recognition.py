@@ -0,0 +1,152 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .audio_decoding import DecodedAudio, PCM16
+from .keyword_spotting import KeywordSpotter
+
+
+# Google only scores its top alternative; each lower rank is discounted by this factor
+ALTERNATIVE_RANK_DISCOUNT = 0.8
+
+
+class RecognitionUnavailable(Exception):
+    """Raised when a recognizer backend cannot be reached"""
+
+
+def _result(text='', confidence=0.0, backend='', alternatives=None):
+    """Recognition result; `alternatives` holds the N-best (transcript, confidence) pairs"""
+    if alternatives is None:
+        alternatives = [(text, confidence)] if text else []
+    return {'text': text, 'confidence': confidence, 'backend': backend, 'alternatives': alternatives}
+
+
+def audio_from_source(audio):
+    """Wrap a speech_recognition AudioData captured from a microphone"""
+    raw = audio.get_raw_data(convert_width=2)
+    samples = np.frombuffer(raw, dtype='<i2').reshape(-1, 1)
+    return DecodedAudio(samples, audio.sample_rate, 1, PCM16)
+
+
+class GoogleRecognizer:
+    """Remote transcription through the Google Web Speech API"""
+
+    name = 'google'
+
+    def __init__(self, recognizer=None):
+        self._recognizer = recognizer
+
+    @property
+    def recognizer(self):
+        if self._recognizer is None:
+            import speech_recognition as sr
+            self._recognizer = sr.Recognizer()
+        return self._recognizer
+
+    def recognize(self, audio):
+        import speech_recognition as sr
+        try:
+            response = self.recognizer.recognize_google(audio.to_audio_data(), show_all=True)
+        except sr.UnknownValueError:
+            return _result(backend=self.name)
+        except sr.RequestError as e:
+            raise RecognitionUnavailable(str(e))
+
+        if not response or not response.get('alternative'):
+            return _result(backend=self.name)
+
+        alternatives = []
+        top_confidence = response['alternative'][0].get('confidence', 1.0)
+        for rank, alternative in enumerate(response['alternative']):
+            confidence = alternative.get('confidence', top_confidence * ALTERNATIVE_RANK_DISCOUNT ** rank)
+            alternatives.append((alternative['transcript'].lower(), confidence))
+        return _result(alternatives[0][0], alternatives[0][1], self.name, alternatives)
+
+
+class KeywordSpotterRecognizer:
+    """Local, offline keyword spotting for the enrolled emergency phrases"""
+
+    name = 'keyword_spotter'
+
+    def __init__(self, spotter):
+        self.spotter = spotter
+
+    @property
+    def is_ready(self):
+        return self.spotter.is_ready
+
+    def recognize(self, audio):
+        match = self.spotter.spot(audio.mono(), audio.sample_rate)
+        if match is None:
+            return _result(backend=self.name)
+        return _result(match['phrase'], match['confidence'], self.name)
+
+
+class CascadeRecognizer:
+    """Local keyword spotter first, with Google as an optional second stage.
+
+    Clips the spotter rejects never leave the process. Spotted clips are
+    confirmed remotely when `confirm` is set, and the local result stands
+    whenever the remote service is unavailable. Without enrolled templates
+    the remote recognizer is used directly.
+    """
+
+    name = 'cascade'
+
+    def __init__(self, local, remote=None, confirm=True):
+        self.local = local
+        self.remote = remote
+        self.confirm = confirm
+
+    def recognize(self, audio):
+        if not self.local.is_ready:
+            if self.remote is None:
+                return _result(backend=self.name)
+            try:
+                return self.remote.recognize(audio)
+            except RecognitionUnavailable as e:
+                print(f"Remote recognizer unavailable and no keyword templates enrolled: {e}")
+                return _result(backend=self.name)
+
+        local_result = self.local.recognize(audio)
+        if not local_result['text'] or not self.confirm or self.remote is None:
+            return local_result
+
+        try:
+            # The phrase matcher confirms or rejects the local match from these alternatives
+            return self.remote.recognize(audio)
+        except RecognitionUnavailable as e:
+            print(f"Remote confirmation unavailable, using local keyword match: {e}")
+            return local_result
+
+
+_spotter = None
+_spotter_lock = threading.Lock()
+
+
+def get_keyword_spotter():
+    """Load the enrolled keyword templates once per process"""
+    global _spotter
+    with _spotter_lock:
+        if _spotter is None:
+            _spotter = KeywordSpotter.from_directory(
+                settings.KEYWORD_TEMPLATES_DIR,
+                threshold=settings.KEYWORD_SPOTTER_THRESHOLD,
+            )
+            print(f"Loaded keyword templates for: {', '.join(_spotter.templates) or 'none'}")
+        return _spotter
+
+
+def get_recognizer(backend=None):
+    """Build the recognizer backend selected by settings.VOICE_RECOGNIZER"""
+    backend = backend or settings.VOICE_RECOGNIZER
+    if backend == GoogleRecognizer.name:
+        return GoogleRecognizer()
+
+    local = KeywordSpotterRecognizer(get_keyword_spotter())
+    if backend == KeywordSpotterRecognizer.name:
+        return local
+    if backend == CascadeRecognizer.name:
+        return CascadeRecognizer(local, GoogleRecognizer(), confirm=settings.VOICE_REMOTE_CONFIRMATION)
+    raise ValueError(f"Unknown voice recognizer backend: {backend}")
@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+_KEY_PREFIX = 'recognition:'
+
+
+def audio_key(data):
+    """Content address of an upload or of decoded PCM samples"""
+    return _KEY_PREFIX + hashlib.blake2b(memoryview(data).cast('B'), digest_size=16).hexdigest()
+
+
+class RecognitionCache:
+    """Recognizer results by audio content, so retried uploads skip decoding and recognition.
+
+    Entries live in a per-process LRU bounded by `max_entries` and expire after
+    `ttl` seconds. When `alias` names a Django cache, results are also shared
+    through it, so a retry that lands on another worker still hits.
+    """
+
+    def __init__(self, max_entries, ttl, alias=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.alias = alias or None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def get(self, key):
+        """Return (found, result); a found result of None means the clip held no speech"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return True, entry[1]
+                del self._entries[key]
+                self._stats['expired'] += 1
+
+        if self.alias:
+            shared = caches[self.alias].get(key)
+            if shared is not None:
+                self._store(key, shared['result'], now)
+                with self._lock:
+                    self._stats['shared_hits'] += 1
+                return True, shared['result']
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return False, None
+
+    def set(self, key, result):
+        self._store(key, result, time.monotonic())
+        if self.alias:
+            # Wrapped so that a cached "no speech" result is distinguishable from a miss
+            caches[self.alias].set(key, {'result': result}, self.ttl)
+
+    def _store(self, key, result, now):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['shared_hits'] + self._stats['misses']
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self._stats['hits'],
+                'shared_hits': self._stats['shared_hits'],
+                'misses': self._stats['misses'],
+                'evictions': self._stats['evictions'],
+                'expired': self._stats['expired'],
+                'hit_rate': (self._stats['hits'] + self._stats['shared_hits']) / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_recognition_cache():
+    """Process-wide recognition cache sized from settings"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RecognitionCache(
+                max_entries=settings.RECOGNITION_CACHE_SIZE,
+                ttl=settings.RECOGNITION_CACHE_TTL,
+                alias=settings.RECOGNITION_CACHE_ALIAS,
+            )
+        return _cache
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class ExecutorBusy(Exception):
+    """Raised when recognition work is refused to protect the rest of the site"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _run_job(fn, args):
+    # Jobs reach the ORM (alerts, phrase profiles), and pool threads live as long as the process
+    close_old_connections()
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+class RecognitionExecutor:
+    """Bounded thread pool for speech recognition with per-user in-flight limits.
+
+    At most `max_workers` jobs run and `max_queue` more wait; anything beyond
+    that is refused immediately instead of queueing, as is a user's job once
+    they already have `per_user_limit` jobs in flight.
+    """
+
+    def __init__(self, max_workers, max_queue, per_user_limit, retry_after):
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self.per_user_limit = per_user_limit
+        self.retry_after = retry_after
+        self._pool = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._per_user = Counter()
+        self._stats = Counter()
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='recognition')
+        return self._pool
+
+    def submit(self, user_id, fn, *args):
+        """Queue `fn(*args)` for `user_id`, or raise ExecutorBusy"""
+        with self._lock:
+            if self._per_user[user_id] >= self.per_user_limit:
+                self._stats['rejected_user_limit'] += 1
+                raise ExecutorBusy('Too many voice clips in flight', 429, self.retry_after)
+            if self._in_flight >= self.capacity:
+                self._stats['rejected_queue_full'] += 1
+                raise ExecutorBusy('Voice recognition is busy', 503, self.retry_after)
+            self._in_flight += 1
+            self._per_user[user_id] += 1
+            self._stats['submitted'] += 1
+            pool = self._get_pool()
+
+        try:
+            future = pool.submit(_run_job, fn, args)
+        except RuntimeError:
+            self._release(user_id)
+            raise
+        future.add_done_callback(lambda _: self._release(user_id))
+        return future
+
+    def _release(self, user_id):
+        with self._lock:
+            self._in_flight -= 1
+            self._per_user[user_id] -= 1
+            if self._per_user[user_id] <= 0:
+                del self._per_user[user_id]
+
+    async def run(self, user_id, fn, *args):
+        """Run `fn(*args)` on the pool and await its result"""
+        return await asyncio.wrap_future(self.submit(user_id, fn, *args))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'capacity': self.capacity,
+                'users_in_flight': len(self._per_user),
+                **self._stats,
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_recognition_executor():
+    """Process-wide recognition executor sized from settings"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = RecognitionExecutor(
+                max_workers=settings.RECOGNITION_WORKERS,
+                max_queue=settings.RECOGNITION_QUEUE_SIZE,
+                per_user_limit=settings.RECOGNITION_PER_USER_LIMIT,
+                retry_after=settings.RECOGNITION_RETRY_AFTER,
+            )
+        return _executor
@@ -1,3 +1,1452 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import wave
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import close_old_connections, connection, IntegrityError, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .alert_dispatcher import AlertDispatcher, DeadlineExceeded, get_alert_dispatcher, PushChannel
+from .alerts import raise_voice_alert
+from .emergency_pipeline import EmergencyPipeline
+from .geoip import GeoIPDatabase, GeoIPLocator, write_geoip_database
+from .http_client import CircuitBreaker, CircuitOpenError, HttpClient, CLOSED, HALF_OPEN, OPEN
+from .audio_decoding import AudioDecodeError, DecodedAudio, decode_audio, PCM16
+from .audio_stream import AudioRingBuffer, AudioStream, close_stream, get_stream, StreamError, STREAM_SAMPLE_RATE
+from .police_cache import PoliceStationCache
+from .police_stations import find_nearby_police_stations, PoliceStationIndex, write_index
+from .recognition_cache import audio_key, RecognitionCache
+from .keyword_spotting import KeywordSpotter
+from .recognition_executor import ExecutorBusy
+from . import archive, outbox, phrase_matching
+from .models import Alert, EmergencyAlert, EmergencyContact, LocationFix, NotificationOutbox, PushSubscription, SafetySession, UserProfile
+from .voice_detection import VoiceActivityGate, VoiceSpeechDetector
+from .voice_monitor import VoiceMonitorManager
+from .websocket import voice_stream_socket
+
+
+def _tone(seconds, rate, frequency=440, amplitude=8000):
+    t = np.arange(int(seconds * rate)) / rate
+    return (np.sin(2 * np.pi * frequency * t) * amplitude).astype(np.int16)
+
+
+def _wav(samples, rate, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(samples.astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+def _webm_opus(samples, rate):
+    import av
+
+    buffer = io.BytesIO()
+    with av.open(buffer, 'w', format='webm') as out:
+        stream = out.add_stream('libopus', rate=rate)
+        stream.layout = 'mono'
+        frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format='s16', layout='mono')
+        frame.sample_rate = rate
+        for packet in stream.encode(frame):
+            out.mux(packet)
+        for packet in stream.encode(None):
+            out.mux(packet)
+    return buffer.getvalue()
+
+
+def _has_av():
+    try:
+        import av  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HotQueryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('guardian', 'guardian@example.com', 'password')
+        profile = cls.user.userprofile
+        for i in range(3):
+            profile.emergency_contacts.add(EmergencyContact.objects.create(
+                name=f'Contact {i}',
+                relationship='Family',
+                phone_number=f'55500{i}',
+                email=f'contact{i}@example.com',
+            ))
+
+    def setUp(self):
+        # Open alerts and epochs live in the cache, which outlives each test's transaction
+        cache.clear()
+        self.client.force_login(self.user)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked against SQLite')
+class QueryPlanTests(HotQueryTestCase):
+    def test_active_session_lookup_uses_unique_index(self):
+        plan = SafetySession.objects.filter(user=self.user, is_active=True).explain()
+        self.assertIn('core_one_active_session_per_user', plan)
+
+    def test_unshown_alert_lookup_uses_partial_index(self):
+        plan = EmergencyAlert.objects.filter(
+            safety_session__user=self.user,
+            alert_type='voice',
+            shown_to_user=False,
+            timestamp__gte=timezone.now(),
+        ).order_by('-timestamp').explain()
+        self.assertIn('core_alert_unshown_idx', plan)
+
+    def test_alert_status_lookup_uses_index(self):
+        plan = Alert.objects.filter(user=self.user, status='active').explain()
+        self.assertIn('core_alert_user_status_idx', plan)
+
+
+class ActiveSessionTests(HotQueryTestCase):
+    def test_one_active_session_per_user(self):
+        SafetySession.objects.create(user=self.user, is_active=True)
+        SafetySession.objects.create(user=self.user, is_active=False)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SafetySession.objects.create(user=self.user, is_active=True)
+
+    @mock.patch('core.views.start_voice_monitoring_for_user')
+    def test_activating_twice_keeps_one_session(self, start_monitoring):
+        self.client.post(reverse('safety_mode'))
+        self.client.post(reverse('safety_mode'))
+        self.assertEqual(SafetySession.objects.filter(user=self.user, is_active=True).count(), 1)
+
+
+@override_settings(OUTBOX_IN_PROCESS_WORKERS=0, POLL_FAST_PATH=False)
+class QueryCountTests(HotQueryTestCase):
+    """Queries per request on the hot endpoints; a failure here means a view started doing more work"""
+
+    def setUp(self):
+        super().setUp()
+        self.session = SafetySession.objects.create(user=self.user, is_active=True)
+
+    def test_check_emergency_alerts_without_alert(self):
+        # Session, user, alert lookup
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('check_emergency_alerts'))
+        self.assertFalse(response.json()['has_emergency'])
+
+    def test_check_emergency_alerts_with_alert(self):
+        EmergencyAlert.objects.create(safety_session=self.session, alert_type='voice', location='1,2')
+        # Session, user, alert lookup, marking it shown
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('check_emergency_alerts'))
+        self.assertTrue(response.json()['has_emergency'])
+
+    def test_emergency_alert(self):
+        # Session, user, active session, savepoint, alert insert, profile, contacts,
+        # existing outbox keys, one outbox insert for every recipient, savepoint release
+        with self.assertNumQueries(10):
+            response = self.client.post(
+                reverse('emergency_alert'),
+                json.dumps({'latitude': 12.97, 'longitude': 77.59}),
+                content_type='application/json',
+            )
+        self.assertEqual(response.json(), {'status': 'success'})
+
+    def test_emergency_alert_does_not_grow_with_contacts(self):
+        for i in range(5):
+            self.user.userprofile.emergency_contacts.add(EmergencyContact.objects.create(
+                name=f'Extra {i}', relationship='Friend', phone_number=f'55510{i}', email=f'extra{i}@example.com',
+            ))
+        with self.assertNumQueries(10):
+            self.client.post(
+                reverse('emergency_alert'),
+                json.dumps({'latitude': 12.97, 'longitude': 77.59}),
+                content_type='application/json',
+            )
+        self.assertEqual(NotificationOutbox.objects.count(), 8)
+
+    def test_dispatching_twice_queues_once(self):
+        alert = EmergencyAlert.objects.create(safety_session=self.session, alert_type='voice', location='1,2')
+        self.assertEqual(get_alert_dispatcher().dispatch(alert, self.user), 3)
+        self.assertEqual(get_alert_dispatcher().dispatch(alert, self.user), 0)
+        self.assertEqual(NotificationOutbox.objects.filter(alert=alert).count(), 3)
+
+    @mock.patch('core.views.VoiceSpeechDetector')
+    def test_process_voice(self, detector):
+        detector.return_value.detect_emergency_phrase.return_value = {'is_emergency': True, 'text': 'help me'}
+        # As emergency_alert, from the voice path
+        with self.assertNumQueries(10):
+            response = self.client.post(
+                reverse('process_voice'),
+                json.dumps({'audio': 'UklGRg==', 'location': '12.97,77.59'}),
+                content_type='application/json',
+            )
+        self.assertTrue(response.json()['is_emergency'])
+
+    def test_profile(self):
+        # Session, user, profile, contacts; the template reuses the cached profile
+        with self.assertNumQueries(4):
+            self.client.get(reverse('profile'))
+
+    def test_guardian_profile(self):
+        with self.assertNumQueries(4):
+            self.client.get(reverse('guardian_profile'))
+
+
+class AudioRingBufferTests(SimpleTestCase):
+    def test_wraps_around(self):
+        ring = AudioRingBuffer(5)
+        ring.write(np.array([1, 2, 3], dtype=np.int16))
+        ring.write(np.array([4, 5, 6, 7], dtype=np.int16))
+        self.assertEqual(ring.available, 5)
+        self.assertEqual(ring.read_latest(np.empty(5, dtype=np.int16)).tolist(), [3, 4, 5, 6, 7])
+        self.assertEqual(ring.read_latest(np.empty(2, dtype=np.int16)).tolist(), [6, 7])
+
+    def test_oversized_write_keeps_the_newest_samples(self):
+        ring = AudioRingBuffer(5)
+        ring.write(np.array([1, 2], dtype=np.int16))
+        ring.write(np.arange(10, 18, dtype=np.int16))
+        self.assertEqual(ring.read_latest(np.empty(5, dtype=np.int16)).tolist(), [13, 14, 15, 16, 17])
+
+
+class FakeStreamDetector:
+    """Records the windows it is shown; reports an emergency when told to"""
+
+    def __init__(self):
+        self.windows = []
+        self.emergency = False
+
+    def detect_in_audio(self, audio):
+        self.windows.append(audio.mono().copy())
+        return {'is_emergency': self.emergency, 'text': 'help me' if self.emergency else ''}
+
+
+def _pcm(seconds, start=0):
+    samples = (np.arange(int(seconds * STREAM_SAMPLE_RATE)) + start) % 30000
+    return samples.astype('<i2').tobytes()
+
+
+class AudioStreamTests(SimpleTestCase):
+    def setUp(self):
+        self.detector = FakeStreamDetector()
+        self.stream = AudioStream(mock.Mock(id=1), 1, detector=self.detector)
+
+    def test_one_window_per_hop(self):
+        self.assertEqual(self.stream.feed(_pcm(0.5))['windows'], 0)
+        self.assertEqual(self.stream.feed(_pcm(0.5))['windows'], 1)
+        self.assertEqual(self.stream.feed(_pcm(2))['windows'], 2)
+        self.assertEqual(self.stream.feed(_pcm(1))['windows'], 1)
+        # Windows grow to three seconds and then slide
+        self.assertEqual([len(w) for w in self.detector.windows], [16000, 32000, 48000, 48000])
+
+    def test_large_payload_only_detects_the_last_windows(self):
+        payload = _pcm(10)
+        self.assertEqual(self.stream.feed(payload)['windows'], 3)
+        samples = np.frombuffer(payload, dtype='<i2')
+        self.assertEqual(self.detector.windows[-1].tolist(), samples[-48000:].tolist())
+
+    def test_detection_clears_the_window(self):
+        self.detector.emergency = True
+        result = self.stream.feed(_pcm(3))
+        self.assertEqual((result['windows'], result['is_emergency']), (1, True))
+        self.detector.emergency = False
+        self.stream.feed(_pcm(1))
+        self.assertEqual(len(self.detector.windows[-1]), 16000)
+
+    def test_odd_length_payload_is_rejected(self):
+        with self.assertRaises(StreamError):
+            self.stream.feed(b'\x00\x01\x02')
+
+
+@mock.patch('core.audio_stream.VoiceSpeechDetector')
+class StreamVoiceBusyTests(HotQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = SafetySession.objects.create(user=self.user, is_active=True)
+
+    def tearDown(self):
+        close_stream(self.session.id)
+
+    def _post(self, seconds):
+        return self.client.post(reverse('stream_voice'), _pcm(seconds), content_type='application/octet-stream')
+
+    def test_frames_are_kept_while_recognition_is_busy(self, detector):
+        detector.return_value.detect_in_audio.return_value = {'is_emergency': False, 'text': ''}
+        busy = mock.AsyncMock(side_effect=ExecutorBusy('Too many voice clips in flight', 429, 1))
+        with mock.patch('core.views.get_recognition_executor') as executor:
+            executor.return_value.run = busy
+            for expected in (1, 2):
+                response = self._post(1)
+                self.assertEqual(response.status_code, 202)
+                self.assertEqual(response.json()['pending_windows'], expected)
+                self.assertEqual(get_stream(self.user, self.session.id).samples_received, expected * STREAM_SAMPLE_RATE)
+
+        # Once recognition frees up, the deferred windows are detected with the new one
+        response = self._post(1)
+        self.assertEqual(response.json()['windows'], 3)
+        self.assertEqual(detector.return_value.detect_in_audio.call_count, 3)
+
+
+@mock.patch('core.websocket.close_old_connections')
+class VoiceStreamSocketTests(HotQueryTestCase):
+    def _connect(self, origin='http://testserver', cookie=True):
+        headers = []
+        if origin:
+            headers.append((b'origin', origin.encode()))
+        if cookie:
+            session_cookie = self.client.cookies[settings.SESSION_COOKIE_NAME]
+            headers.append((b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_cookie.value}'.encode()))
+        incoming = [{'type': 'websocket.connect'}]
+        sent = []
+
+        async def receive():
+            return incoming.pop(0) if incoming else {'type': 'websocket.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        async_to_sync(voice_stream_socket)({'type': 'websocket', 'headers': headers}, receive, send)
+        return sent[0]
+
+    def test_cross_site_origin_is_refused(self, close_old_connections):
+        self.assertEqual(self._connect(origin=None)['code'], 4403)
+        self.assertEqual(self._connect(origin='https://evil.example')['code'], 4403)
+
+    def test_anonymous_is_refused(self, close_old_connections):
+        self.assertEqual(self._connect(cookie=False)['code'], 4401)
+
+    def test_without_active_session_is_refused(self, close_old_connections):
+        self.assertEqual(self._connect()['code'], 4409)
+
+    def test_active_session_is_accepted(self, close_old_connections):
+        SafetySession.objects.create(user=self.user, is_active=True)
+        self.assertEqual(self._connect(), {'type': 'websocket.accept'})
+
+
+@mock.patch.object(VoiceMonitorManager, '_ensure_threads')
+class VoiceMonitorManagerTests(HotQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('other', 'other@example.com', 'password')
+        self.monitor = mock.Mock()
+        self.monitor.detect.return_value = 'help me'
+        self.manager = VoiceMonitorManager(monitor=self.monitor, capacity=4, workers=1)
+
+    def test_one_detection_alerts_one_user(self, ensure_threads):
+        self.manager.start(self.user)
+        self.manager.start(self.other)
+        slot = self.manager.submit_microphone_clip(object())
+        self.manager.process(slot)
+
+        self.monitor.detect.assert_called_once()
+        self.monitor._handle_emergency.assert_called_once_with(self.user, 'help me')
+        self.assertTrue(self.manager.status(self.user)['uses_microphone'])
+        self.assertFalse(self.manager.status(self.other)['uses_microphone'])
+
+    @override_settings(VOICE_MONITOR_MICROPHONE_USER='other')
+    def test_microphone_goes_to_the_configured_user(self, ensure_threads):
+        self.manager.start(self.user)
+        self.manager.start(self.other)
+        self.manager.process(self.manager.submit_microphone_clip(object()))
+        self.monitor._handle_emergency.assert_called_once_with(self.other, 'help me')
+
+    def test_clip_from_a_stopped_session_is_dropped(self, ensure_threads):
+        self.manager.start(self.user)
+        self.manager.stop(self.user)
+        self.manager.start(self.other)
+        self.assertIsNone(self.manager.submit_microphone_clip(object(), self.user.id))
+        self.assertEqual(self.manager.stats()['microphone_user'], self.other.id)
+
+
+class PhraseMatcherTests(HotQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        phrase_matching._matchers.clear()
+        self.matcher = phrase_matching.PhraseMatcher(phrase_matching.phrases_for())
+
+    def test_exact_phrase_inside_a_sentence(self):
+        match = self.matcher.match([('please help me now', 0.9)])
+        self.assertEqual((match['phrase'], match['is_emergency']), ('help me', True))
+        self.assertAlmostEqual(match['confidence'], 0.9)
+
+    def test_misheard_words_match_within_their_edit_budget(self):
+        self.assertEqual(self.matcher.match([('halp me', 0.9)])['phrase'], 'help me')
+        self.assertEqual(self.matcher.match([('call the polise', 0.9)])['phrase'], 'call the police')
+        # Three-letter words must match exactly
+        self.assertEqual(self.matcher.match([('call tha police', 0.9)])['phrase'], '')
+
+    def test_best_of_the_n_best_alternatives(self):
+        match = self.matcher.match([('hello there', 0.9), ('halp me', 0.8)])
+        self.assertEqual((match['transcript'], match['is_emergency']), ('halp me', True))
+        self.assertAlmostEqual(match['confidence'], 0.8 * (1 - 1 / 6))
+
+    def test_weak_matches_are_suppressed(self):
+        self.assertFalse(self.matcher.match([('halp me', 0.3)])['is_emergency'])
+        self.assertFalse(self.matcher.match([('help is on the way', 0.9)])['is_emergency'])
+
+    def test_safe_words_only_trigger_for_their_user(self):
+        profile = self.user.userprofile
+        profile.safe_words = 'pineapple express\n'
+        profile.save()
+        self.assertTrue(phrase_matching.get_phrase_matcher(self.user.id).match([('pineapple express', 0.9)])['is_emergency'])
+        self.assertFalse(phrase_matching.get_phrase_matcher(None).match([('pineapple express', 0.9)])['is_emergency'])
+
+    def test_phrases_follow_the_user_languages(self):
+        profile = self.user.userprofile
+        profile.voice_languages = 'hi'
+        profile.save()
+        matcher = phrase_matching.get_phrase_matcher(self.user.id)
+        self.assertTrue(matcher.match([('मुझे बचाओ', 0.9)])['is_emergency'])
+        self.assertFalse(matcher.match([('help me', 0.9)])['is_emergency'])
+
+    def test_saving_the_profile_recompiles_the_matcher(self):
+        matcher = phrase_matching.get_phrase_matcher(self.user.id)
+        self.assertIs(phrase_matching.get_phrase_matcher(self.user.id), matcher)
+        self.assertFalse(matcher.match([('code red', 0.9)])['is_emergency'])
+
+        profile = self.user.userprofile
+        profile.safe_words = 'code red'
+        profile.save()
+        rebuilt = phrase_matching.get_phrase_matcher(self.user.id)
+        self.assertIsNot(rebuilt, matcher)
+        self.assertTrue(rebuilt.match([('code red', 0.9)])['is_emergency'])
+
+    def test_phrase_edits_survive_cache_eviction(self):
+        phrase_matching.get_phrase_matcher(self.user.id)
+        # Another process edits the profile while this one's cache is wiped
+        UserProfile.objects.filter(user=self.user).update(safe_words='code red')
+        cache.clear()
+        self.assertTrue(phrase_matching.get_phrase_matcher(self.user.id).match([('code red', 0.9)])['is_emergency'])
+
+
+class AlertCoalescingRaceTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('racer', 'racer@example.com', 'password')
+        SafetySession.objects.create(user=self.user, is_active=True)
+
+    def test_racing_detections_raise_one_alert(self):
+        first_inside = threading.Event()
+        let_first_commit = threading.Event()
+
+        def dispatch(alert, user, notify, *args):
+            # The first detection's transaction stays open while the second arrives
+            first_inside.set()
+            let_first_commit.wait(5)
+            return 0
+
+        def detect():
+            try:
+                raise_voice_alert(self.user, 'help me')
+            finally:
+                close_old_connections()
+
+        with mock.patch('core.alerts.get_alert_dispatcher') as dispatcher:
+            dispatcher.return_value.dispatch.side_effect = dispatch
+            first = threading.Thread(target=detect)
+            first.start()
+            self.assertTrue(first_inside.wait(5))
+            second = threading.Thread(target=detect)
+            second.start()
+            second.join(0.3)
+            self.assertTrue(second.is_alive(), 'the second detection should wait for the first to commit')
+            let_first_commit.set()
+            first.join(5)
+            second.join(5)
+
+        alert = EmergencyAlert.objects.get()
+        self.assertEqual(alert.detection_count, 2)
+        dispatcher.return_value.dispatch.assert_called_once()
+
+    def test_rolled_back_alert_is_not_reopened(self):
+        session = SafetySession.objects.get()
+        with mock.patch('core.alerts.get_alert_dispatcher') as dispatcher:
+            dispatcher.return_value.dispatch.side_effect = RuntimeError('queue down')
+            with self.assertRaises(RuntimeError):
+                raise_voice_alert(self.user, 'help me')
+            dispatcher.return_value.dispatch.side_effect = None
+            raise_voice_alert(self.user, 'help me')
+
+        self.assertEqual(EmergencyAlert.objects.filter(safety_session=session).count(), 1)
+        self.assertEqual(dispatcher.return_value.dispatch.call_count, 2)
+
+
+@override_settings(OUTBOX_IN_PROCESS_WORKERS=0, OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_BASE_SECONDS=10)
+class OutboxTests(HotQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        session = SafetySession.objects.create(user=self.user, is_active=True)
+        self.alert = EmergencyAlert.objects.create(safety_session=session, alert_type='voice', location='1,2')
+        self.rows = [
+            NotificationOutbox.objects.create(
+                alert=self.alert, recipient=f'contact{i}@example.com', subject='Alert', body='Help', idempotency_key=f'key{i}',
+            )
+            for i in range(3)
+        ]
+
+    def _deliver(self, batch, error=None):
+        with mock.patch('core.alert_dispatcher.get_alert_dispatcher') as dispatcher:
+            dispatcher.return_value.deliver.return_value = {row.pk: error for row in batch}
+            return outbox.deliver_batch(batch)
+
+    def test_claimed_rows_belong_to_one_worker(self):
+        batch = outbox.claim_batch(10)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(len({row.claim_token for row in batch}), 1)
+        self.assertEqual(outbox.claim_batch(10), [])
+
+    def test_stuck_claims_are_taken_back_after_five_minutes(self):
+        stale = outbox.claim_batch(10)
+        NotificationOutbox.objects.update(claimed_at=timezone.now() - timedelta(minutes=4))
+        self.assertEqual(outbox.claim_batch(10), [])
+
+        NotificationOutbox.objects.update(claimed_at=timezone.now() - timedelta(minutes=6))
+        reclaimed = outbox.claim_batch(10)
+        self.assertEqual(len(reclaimed), 3)
+        # The crashed worker's late result no longer touches the rows
+        self._deliver(stale)
+        self.assertFalse(NotificationOutbox.objects.filter(status='sent').exists())
+        self._deliver(reclaimed)
+        self.assertEqual(NotificationOutbox.objects.filter(status='sent').count(), 3)
+
+    def test_backoff_grows_and_is_capped(self):
+        with mock.patch('core.outbox.random.uniform', return_value=1.0):
+            self.assertEqual(outbox._backoff(1), timedelta(seconds=10))
+            self.assertEqual(outbox._backoff(3), timedelta(seconds=40))
+            self.assertEqual(outbox._backoff(20), timedelta(seconds=300))
+
+    def test_failures_retry_then_give_up(self):
+        before = timezone.now()
+        self.assertEqual(self._deliver(outbox.claim_batch(10), RuntimeError('SMTP down')), (0, 3))
+        row = NotificationOutbox.objects.get(pk=self.rows[0].pk)
+        self.assertEqual((row.status, row.attempts, row.last_error), ('pending', 1, 'SMTP down'))
+        self.assertGreaterEqual(row.next_attempt_at, before + timedelta(seconds=8))
+        self.assertEqual(outbox.claim_batch(10), [])
+
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+        self._deliver(outbox.claim_batch(10), RuntimeError('SMTP down'))
+        self.assertEqual(set(NotificationOutbox.objects.values_list('status', 'attempts')), {('failed', 2)})
+        self.assertEqual(outbox.claim_batch(10), [])
+
+    def test_alert_status_follows_its_notifications(self):
+        outbox.update_alert_status(self.alert.id)
+        self.alert.refresh_from_db()
+        self.assertEqual(self.alert.status, 'pending')
+
+        NotificationOutbox.objects.filter(pk__in=[self.rows[0].pk, self.rows[1].pk]).update(status='failed')
+        outbox.update_alert_status(self.alert.id)
+        self.alert.refresh_from_db()
+        self.assertEqual(self.alert.status, 'pending')
+
+        NotificationOutbox.objects.filter(pk=self.rows[2].pk).update(status='failed')
+        outbox.update_alert_status(self.alert.id)
+        self.alert.refresh_from_db()
+        self.assertEqual(self.alert.status, 'failed')
+
+        NotificationOutbox.objects.filter(pk=self.rows[2].pk).update(status='sent')
+        outbox.update_alert_status(self.alert.id)
+        self.alert.refresh_from_db()
+        self.assertEqual(self.alert.status, 'sent')
+
+
+class BlockingChannel:
+    """A channel whose sends hang until released"""
+
+    batched = True
+
+    def __init__(self, name):
+        self.name = name
+        self.release = threading.Event()
+
+    def send_batch(self, notifications, deadline):
+        self.release.wait(5)
+        return {notification.pk: None for notification in notifications}
+
+
+class AlertDispatcherTests(TransactionTestCase):
+    def setUp(self):
+        self.slow = BlockingChannel('slow')
+        self.fast = BlockingChannel('fast')
+        self.fast.release.set()
+        self.dispatcher = AlertDispatcher([self.slow, self.fast], deadlines={'slow': 0.2, 'fast': 2}, workers=1)
+
+    def tearDown(self):
+        self.slow.release.set()
+
+    def test_stuck_channel_does_not_hold_up_the_others(self):
+        self.dispatcher.deliver([mock.Mock(pk=1, channel='slow')])
+        results = self.dispatcher.deliver([mock.Mock(pk=2, channel='slow'), mock.Mock(pk=3, channel='fast')])
+        self.assertIsInstance(results[2], DeadlineExceeded)
+        self.assertIsNone(results[3])
+
+    def test_deadline_miss_is_counted_once(self):
+        self.dispatcher.deliver([mock.Mock(pk=1, channel='slow'), mock.Mock(pk=2, channel='slow')])
+        self.slow.release.set()
+        for _ in range(50):
+            stats = self.dispatcher.stats()['slow']
+            if stats['count'] == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual(stats['deadline_misses'], 2)
+        # The late send itself succeeded
+        self.assertEqual((stats['count'], stats['failures']), (2, 0))
+
+    @override_settings(OUTBOX_IN_PROCESS_WORKERS=0)
+    def test_late_send_is_recorded_on_its_row(self):
+        user = User.objects.create_user('late', 'late@example.com', 'password')
+        session = SafetySession.objects.create(user=user, is_active=True)
+        alert = EmergencyAlert.objects.create(safety_session=session, alert_type='voice')
+        row = NotificationOutbox.objects.create(
+            alert=alert, channel='slow', recipient='contact@example.com', subject='Alert', body='Help', idempotency_key='late',
+        )
+
+        with mock.patch('core.alert_dispatcher.get_alert_dispatcher', return_value=self.dispatcher):
+            self.assertEqual(outbox.deliver_batch(outbox.claim_batch(10)), (0, 1))
+        row.refresh_from_db()
+        self.assertEqual(row.status, 'pending')
+
+        self.slow.release.set()
+        for _ in range(50):
+            alert.refresh_from_db()
+            if alert.status == 'sent':
+                break
+            time.sleep(0.05)
+        self.assertEqual(alert.status, 'sent')
+        row.refresh_from_db()
+        self.assertEqual(row.status, 'sent')
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_threshold_failures(self):
+        breaker = CircuitBreaker(threshold=3, reset_timeout=30)
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(threshold=5, reset_timeout=0)
+        breaker.state = OPEN
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+
+@mock.patch('core.http_client.time.sleep')
+class HttpClientTests(SimpleTestCase):
+    def _client(self, **overrides):
+        options = dict(
+            pool_size=1, connect_timeout=1, read_timeout=1, retries=2,
+            retry_budget_ratio=0, retry_budget_max=10, breaker_threshold=100, breaker_reset=30,
+        )
+        options.update(overrides)
+        client = HttpClient(**options)
+        client._session = mock.Mock()
+        return client
+
+    def test_post_is_not_retried(self, sleep):
+        import requests
+
+        client = self._client()
+        client.session.request.side_effect = requests.ConnectionError('refused')
+        with self.assertRaises(requests.ConnectionError):
+            client.post('http://gateway.example/send')
+        self.assertEqual(client.session.request.call_count, 1)
+
+        with self.assertRaises(requests.ConnectionError):
+            client.get('http://gateway.example/status')
+        self.assertEqual(client.session.request.call_count, 4)
+
+    def test_retries_stop_when_the_budget_is_spent(self, sleep):
+        import requests
+
+        client = self._client(retry_budget_max=1)
+        client.session.request.side_effect = requests.ConnectionError('refused')
+        with self.assertRaises(requests.ConnectionError):
+            client.get('http://geo.example/ip')
+        self.assertEqual(client.session.request.call_count, 2)
+        with self.assertRaises(requests.ConnectionError):
+            client.get('http://geo.example/ip')
+        self.assertEqual(client.session.request.call_count, 3)
+        self.assertEqual(client.stats()['geo.example']['retries'], 1)
+
+    def test_open_circuit_fails_fast(self, sleep):
+        import requests
+
+        client = self._client(retries=0, breaker_threshold=2)
+        client.session.request.side_effect = requests.ConnectionError('refused')
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                client.get('http://geo.example/ip')
+        with self.assertRaises(CircuitOpenError):
+            client.get('http://geo.example/ip')
+        self.assertEqual(client.session.request.call_count, 2)
+
+    def test_unexpected_error_in_trial_does_not_block_the_host(self, sleep):
+        client = self._client(breaker_threshold=1, breaker_reset=0)
+        client._host('http://geo.example/ip')[1].breaker.state = OPEN
+        client.session.request.side_effect = ValueError('bad request arguments')
+        for _ in range(2):
+            # Each call is a HALF_OPEN trial, let through because the one before settled the breaker
+            with self.assertRaises(ValueError):
+                client.get('http://geo.example/ip')
+        client.session.request.side_effect = None
+        client.session.request.return_value = mock.Mock(status_code=200)
+        self.assertEqual(client.get('http://geo.example/ip').status_code, 200)
+        self.assertEqual(client.stats()['geo.example']['circuit'], CLOSED)
+
+
+class DecodeAudioTests(SimpleTestCase):
+    def test_stereo_wav(self):
+        left, right = _tone(0.5, 44100), _tone(0.5, 44100, frequency=880)
+        audio = decode_audio(_wav(np.column_stack([left, right]).reshape(-1), 44100, channels=2))
+        self.assertEqual((audio.container, audio.sample_rate, audio.channels), ('wav', 44100, 2))
+        self.assertEqual(audio.samples.shape, (22050, 2))
+        self.assertEqual(audio.samples[:, 1].tolist(), right.tolist())
+
+    @skipUnless(_has_av(), 'decoding Opus needs PyAV')
+    def test_opus_webm(self):
+        audio = decode_audio(_webm_opus(_tone(1, 48000), 48000))
+        self.assertEqual((audio.container, audio.sample_rate, audio.channels), ('webm', 48000, 1))
+        self.assertAlmostEqual(audio.duration, 1.0, delta=0.05)
+        self.assertGreater(np.abs(audio.samples).max(), 4000)
+
+    def test_garbage_is_rejected(self):
+        for data in (b'', b'RIFF\x00\x00\x00\x00WAVEjunkjunk', b'\x1a\x45\xdf\xa3' + b'garbage' * 20):
+            with self.assertRaises(AudioDecodeError):
+                decode_audio(data)
+
+
+class VoiceActivityGateTests(SimpleTestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.recognizer = mock.Mock()
+        self.recognizer.recognize.return_value = {'text': 'help me', 'alternatives': [('help me', 0.9)], 'backend': 'test'}
+        self.detector = VoiceSpeechDetector(recognizer=self.recognizer, gate=VoiceActivityGate())
+        self.detector.gate.calibrate(100)
+
+    def _noise(self, seconds, level=100):
+        return (self.rng.normal(0, level, int(seconds * 16000))).astype(np.int16)
+
+    def _detect(self, samples):
+        return self.detector.detect_in_audio(DecodedAudio(samples.reshape(-1, 1), 16000, 1, PCM16))
+
+    def test_silence_and_noise_skip_recognition(self):
+        self.assertFalse(self._detect(np.zeros(16000, dtype=np.int16))['is_emergency'])
+        self.assertFalse(self._detect(self._noise(1))['is_emergency'])
+        self.recognizer.recognize.assert_not_called()
+
+    def test_speech_reaches_the_recognizer_trimmed(self):
+        samples = self._noise(3)
+        samples[16000:32000] += _tone(1, 16000)
+        self.assertTrue(self._detect(samples)['is_emergency'])
+        self.recognizer.recognize.assert_called_once()
+        voiced = self.recognizer.recognize.call_args[0][0]
+        # One second of tone plus the padding either side, not the whole clip
+        self.assertLess(voiced.duration, 1.5)
+        self.assertGreater(voiced.duration, 0.9)
+
+
+class RecognitionCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache = RecognitionCache(max_entries=16, ttl=60)
+        patcher = mock.patch('core.voice_detection.get_recognition_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.recognizer = mock.Mock()
+        self.recognizer.recognize.return_value = {'text': 'help me', 'alternatives': [('help me', 0.9)], 'backend': 'test'}
+        self.detector = VoiceSpeechDetector(recognizer=self.recognizer, gate=VoiceActivityGate())
+        self.detector.gate.calibrate(100)
+
+    def test_retried_upload_is_recognized_once(self):
+        clip = _wav(_tone(1, 16000), 16000)
+        self.assertTrue(self.detector.detect_emergency_phrase(clip)['is_emergency'])
+        self.assertTrue(self.detector.detect_emergency_phrase(clip)['is_emergency'])
+        self.recognizer.recognize.assert_called_once()
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_same_samples_in_another_layout_share_the_decoded_entry(self):
+        self.detector.detect_emergency_phrase(_wav(_tone(1, 16000), 16000))
+        # Different bytes, but the same samples once decoded; only the PCM key can match
+        stereo = np.column_stack([_tone(1, 16000)] * 2).reshape(-1)
+        self.assertTrue(self.detector.detect_emergency_phrase(_wav(stereo, 16000, channels=2))['is_emergency'])
+        self.recognizer.recognize.assert_called_once()
+
+    def test_no_speech_is_cached_as_a_result(self):
+        clip = _wav(np.zeros(16000, dtype=np.int16), 16000)
+        self.assertFalse(self.detector.detect_emergency_phrase(clip)['is_emergency'])
+        self.assertEqual(self.cache.get(audio_key(clip)), (True, None))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        lru = RecognitionCache(max_entries=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual([lru.get(key) for key in 'abc'], [(True, 1), (False, None), (True, 3)])
+        self.assertEqual(lru.stats()['evictions'], 1)
+
+    def test_entries_expire(self):
+        with mock.patch('core.recognition_cache.time.monotonic', return_value=1000):
+            self.cache.set('a', 1)
+        with mock.patch('core.recognition_cache.time.monotonic', return_value=1061):
+            self.assertEqual(self.cache.get('a'), (False, None))
+        self.assertEqual(self.cache.stats()['expired'], 1)
+
+    def test_shared_alias_answers_other_workers(self):
+        RecognitionCache(max_entries=16, ttl=60, alias='default').set('a', None)
+        other = RecognitionCache(max_entries=16, ttl=60, alias='default')
+        self.assertEqual(other.get('a'), (True, None))
+        self.assertEqual(other.stats()['shared_hits'], 1)
+
+
+class BlockingFetcher:
+    """Overpass stand-in that holds every request until released"""
+
+    def __init__(self, stations):
+        self.stations = stations
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, lat, lon, radius_km):
+        self.calls.append((lat, lon, radius_km))
+        if not self.release.wait(5):
+            raise TimeoutError('fetch was never released')
+        return self.stations
+
+
+class PoliceStationCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.police = PoliceStationCache(settings.POLICE_CACHE_ALIAS, precision=6, ttl=60, stale_ttl=600, fetch_timeout=5)
+        self.police.cache.clear()
+        self.addCleanup(self.police.cache.clear)
+
+    def _wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'timed out')
+            time.sleep(0.01)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        fetch = BlockingFetcher([{'name': 'Central'}])
+        results = []
+        # Nearby points fall in the same cell and so join the same flight
+        threads = [
+            threading.Thread(target=lambda i=i: results.append(self.police.get(51.5007 + i * 1e-5, -0.1246, 5, fetch)))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        self._wait_for(lambda: self.police.stats()['coalesced'] == 7)
+        fetch.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(fetch.calls), 1)
+        self.assertEqual(results, [[{'name': 'Central'}]] * 8)
+        # The query is centred on the cell and widened to cover all of it
+        self.assertGreater(fetch.calls[0][2], 5)
+        stats = self.police.stats()
+        self.assertEqual((stats['misses'], stats['fetches']), (8, 1))
+
+    def test_stale_entry_is_served_while_one_refresh_runs(self):
+        key = self.police.cell(51.5007, -0.1246, 5)[0]
+        self.police.cache.set(key, {'stations': [{'name': 'Old'}], 'fetched_at': time.time() - 120})
+        fetch = BlockingFetcher([{'name': 'New'}])
+
+        for _ in range(3):
+            self.assertEqual(self.police.get(51.5007, -0.1246, 5, fetch), [{'name': 'Old'}])
+        self._wait_for(lambda: fetch.calls)
+        fetch.release.set()
+        self._wait_for(lambda: self.police.cache.get(key)['stations'] == [{'name': 'New'}])
+
+        self.assertEqual(len(fetch.calls), 1)
+        self.assertEqual(self.police.get(51.5007, -0.1246, 5, fetch), [{'name': 'New'}])
+        stats = self.police.stats()
+        self.assertEqual((stats['stale_hits'], stats['hits']), (3, 1))
+
+    def test_failed_fetch_is_raised_and_not_cached(self):
+        def fetch(lat, lon, radius_km):
+            raise ConnectionError('overpass down')
+
+        with self.assertRaises(ConnectionError):
+            self.police.get(51.5007, -0.1246, 5, fetch)
+        self.assertIsNone(self.police.cache.get(self.police.cell(51.5007, -0.1246, 5)[0]))
+
+
+def _phrase(rate, seconds=0.6):
+    """Synthetic "word": a rising pitch with harmonics, sampled at `rate`"""
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 200 + 400 * t / seconds
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    signal = sum(np.sin(phase * k) / k for k in (1, 2, 3, 5))
+    return (signal * 6000).astype(np.int16)
+
+
+class KeywordSpotterTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _enroll(self, phrase, samples, rate, channels=1):
+        os.makedirs(os.path.join(self.directory.name, phrase), exist_ok=True)
+        with open(os.path.join(self.directory.name, phrase, 'take1.wav'), 'wb') as f:
+            f.write(_wav(samples, rate, channels))
+
+    def test_48khz_stereo_template_spots_16khz_clip(self):
+        word = _phrase(48000)
+        self._enroll('help_me', np.column_stack([word, word]).reshape(-1), 48000, channels=2)
+        spotter = KeywordSpotter.from_directory(self.directory.name)
+
+        silence = np.zeros(8000, dtype=np.int16)
+        match = spotter.spot(np.concatenate([silence, _phrase(16000), silence]), 16000)
+        self.assertIsNotNone(match)
+        self.assertEqual(match['phrase'], 'help me')
+        self.assertGreater(match['confidence'], 0.5)
+
+    def test_unrelated_clip_is_not_spotted(self):
+        self._enroll('help_me', _phrase(48000), 48000)
+        spotter = KeywordSpotter.from_directory(self.directory.name)
+        self.assertIsNone(spotter.spot(_tone(1, 16000, frequency=3000), 16000))
+
+
+class PushChannelTests(HotQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.contact = self.user.userprofile.emergency_contacts.get(name='Contact 0')
+        # A stranger who registered with the contact's email address
+        self.stranger = User.objects.create_user('stranger', 'contact0@example.com', 'password')
+        self.friend = User.objects.create_user('friend', 'friend@example.com', 'password')
+        self.subscriptions = {
+            user.username: PushSubscription.objects.create(
+                user=user, endpoint=f'https://push.example.com/{user.username}', p256dh='key', auth='auth'
+            )
+            for user in (self.stranger, self.friend)
+        }
+
+    def _recipients(self):
+        return PushChannel().recipients(self.user, list(self.user.userprofile.emergency_contacts.all()))
+
+    def test_matching_email_is_not_a_link(self):
+        self.assertEqual(self._recipients(), [])
+
+    def test_contact_link_flow(self):
+        response = self.client.get(reverse('contact_link', args=[self.contact.id]))
+        self.assertFalse(response.json()['linked'])
+        token = response.json()['token']
+
+        self.client.force_login(self.friend)
+        # Only the guardian can hand out links to their contacts
+        self.assertEqual(self.client.get(reverse('contact_link', args=[self.contact.id])).status_code, 404)
+        response = self.client.post(reverse('accept_contact_link'), {'token': token + 'x'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('accept_contact_link'), {'token': token}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self._recipients(), [f"subscription:{self.subscriptions['friend'].id}"])
+
+    def test_endpoint_of_another_account_is_refused(self):
+        data = {'endpoint': 'https://push.example.com/friend', 'keys': {'p256dh': 'mine', 'auth': 'mine'}}
+        response = self.client.post(reverse('push_subscription'), data, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        subscription = PushSubscription.objects.get(endpoint=data['endpoint'])
+        self.assertEqual((subscription.user, subscription.p256dh), (self.friend, 'key'))
+
+        self.client.force_login(self.friend)
+        response = self.client.post(reverse('push_subscription'), data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PushSubscription.objects.get(endpoint=data['endpoint']).p256dh, 'mine')
+
+    def test_send_releases_its_connection(self):
+        notification = mock.Mock(recipient=f"subscription:{self.subscriptions['friend'].id}", body='{}')
+        pywebpush = mock.Mock(WebPushException=Exception)
+        with mock.patch.dict('sys.modules', {'pywebpush': pywebpush}), \
+                mock.patch('core.alert_dispatcher.close_old_connections') as close:
+            PushChannel().send(notification, time.monotonic() + 5)
+        pywebpush.webpush.assert_called_once()
+        self.assertEqual(close.call_count, 2)
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """Reference great-circle distance in km, one pair at a time"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(min(a, 1.0)))
+
+
+class PoliceStationIndexTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'police.idx')
+
+    def _index(self, stations, **kwargs):
+        write_index(self.path, stations, **kwargs)
+        index = PoliceStationIndex(self.path)
+        self.addCleanup(index.close)
+        return index
+
+    def _stations(self, points):
+        return [{'id': i, 'name': f'Station {i}', 'lat': lat, 'lon': lon} for i, (lat, lon) in enumerate(points)]
+
+    def _brute_force(self, stations, lat, lon, k, radius_km):
+        # Coordinates are stored as float32, so compare against what the index holds
+        distances = sorted(
+            (_haversine(lat, lon, float(np.float32(s['lat'])), float(np.float32(s['lon']))), s['name'])
+            for s in stations
+        )
+        return [(name, distance) for distance, name in distances if distance <= radius_km][:k]
+
+    def _assert_matches_brute_force(self, index, stations, lat, lon, k=5, radius_km=5.0):
+        found = index.nearest(lat, lon, k, radius_km)
+        expected = self._brute_force(stations, lat, lon, k, radius_km)
+        self.assertEqual([s['name'] for s in found], [name for name, _ in expected])
+        for station, (_, distance) in zip(found, expected):
+            self.assertAlmostEqual(station['distance'], distance, places=6)
+        return found
+
+    def test_nearest_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        stations = self._stations(zip(rng.uniform(51.3, 51.7, 500), rng.uniform(-0.5, 0.3, 500)))
+        index = self._index(stations)
+        found = [
+            self._assert_matches_brute_force(index, stations, lat, lon, k=8)
+            for lat, lon in zip(rng.uniform(51.35, 51.65, 25), rng.uniform(-0.45, 0.25, 25))
+        ]
+        self.assertGreater(sum(map(len, found)), 150)
+
+    def test_radius_cuts_off_results(self):
+        stations = self._stations([(51.5, -0.1), (51.5, -0.1 + 2 / 69.4), (51.5, -0.1 + 8 / 69.4)])
+        index = self._index(stations)
+        found = self._assert_matches_brute_force(index, stations, 51.5, -0.1, k=5, radius_km=5.0)
+        self.assertEqual([s['name'] for s in found], ['Station 0', 'Station 1'])
+
+    def test_queries_on_and_across_cell_edges(self):
+        # Stations straddle the 0.05 degree grid lines around one cell corner
+        edge_lat, edge_lon = 51.5, -0.1
+        offsets = (-0.0004, -0.00001, 0.0, 0.00001, 0.0004)
+        stations = self._stations([(edge_lat + a, edge_lon + b) for a in offsets for b in offsets])
+        index = self._index(stations)
+        for lat, lon in ((edge_lat, edge_lon), (edge_lat - 1e-9, edge_lon + 1e-9), (edge_lat + 0.025, edge_lon)):
+            self._assert_matches_brute_force(index, stations, lat, lon, k=30, radius_km=3.0)
+
+    def test_queries_across_the_antimeridian(self):
+        stations = self._stations([(-17.0, 179.99), (-17.0, -179.98), (-17.0, 179.9), (-17.0, -179.8)])
+        index = self._index(stations, bbox=(-18.0, -180.0, -16.0, 180.0))
+        for lon in (179.999, -179.999, 180.0, -180.0):
+            found = self._assert_matches_brute_force(index, stations, -17.0, lon, k=4, radius_km=25.0)
+            self.assertEqual(len(found), 4)
+
+    def test_empty_index(self):
+        index = self._index([])
+        self.assertEqual(index.size, 0)
+        self.assertFalse(index.covers(51.5, -0.1))
+        self.assertEqual(index.nearest(51.5, -0.1), [])
+
+    def test_points_outside_the_extract_fall_back_to_overpass(self):
+        self._index(self._stations([(51.5, -0.1), (51.6, 0.0)]))
+        overpass = [{'name': 'Remote', 'distance': 1.0}]
+        with override_settings(POLICE_INDEX_PATH=self.path), \
+                mock.patch('core.police_stations._overpass_stations', return_value=overpass) as fallback:
+            self.assertEqual(find_nearby_police_stations(51.51, -0.09, k=1, radius_km=10)[0]['name'], 'Station 0')
+            fallback.assert_not_called()
+            self.assertEqual(find_nearby_police_stations(48.85, 2.35, k=1, radius_km=10), overpass)
+            fallback.assert_called_once_with(48.85, 2.35, 1, 10)
+
+
+class EmergencyPipelineTests(HotQueryTestCase):
+    location = {'latitude': 51.5, 'longitude': -0.1, 'city': 'London', 'country': 'UK', 'source': 'ip'}
+    stations = [{'name': 'Central', 'distance': 0.4}]
+
+    def setUp(self):
+        super().setUp()
+        self.session = SafetySession.objects.create(user=self.user, is_active=True)
+        patcher = mock.patch('core.emergency_pipeline.get_alert_dispatcher')
+        self.dispatch = patcher.start().return_value.dispatch
+        self.addCleanup(patcher.stop)
+
+    def _run(self, locate, find_police_stations, budget=2.0, grace=0.5):
+        pipeline = EmergencyPipeline(self.user, self.session, 'help me', locate, find_police_stations, budget=budget, grace=grace)
+        alert = pipeline.run()
+        alert.refresh_from_db()
+        return alert, [call.args[2] for call in self.dispatch.call_args_list]
+
+    def test_alert_is_enriched_with_location_and_stations(self):
+        alert, notified = self._run(lambda budget: self.location, lambda lat, lon: self.stations)
+        self.assertEqual(notified, ['initial', 'location'])
+        self.assertEqual(self.dispatch.call_args.args[4], self.stations)
+        self.assertEqual(alert.location, '51.5,-0.1')
+        self.assertIn('London', alert.description)
+        for stage in ('first_notification_ms', 'geolocation_ms', 'police_lookup_ms', 'location_update_ms', 'total_ms'):
+            self.assertIn(stage, alert.stage_timings)
+        self.assertNotIn('timed_out', alert.stage_timings)
+
+    def test_failing_stage_leaves_the_first_alert(self):
+        def locate(budget):
+            raise ConnectionError('geolocation down')
+
+        find_police_stations = mock.Mock()
+        alert, notified = self._run(locate, find_police_stations)
+        self.assertEqual(notified, ['initial'])
+        find_police_stations.assert_not_called()
+        self.assertIn('Locating', alert.description)
+        self.assertIn('geolocation_ms', alert.stage_timings)
+
+    def test_slow_police_lookup_gets_its_own_update(self):
+        def find_police_stations(lat, lon):
+            time.sleep(0.2)
+            return self.stations
+
+        alert, notified = self._run(lambda budget: self.location, find_police_stations, grace=0.05)
+        self.assertEqual(notified, ['initial', 'location', 'police_stations'])
+        self.assertEqual(alert.location, '51.5,-0.1')
+
+    def test_stage_past_the_budget_is_abandoned(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def find_police_stations(lat, lon):
+            release.wait(5)
+            return self.stations
+
+        started = time.monotonic()
+        alert, notified = self._run(lambda budget: self.location, find_police_stations, budget=0.3, grace=0.05)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(notified, ['initial', 'location'])
+        self.assertEqual(alert.stage_timings['timed_out'], ['police_lookup'])
+
+
+class GeoIPTests(SimpleTestCase):
+    london = {'latitude': 51.5, 'longitude': -0.1, 'city': 'London', 'country': 'GB'}
+    paris = {'latitude': 48.85, 'longitude': 2.35, 'city': 'Paris', 'country': 'FR'}
+    ranges = [
+        ('8.8.8.0', '8.8.8.255', london),
+        ('9.0.0.0', '9.0.0.9', paris),
+        ('10.0.0.0', '10.255.255.255', london),
+        # Two ranges inside one /64, so they share their high word
+        ('2606:4700::', '2606:4700::ff', london),
+        ('2606:4700::1000', '2606:4700::1fff', paris),
+        # One range spanning many high words
+        ('2a00:1450::', '2a00:1450:ffff:ffff:ffff:ffff:ffff:ffff', paris),
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'geoip.db')
+        write_geoip_database(self.path, self.ranges)
+        self.database = GeoIPDatabase(self.path)
+
+    def _city(self, ip):
+        location = self.database.lookup(ip)
+        return location and location['city']
+
+    def test_range_bounds_and_gaps(self):
+        for ip, city in (('8.8.8.0', 'London'), ('8.8.8.255', 'London'), ('9.0.0.0', 'Paris'), ('9.0.0.9', 'Paris'),
+                         ('8.8.7.255', None), ('8.8.9.0', None), ('9.0.0.10', None), ('1.1.1.1', None)):
+            self.assertEqual(self._city(ip), city, ip)
+
+    def test_ipv6_ranges_sharing_a_high_word(self):
+        for ip, city in (('2606:4700::', 'London'), ('2606:4700::ff', 'London'), ('2606:4700::100', None),
+                         ('2606:4700::1000', 'Paris'), ('2606:4700::1fff', 'Paris'), ('2606:4700::2000', None),
+                         ('2606:4700:0:1::', None), ('2a00:1450:4009::1', 'Paris'), ('2a00:1451::', None)):
+            self.assertEqual(self._city(ip), city, ip)
+
+    def test_ipv4_mapped_ipv6(self):
+        self.assertEqual(self._city('::ffff:8.8.8.8'), 'London')
+        self.assertEqual(self.database.lookup('::ffff:8.8.8.8')['source'], 'geoip')
+
+    def test_private_addresses_are_not_located(self):
+        # 10.0.0.0/8 is in the database, but a private address says nothing about where the client is
+        for ip in ('10.1.2.3', '192.168.1.1', '127.0.0.1', '::1', 'fe80::1', '::ffff:10.1.2.3', 'not an ip'):
+            self.assertIsNone(self.database.lookup(ip), ip)
+
+    def test_replaced_database_is_reloaded(self):
+        locator = GeoIPLocator(self.path, max_entries=16)
+        self.assertEqual(locator.locate('8.8.8.8')['city'], 'London')
+        self.assertEqual(locator.locate('8.8.8.8')['city'], 'London')
+        self.assertEqual(locator.stats()['hits'], 1)
+
+        write_geoip_database(self.path, [('8.8.8.0', '8.8.8.255', self.paris)])
+        mtime = os.stat(self.path).st_mtime + 10
+        os.utime(self.path, (mtime, mtime))
+        self.assertEqual(locator.locate('8.8.8.8')['city'], 'Paris')
+        self.assertIsNone(locator.locate('9.0.0.1'))
+        self.assertEqual(locator.stats()['ranges'], 1)
+
+
+class LocationTrackTests(HotQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = SafetySession.objects.create(user=self.user, is_active=True)
+
+    def _post(self, body):
+        return self.client.post(reverse('location_track'), body, content_type='application/json')
+
+    def _fixes(self, points, start=1_700_000_000_000):
+        return [{'lat': lat, 'lon': lon, 'accuracy': 5, 'timestamp': start + i * 1000} for i, (lat, lon) in enumerate(points)]
+
+    def test_ingest_validation(self):
+        self.assertEqual(self._post('not json').status_code, 400)
+        self.assertEqual(self._post({'fixes': {'lat': 1, 'lon': 2}}).status_code, 400)
+        with override_settings(LOCATION_TRACK_MAX_BATCH=2):
+            self.assertEqual(self._post({'fixes': self._fixes([(1, 2)] * 3)}).status_code, 400)
+
+        fixes = self._fixes([(51.5, -0.1), (51.6, -0.2)]) + [
+            {'lat': 95, 'lon': 0},
+            {'lat': 51.5, 'lon': -0.1, 'accuracy': -1},
+            {'lat': 51.5, 'lon': -0.1, 'timestamp': 'yesterday'},
+            'not a fix',
+        ]
+        response = self._post({'fixes': fixes})
+        self.assertEqual(response.json(), {'status': 'success', 'stored': 2, 'duplicates': 0, 'rejected': 4})
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.location, '51.6,-0.2')
+
+        self.session.is_active = False
+        self.session.save()
+        self.assertEqual(self._post({'fixes': self._fixes([(1, 2)])}).status_code, 400)
+
+    def test_retried_batch_is_stored_once(self):
+        fixes = self._fixes([(51.5, -0.1), (51.5001, -0.1001), (51.5002, -0.1002)])
+        self.assertEqual(self._post({'fixes': fixes}).json()['stored'], 3)
+        response = self._post({'fixes': fixes[1:] + self._fixes([(51.6, -0.2)], start=1_700_000_010_000) * 2})
+        self.assertEqual((response.json()['stored'], response.json()['duplicates']), (1, 3))
+        self.assertEqual(self.session.location_fixes.count(), 4)
+
+    def test_max_points_keeps_the_most_significant_points(self):
+        # A straight walk with one large detour at point 5
+        points = [(51.5, -0.1 + i * 0.001) for i in range(11)]
+        points[5] = (51.51, points[5][1])
+        self._post({'fixes': self._fixes(points)})
+        url = reverse('session_location_track', args=[self.session.id])
+
+        track = self.client.get(url, {'max_points': 3, 'tolerance': 0}).json()
+        self.assertEqual((track['total_points'], track['returned_points']), (11, 3))
+        self.assertEqual(track['points'], [[51.5, -0.1], [51.51, -0.095], [51.5, -0.09]])
+        track = self.client.get(url, {'max_points': 4, 'tolerance': 0}).json()
+        self.assertEqual(track['returned_points'], 4)
+        self.assertIn([51.51, -0.095], track['points'])
+        with override_settings(LOCATION_TRACK_MAX_POINTS=3):
+            self.assertEqual(self.client.get(url, {'max_points': 100, 'tolerance': 0}).json()['returned_points'], 3)
+
+        for params in ({'max_points': 0}, {'max_points': 1}, {'max_points': 'many'}, {'tolerance': -1}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+    def test_other_users_sessions_are_not_served(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        other_session = SafetySession.objects.create(user=other, is_active=True)
+        LocationFix.objects.create(safety_session=other_session, recorded_at=timezone.now(), latitude=1, longitude=2)
+        response = self.client.get(reverse('session_location_track', args=[other_session.id]))
+        self.assertEqual(response.status_code, 404)
+        # Fixes posted by this user only ever land on their own session
+        self._post({'fixes': self._fixes([(51.5, -0.1)])})
+        self.assertEqual(other_session.location_fixes.count(), 1)
+        self.assertEqual(self.client.get(reverse('location_track')).json()['session_id'], self.session.id)
+
+
+@override_settings(EVENTS_KEEPALIVE=30, EVENTS_REDIS_URL='')
+class EventStreamTests(HotQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        SafetySession.objects.create(user=self.user, is_active=True)
+
+    def _raise_alert(self):
+        with self.captureOnCommitCallbacks() as callbacks, mock.patch('core.alerts.get_alert_dispatcher'):
+            alert = raise_voice_alert(self.user, 'help me')
+        return alert, callbacks
+
+    def test_alert_is_streamed_once_committed(self):
+        async def scenario():
+            await self.async_client.aforce_login(self.user)
+            response = await self.async_client.get(reverse('events'))
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = aiter(response.streaming_content)
+            self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+
+            alert, callbacks = await sync_to_async(self._raise_alert)()
+            # Nothing reaches the dashboard while the alert's transaction is open
+            pending = asyncio.ensure_future(anext(chunks))
+            await asyncio.sleep(0.1)
+            self.assertFalse(pending.done())
+
+            for callback in callbacks:
+                await sync_to_async(callback)()
+            chunk = await asyncio.wait_for(pending, 2)
+            await chunks.aclose()
+            return alert, chunk
+
+        alert, chunk = async_to_sync(scenario)()
+        event, data = chunk.decode().strip().split('\n')
+        self.assertEqual(event, 'event: alert')
+        self.assertEqual(json.loads(data.removeprefix('data: '))['alert_id'], alert.id)
+
+    def test_wsgi_request_is_told_to_poll(self):
+        self.assertEqual(self.client.get(reverse('events')).status_code, 204)
+
+
+@override_settings(POLL_FAST_PATH=True)
+class PollEpochTests(HotQueryTestCase):
+    def _poll(self, url_name='voice_monitoring_status', token=None):
+        return self.client.get(reverse(url_name), {'epoch': token} if token else {})
+
+    def _token(self, url_name='voice_monitoring_status'):
+        response = self._poll(url_name)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['epoch']
+
+    def test_matching_token_is_not_modified(self):
+        token = self._token()
+        self.assertEqual(self._poll(token=token).status_code, 304)
+        response = self.client.get(reverse('voice_monitoring_status'), HTTP_IF_NONE_MATCH=f'W/"{token}"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_safety_mode_change_is_seen_once_committed(self):
+        token = self._token()
+        profile = UserProfile.objects.get(user=self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            profile.is_safety_mode_active = True
+            profile.save()
+            # Until the change commits, the old answer is still current
+            self.assertEqual(self._poll(token=token).status_code, 304)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        response = self._poll(token=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['user_safety_mode'])
+
+    def test_unrelated_saves_keep_the_token(self):
+        token = self._token()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Logging in saves last_login, and with it the whole profile
+            self.client.login(username='guardian', password='password')
+            profile = UserProfile.objects.get(user=self.user)
+            profile.phone_number = '555123'
+            profile.save()
+            UserProfile.objects.only('safe_words').get(user=self.user).save(update_fields=['safe_words'])
+        self.assertEqual(self._poll(token=token).status_code, 304)
+
+    def test_alert_is_seen_once_committed(self):
+        SafetySession.objects.create(user=self.user, is_active=True)
+        token = self._token('check_emergency_alerts')
+        with self.captureOnCommitCallbacks(execute=True), mock.patch('core.alerts.get_alert_dispatcher'):
+            raise_voice_alert(self.user, 'help me')
+        response = self._poll('check_emergency_alerts', token)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['has_emergency'])
+
+    def test_tampered_token_is_answered_in_full(self):
+        token = self._token()
+        value, signature = token.rsplit(':', 1)
+        user_id, epoch, timestamp = value.split(':')
+        for forged in (f'{user_id}:{int(epoch) + 1}:{timestamp}:{signature}', token[:-1], 'garbage'):
+            self.assertEqual(self._poll(token=forged).status_code, 200, forged)
+
+
+class ArchiveTests(HotQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.old = timezone.now() - timedelta(days=400)
+        self.old_sessions = [self._session(self.old + timedelta(days=i)) for i in range(5)]
+        self.recent_session = self._session(timezone.now() - timedelta(days=2))
+        self.active_session = SafetySession.objects.create(user=self.user, is_active=True)
+        SafetySession.objects.filter(pk=self.active_session.pk).update(start_time=self.old)
+        self.old_alert = Alert.objects.create(user=self.user, alert_type='manual', location='{}', status='resolved')
+        self.open_alert = Alert.objects.create(user=self.user, alert_type='manual', location='{}', status='active')
+        Alert.objects.filter(pk__in=[self.old_alert.pk, self.open_alert.pk]).update(created_at=self.old)
+        self.recent_alert = Alert.objects.create(user=self.user, alert_type='manual', location='{}', status='resolved')
+
+    def _session(self, when):
+        session = SafetySession.objects.create(user=self.user, is_active=False, end_time=when + timedelta(hours=1))
+        SafetySession.objects.filter(pk=session.pk).update(start_time=when)
+        alert = EmergencyAlert.objects.create(safety_session=session, alert_type='voice', location='1,2',
+                                              stage_timings={'total_ms': 12.5})
+        EmergencyAlert.objects.filter(pk=alert.pk).update(timestamp=when)
+        LocationFix.objects.create(safety_session=session, recorded_at=when, latitude=51.5, longitude=-0.1)
+        NotificationOutbox.objects.create(alert=alert, recipient='contact0@example.com', subject='Alert', body='Help',
+                                          idempotency_key=f'archive-{session.pk}')
+        return session
+
+    def _archive(self, fmt='jsonl', **options):
+        call_command('archive_incidents', older_than=180, format=fmt, output=self.root, stdout=io.StringIO(), **options)
+
+    def test_rows_are_deleted_only_after_their_files_are_written(self):
+        def write_rows(dataset, rows, fmt, root=None):
+            if dataset == 'location_fixes':
+                raise OSError('disk full')
+            return archive.write_rows(dataset, rows, fmt, root)
+
+        with mock.patch('core.management.commands.archive_incidents.write_rows', side_effect=write_rows):
+            with self.assertRaises(OSError):
+                self._archive()
+        self.assertEqual(SafetySession.objects.filter(pk__in=[s.pk for s in self.old_sessions]).count(), 5)
+        self.assertEqual(LocationFix.objects.count(), 6)
+        self.assertEqual(NotificationOutbox.objects.count(), 6)
+
+        # Running again rewrites the same files rather than archiving the sessions twice
+        self._archive()
+        self.assertEqual(len(archive.read_archive('sessions', root=self.root)), 5)
+
+    def test_newer_and_open_rows_survive(self):
+        self._archive()
+        self.assertEqual(
+            set(SafetySession.objects.values_list('pk', flat=True)), {self.recent_session.pk, self.active_session.pk}
+        )
+        self.assertEqual(set(Alert.objects.values_list('pk', flat=True)), {self.open_alert.pk, self.recent_alert.pk})
+        self.assertEqual(LocationFix.objects.get().safety_session, self.recent_session)
+        self.assertEqual(list(archive.read_archive('alerts', root=self.root)['id']), [self.old_alert.pk])
+
+    def test_chunks_smaller_than_the_table(self):
+        self._archive(chunk_size=2, delete_batch=1)
+        self.assertEqual(SafetySession.objects.count(), 2)
+        sessions = archive.read_archive('sessions', root=self.root)
+        self.assertEqual(sorted(sessions['id']), sorted(s.pk for s in self.old_sessions))
+        self.assertEqual(len(archive.read_archive('notifications', root=self.root)), 5)
+
+    def _round_trip(self, fmt):
+        self._archive(fmt)
+        alerts = archive.read_archive('emergency_alerts', user_id=self.user.id, root=self.root)
+        self.assertEqual(len(alerts), 5)
+        self.assertEqual(json.loads(alerts['stage_timings'][0]), {'total_ms': 12.5})
+        self.assertEqual(alerts['timestamp'][0], self.old)
+        fixes = archive.read_archive('location_fixes', since=self.old + timedelta(days=1),
+                                     until=self.old + timedelta(days=3), root=self.root)
+        self.assertEqual(list(fixes['recorded_at']), [self.old + timedelta(days=1), self.old + timedelta(days=2)])
+        self.assertEqual(list(fixes['latitude']), [51.5, 51.5])
+        self.assertTrue(archive.read_archive('sessions', user_id=self.user.id + 1, root=self.root).empty)
+
+    def test_jsonl_round_trip(self):
+        self._round_trip('jsonl')
+
+    @skipUnless(archive.parquet_available(), 'Parquet archives need pyarrow or fastparquet')
+    def test_parquet_round_trip(self):
+        self._round_trip('parquet')
@@ -10,13 +10,21 @@ urlpatterns = [
     path('profile/edit-contact/', views.edit_emergency_contact, name='edit_emergency_contact'),
     path('profile/delete-contact/<int:contact_id>/', views.delete_emergency_contact, name='delete_emergency_contact'),
     path('profile/get-contact/<int:contact_id>/', views.get_contact_details, name='get_contact_details'),
+    path('profile/contact-link/<int:contact_id>/', views.contact_link, name='contact_link'),
+    path('accept-contact-link/', views.accept_contact_link, name='accept_contact_link'),
     path('safety-mode/', views.safety_mode, name='safety_mode'),
     path('safety-dashboard/', views.safety_dashboard, name='safety_dashboard'),
     path('deactivate-safety/', views.deactivate_safety_mode, name='deactivate_safety_mode'),
     path('emergency-alert/', views.emergency_alert, name='emergency_alert'),
+    path('location-track/', views.location_track, name='location_track'),
+    path('location-track/<int:session_id>/', views.location_track, name='session_location_track'),
     path('police-stations/', views.get_police_stations, name='get_police_stations'),
     path('process-voice/', views.process_voice, name='process_voice'),
+    path('stream-voice/', views.stream_voice, name='stream_voice'),
+    path('voice-stats/', views.voice_stats, name='voice_stats'),
+    path('push-subscription/', views.push_subscription, name='push_subscription'),
     path('voice-monitoring-status/', views.voice_monitoring_status, name='voice_monitoring_status'),
+    path('events/', views.events, name='events'),
     path('check-emergency-alerts/', views.check_emergency_alerts, name='check_emergency_alerts'),
     path('guardian-profile/', views.guardian_profile, name='guardian_profile'),
     path('update-notification-preferences/', views.update_notification_preferences, name='update_notification_preferences'),
@@ -2,21 +2,40 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.http import JsonResponse
-from django.core.mail import send_mail
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.conf import settings
+from django.db import transaction
+from django.core import signing
+from asgiref.sync import sync_to_async
 from datetime import timedelta, datetime
 import json
 import os
 import tempfile
-from .voice_detection import VoiceSpeechDetector
-from .voice_monitor import start_voice_monitoring_for_user, stop_voice_monitoring, is_monitoring_active
-from .models import UserProfile, EmergencyContact, SafetySession, EmergencyAlert, Alert
+from .voice_detection import VoiceSpeechDetector, get_voice_gate, vad_stats
+from .voice_monitor import start_voice_monitoring_for_user, stop_voice_monitoring, is_monitoring_active, get_monitoring_status, voice_monitor_manager
+from .models import UserProfile, EmergencyContact, SafetySession, EmergencyAlert, Alert, PushSubscription
 from .forms import UserRegistrationForm, UserProfileForm, EmergencyContactForm, SafetyModeForm
-import requests
+from .alerts import raise_voice_alert, parse_location, request_location
+from .alert_coalescing import coalesce_alert, close_open_alert, session_alert_lock
+from .alert_dispatcher import get_alert_dispatcher
+from .audio_stream import buffer_frames, close_stream, detect_windows, StreamError, STREAM_SAMPLE_RATE
+from .phrase_matching import LANGUAGE_NAMES
+from .police_stations import find_nearby_police_stations
+from .police_cache import get_police_station_cache
+from .http_client import get_http_client
+from .geoip import client_ip, get_geoip_locator
+from .location_track import record_fixes, session_track, TrackError
+from .events import get_event_broker, format_event
+from .poll_state import current_epoch, epoch_token, not_modified_unless_changed, tag_epoch
+from .recognition_cache import get_recognition_cache
+from .recognition_executor import get_recognition_executor, ExecutorBusy
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 
+# Salt for the tokens that link a contact's own account to a guardian's contact entry
+CONTACT_LINK_SALT = 'core.contact-link'
+
 def register(request):
     if request.method == 'POST':
         form = UserRegistrationForm(request.POST)
@@ -28,6 +47,13 @@ def register(request):
         form = UserRegistrationForm()
     return render(request, 'core/register.html', {'form': form})
 
+def _user_profile(user):
+    """The user's profile, cached on the user so the templates reuse it"""
+    try:
+        return user.userprofile
+    except UserProfile.DoesNotExist:
+        return UserProfile.objects.create(user=user)
+
 @login_required
 def home(request):
     return render(request, 'core/home.html')
@@ -35,7 +61,7 @@ def home(request):
 @login_required
 def profile(request):
     user = request.user
-    profile, created = UserProfile.objects.get_or_create(user=user)
+    profile = _user_profile(user)
     emergency_contacts = EmergencyContact.objects.filter(user_profiles=profile)
     
     if request.method == 'POST':
@@ -51,6 +77,12 @@ def profile(request):
         profile.sms_notifications = request.POST.get('sms_notifications') == 'on'
         profile.push_notifications = request.POST.get('push_notifications') == 'on'
         
+        # Update emergency phrases
+        profile.safe_words = request.POST.get('safe_words', profile.safe_words)
+        profile.voice_languages = ','.join(
+            code for code in request.POST.getlist('voice_languages') if code in LANGUAGE_NAMES
+        )
+        
         # Handle profile image
         if 'profile_image' in request.FILES:
             # Delete old profile image if exists
@@ -65,13 +97,15 @@ def profile(request):
     context = {
         'profile': profile,
         'emergency_contacts': emergency_contacts,
+        'voice_language_choices': LANGUAGE_NAMES.items(),
+        'selected_voice_languages': (profile.voice_languages or '').split(','),
     }
     return render(request, 'core/profile.html', context)
 
 @login_required
 def guardian_profile(request):
     user = request.user
-    profile, created = UserProfile.objects.get_or_create(user=user)
+    profile = _user_profile(user)
     emergency_contacts = EmergencyContact.objects.filter(user_profiles=profile)
     
     if request.method == 'POST':
@@ -89,6 +123,12 @@ def guardian_profile(request):
         profile.sms_notifications = request.POST.get('sms_notifications') == 'on'
         profile.push_notifications = request.POST.get('push_notifications') == 'on'
         
+        # Update emergency phrases
+        profile.safe_words = request.POST.get('safe_words', profile.safe_words)
+        profile.voice_languages = ','.join(
+            code for code in request.POST.getlist('voice_languages') if code in LANGUAGE_NAMES
+        )
+        
         # Handle profile image
         if 'profile_image' in request.FILES:
             profile.profile_image = request.FILES['profile_image']
@@ -105,6 +145,8 @@ def guardian_profile(request):
     context = {
         'profile': profile,
         'emergency_contacts': emergency_contacts,
+        'voice_language_choices': LANGUAGE_NAMES.items(),
+        'selected_voice_languages': (profile.voice_languages or '').split(','),
     }
     return render(request, 'core/guardian_profile.html', context)
 
@@ -166,6 +208,30 @@ def get_contact_details(request, contact_id):
     }
     return JsonResponse(data)
 
+@login_required
+def contact_link(request, contact_id):
+    """Token the guardian sends a contact so they can link their own account"""
+    contact = get_object_or_404(EmergencyContact, id=contact_id, user_profiles__user=request.user)
+    return JsonResponse({
+        'token': signing.dumps(contact.id, salt=CONTACT_LINK_SALT),
+        'linked': contact.linked_user_id is not None,
+    })
+
+@login_required
+def accept_contact_link(request):
+    """Link the signed-in account to the contact named by a guardian's token"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+    try:
+        contact_id = signing.loads(
+            json.loads(request.body)['token'], salt=CONTACT_LINK_SALT, max_age=settings.CONTACT_LINK_MAX_AGE
+        )
+    except (ValueError, KeyError, TypeError, signing.BadSignature):
+        return JsonResponse({'status': 'error', 'message': 'Invalid or expired link'}, status=400)
+    if not EmergencyContact.objects.filter(id=contact_id).update(linked_user=request.user):
+        return JsonResponse({'status': 'error', 'message': 'Contact no longer exists'}, status=404)
+    return JsonResponse({'status': 'success'})
+
 @login_required
 def update_notification_preferences(request):
     if request.method == 'POST':
@@ -180,10 +246,11 @@ def update_notification_preferences(request):
 @login_required
 def safety_mode(request):
     if request.method == 'POST':
-        # Create a new safety session
-        session = SafetySession.objects.create(
+        # Start a safety session, or carry on with the one already active (one per user)
+        session, created = SafetySession.objects.get_or_create(
             user=request.user,
-            is_active=True
+            is_active=True,
+            defaults={'client_ip': client_ip(request)}
         )
         
         # Update user profile
@@ -194,7 +261,7 @@ def safety_mode(request):
         
         # Start voice monitoring
         try:
-            start_voice_monitoring_for_user(request.user)
+            start_voice_monitoring_for_user(request.user, session.id)
             messages.success(request, 'Safety mode activated! Voice monitoring started.')
         except Exception as e:
             messages.warning(request, f'Safety mode activated but voice monitoring failed: {str(e)}')
@@ -212,7 +279,7 @@ def deactivate_safety_mode(request):
     if request.method == 'POST':
         # Stop voice monitoring
         try:
-            stop_voice_monitoring()
+            stop_voice_monitoring(request.user)
         except Exception as e:
             print(f"Error stopping voice monitoring: {e}")
         
@@ -226,6 +293,8 @@ def deactivate_safety_mode(request):
             active_session.is_active = False
             active_session.end_time = timezone.now()
             active_session.save()
+            close_stream(active_session.id)
+            close_open_alert(active_session.id)
             
             profile = request.user.userprofile
             profile.is_safety_mode_active = False
@@ -241,18 +310,9 @@ def emergency_alert(request):
         data = json.loads(request.body)
         latitude = data.get('latitude')
         longitude = data.get('longitude')
-        map_link = data.get('map_link')
         description = data.get('description', 'Voice distress detected')
-
-        # Build location details string robustly
-        location_details = ""
-        if latitude is not None and longitude is not None:
-            location_details = f"Latitude: {latitude}, Longitude: {longitude}"
-            if not map_link:
-                map_link = f"https://maps.google.com/?q={latitude},{longitude}"
-            location_details += f"\nGoogle Maps: {map_link}"
-        else:
-            location_details = "Location not available"
+        location = f"{latitude},{longitude}" if latitude is not None and longitude is not None else ""
+        location = request_location(request, location)
 
         active_session = SafetySession.objects.filter(
             user=request.user,
@@ -260,36 +320,31 @@ def emergency_alert(request):
         ).first()
 
         if active_session:
-            alert = EmergencyAlert.objects.create(
-                safety_session=active_session,
-                alert_type='voice',
-                location=f"{latitude},{longitude}" if latitude and longitude else "",
-                description=description,
-                shown_to_user=False
-            )
+            # The alert and its queued notifications are stored together; sending happens off the request path
+            with session_alert_lock(active_session), transaction.atomic():
+                alert, notify = coalesce_alert(active_session, description, location=location)
+                if notify is None:
+                    # Already reported recently; contacts hear about it in the next follow-up
+                    return JsonResponse({'status': 'success', 'merged': True, 'detection_count': alert.detection_count})
 
-            # Send alerts to emergency contacts
-            for contact in request.user.userprofile.emergency_contacts.all():
-                message = (
-                    f"EMERGENCY ALERT from {request.user.get_full_name()}!\n"
-                    f"Location: {location_details}\n"
-                    f"Description: {description}\n"
-                    f"Time: {timezone.now()}\n"
-                )
-                send_mail(
-                    'EMERGENCY ALERT - SirenShield',
-                    message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [contact.email],
-                    fail_silently=False,
-                )
+                # Queue alerts to emergency contacts on every channel
+                get_alert_dispatcher().dispatch(alert, request.user, notify, parse_location(location))
 
             return JsonResponse({'status': 'success'})
 
     return JsonResponse({'status': 'error'}, status=400)
 
+def _busy_response(error):
+    """Fast rejection when the recognition executor is saturated"""
+    response = JsonResponse({
+        'status': 'error',
+        'message': str(error)
+    }, status=error.status)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
 @login_required
-def process_voice(request):
+async def process_voice(request):
     if request.method == 'POST':
         try:
             # Handle both FormData and JSON requests
@@ -319,45 +374,23 @@ def process_voice(request):
                         'message': 'No audio data received'
                     }, status=400)
 
-            # Use speech recognition to detect emergency phrase
-            detector = VoiceSpeechDetector()
-            result = detector.detect_emergency_phrase(audio_data)
+            # Recognition runs on the bounded executor so it never ties up a request worker
+            user = await request.auser()
+            detector = VoiceSpeechDetector(gate=get_voice_gate(user.id), user_id=user.id)
+            try:
+                result = await get_recognition_executor().run(user.id, detector.detect_emergency_phrase, audio_data)
+            except ExecutorBusy as e:
+                return _busy_response(e)
             
             print(f"Speech recognition result: {result}")
             
             # Check if emergency phrase was detected
             if result['is_emergency']:
-                # Parse location if available
-                location_data = {}
-                if location:
-                    try:
-                        lat, lng = location.split(',')
-                        location_data = {
-                            'latitude': float(lat),
-                            'longitude': float(lng)
-                        }
-                    except:
-                        pass
+                # Create emergency alert and notify contacts, locating the client's IP if the browser sent no position
+                location = request_location(request, location)
+                alert = await sync_to_async(raise_voice_alert)(user, result['text'], location)
                 
-                # Create emergency alert
-                active_session = SafetySession.objects.filter(
-                    user=request.user,
-                    is_active=True
-                ).first()
-                
-                if active_session:
-                    alert = EmergencyAlert.objects.create(
-                        safety_session=active_session,
-                        alert_type='voice',
-                        location=location,
-                        description=f"Emergency phrase detected: '{result['text']}'",
-                        shown_to_user=False
-                    )
-                    
-                    # Send alerts to emergency contacts
-                    for contact in request.user.userprofile.emergency_contacts.all():
-                        send_emergency_alert(contact, request.user, location_data)
-                    
+                if alert:
                     return JsonResponse({
                         'status': 'success',
                         'message': 'Emergency alert sent',
@@ -389,49 +422,95 @@ def process_voice(request):
         'message': 'Invalid request method'
     }, status=400)
 
-def send_emergency_alert(contact, user, location):
-    """Send emergency alert to a contact"""
+@login_required
+async def stream_voice(request):
+    """Accept a batch of streamed 16 kHz mono PCM16 frames for continuous detection"""
+    if request.method != 'POST':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Invalid request method'
+        }, status=400)
+
+    if request.headers.get('X-Sample-Rate', str(STREAM_SAMPLE_RATE)) != str(STREAM_SAMPLE_RATE):
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Streamed audio must be {STREAM_SAMPLE_RATE} Hz mono PCM16'
+        }, status=400)
+
+    user = await request.auser()
+    active_session = await SafetySession.objects.filter(
+        user=user,
+        is_active=True
+    ).afirst()
+
+    if not active_session:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Safety mode not active'
+        }, status=400)
+
     try:
-        # Parse location data
-        lat = location.get('latitude')
-        lng = location.get('longitude')
-        
-        # Create OpenStreetMap link
-        map_link = f"https://www.openstreetmap.org/?mlat={lat}&mlon={lng}#map=15/{lat}/{lng}"
-        
-        subject = f"EMERGENCY ALERT: {user.get_full_name()} needs help!"
-        message = f"""
-        EMERGENCY ALERT!
-        
-        {user.get_full_name()} has triggered an emergency alert.
-        They may be in danger and need immediate assistance.
-        
-        Location: {map_link}
-        Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        
-        Please respond immediately!
-        """
-        
-        send_mail(
-            subject,
-            message,
-            settings.EMAIL_HOST_USER,
-            [contact.email],
-            fail_silently=False,
-        )
-        
-        # Update alert status
-        Alert.objects.filter(user=user, status='active').update(
-            status='notified',
-            notified_at=datetime.now()
-        )
-        
-    except Exception as e:
-        print(f"Error sending alert: {str(e)}")
+        # Frames are buffered right away, so no audio is lost while recognition is busy
+        stream, pending = buffer_frames(user, active_session.id, request.body, request.headers.get('X-Location', ''))
+    except StreamError as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+    if not pending:
+        return JsonResponse({'status': 'success', 'windows': 0, 'is_emergency': False, 'detected_text': '', 'alert_sent': False})
+
+    try:
+        result = await get_recognition_executor().run(user.id, detect_windows, user, stream)
+    except ExecutorBusy as e:
+        # The windows stay pending and are detected with the next batch
+        return JsonResponse({
+            'status': 'buffered',
+            'message': str(e),
+            'pending_windows': pending
+        }, status=202)
+
+    return JsonResponse({'status': 'success', **result})
+
+@login_required
+def location_track(request, session_id=None):
+    """Record a batch of location fixes, or fetch a session's simplified track"""
+    if request.method == 'POST':
+        active_session = SafetySession.objects.filter(user=request.user, is_active=True).first()
+        if not active_session:
+            return JsonResponse({'status': 'error', 'message': 'Safety mode is not active'}, status=400)
+        try:
+            stored, duplicates, rejected = record_fixes(active_session, json.loads(request.body).get('fixes'))
+        except (ValueError, AttributeError) as e:
+            return JsonResponse({'status': 'error', 'message': str(e) if isinstance(e, TrackError) else 'Invalid request body'}, status=400)
+        return JsonResponse({'status': 'success', 'stored': stored, 'duplicates': duplicates, 'rejected': rejected})
+
+    if request.method == 'GET':
+        sessions = SafetySession.objects.filter(user=request.user)
+        if session_id is None:
+            session = sessions.filter(is_active=True).order_by('-start_time').first()
+            if not session:
+                return JsonResponse({'error': 'No active safety session'}, status=404)
+        else:
+            session = get_object_or_404(sessions, id=session_id)
+        try:
+            tolerance = float(request.GET['tolerance']) if request.GET.get('tolerance') else None
+            max_points = int(request.GET['max_points']) if request.GET.get('max_points') else None
+            if tolerance is not None and not 0 <= tolerance < float('inf'):
+                raise ValueError(tolerance)
+            # A track is at least its two endpoints; larger requests are capped at LOCATION_TRACK_MAX_POINTS
+            if max_points is not None and max_points < 2:
+                raise ValueError(max_points)
+            track = session_track(session, tolerance_m=tolerance, max_points=max_points)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid tolerance or max_points'}, status=400)
+        return JsonResponse(track)
+
+    return JsonResponse({'error': 'Invalid request method'}, status=400)
 
 @login_required
 def get_police_stations(request):
-    """Get nearby police stations using OpenStreetMap Overpass API"""
+    """Get nearby police stations from the offline index, or the Overpass API outside it"""
     if request.method == 'GET':
         try:
             lat = request.GET.get('lat')
@@ -440,60 +519,66 @@ def get_police_stations(request):
             if not lat or not lon:
                 return JsonResponse({'error': 'Location coordinates required'}, status=400)
             
-            # Overpass API query for police stations within 5km
-            query = f"""
-            [out:json][timeout:25];
-            (
-              node["amenity"="police"](around:5000,{lat},{lon});
-            );
-            out body;
-            >;
-            out skel qt;
-            """
-            
-            response = requests.get(
-                'https://overpass-api.de/api/interpreter',
-                params={'data': query}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                stations = []
-                
-                for element in data.get('elements', []):
-                    station = {
-                        'id': element.get('id'),
-                        'lat': element.get('lat'),
-                        'lon': element.get('lon'),
-                        'name': element.get('tags', {}).get('name', 'Police Station'),
-                        'address': element.get('tags', {}).get('addr:street', ''),
-                        'phone': element.get('tags', {}).get('phone', '')
-                    }
-                    stations.append(station)
-                
-                return JsonResponse({'stations': stations})
-            
-            return JsonResponse({'error': 'Failed to fetch police stations'}, status=500)
+            stations = find_nearby_police_stations(float(lat), float(lon))
+            return JsonResponse({'stations': stations})
             
+        except ValueError:
+            return JsonResponse({'error': 'Invalid location coordinates'}, status=400)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     
     return JsonResponse({'error': 'Invalid request method'}, status=400)
 
+@not_modified_unless_changed
 @login_required
 def voice_monitoring_status(request):
     """Check if voice monitoring is active"""
     if request.method == 'GET':
-        return JsonResponse({
-            'is_monitoring': is_monitoring_active(),
-            'user_safety_mode': request.user.userprofile.is_safety_mode_active
-        })
+        # Read before the state so a change racing this request bumps past the token we hand out
+        token = epoch_token(request.user.id, current_epoch(request.user.id))
+        monitoring = get_monitoring_status(request.user)
+        if monitoring:
+            # Per-clip counters change without bumping the epoch, so a 304 would serve them stale
+            monitoring = {key: value for key, value in monitoring.items() if key not in ('last_clip_at', 'clips', 'detections')}
+        return tag_epoch(JsonResponse({
+            'is_monitoring': is_monitoring_active(request.user),
+            'monitoring': monitoring,
+            'user_safety_mode': request.user.userprofile.is_safety_mode_active,
+            'epoch': token,
+        }), token)
     return JsonResponse({'error': 'Invalid request method'}, status=400)
 
+@login_required
+async def events(request):
+    """Server-Sent Events stream of the user's alert and monitoring state changes"""
+    if not isinstance(request, ASGIRequest):
+        # WSGI would buffer an endless stream; 204 tells EventSource to give up so the page polls instead
+        return HttpResponse(status=204)
+    user = await request.auser()
+
+    async def stream():
+        broker = get_event_broker()
+        subscription = broker.subscribe(user.id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                message = await subscription.next(settings.EVENTS_KEEPALIVE)
+                # Idle connections get a comment line so proxies keep them open
+                yield format_event(message) if message else ": keepalive\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@not_modified_unless_changed
 @login_required
 def check_emergency_alerts(request):
-    """Check for recent emergency alerts"""
+    """Check for recent emergency alerts; pass back `epoch` to skip the check until one is raised"""
     if request.method == 'GET':
+        token = epoch_token(request.user.id, current_epoch(request.user.id))
         # Get the most recent unshown emergency alert for this user
         recent_alert = EmergencyAlert.objects.filter(
             safety_session__user=request.user,
@@ -507,14 +592,67 @@ def check_emergency_alerts(request):
             recent_alert.shown_to_user = True
             recent_alert.save()
             
-            return JsonResponse({
+            return tag_epoch(JsonResponse({
                 'has_emergency': True,
                 'alert_id': recent_alert.id,
                 'description': recent_alert.description,
                 'location': recent_alert.location,
-                'timestamp': recent_alert.timestamp.isoformat()
-            })
+                'timestamp': recent_alert.timestamp.isoformat(),
+                'epoch': token,
+            }), token)
         
-        return JsonResponse({'has_emergency': False})
+        return tag_epoch(JsonResponse({'has_emergency': False, 'epoch': token}), token)
     
     return JsonResponse({'error': 'Invalid request method'}, status=400)
+
+
+@login_required
+def voice_stats(request):
+    """Voice pipeline counters for this worker process (staff only)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return JsonResponse({
+        'voice_activity_gate': vad_stats(),
+        'recognition_executor': get_recognition_executor().stats(),
+        'voice_monitor': voice_monitor_manager.stats(),
+        'recognition_cache': get_recognition_cache().stats(),
+        'alert_channels': get_alert_dispatcher().stats(),
+        'police_station_cache': get_police_station_cache().stats(),
+        'http_client': get_http_client().stats(),
+        'geoip': get_geoip_locator().stats(),
+        'events': get_event_broker().stats(),
+    })
+
+
+@login_required
+def push_subscription(request):
+    """Save or remove this browser's web push subscription"""
+    if request.method == 'GET':
+        return JsonResponse({'public_key': settings.WEBPUSH_VAPID_PUBLIC_KEY})
+
+    try:
+        data = json.loads(request.body)
+        endpoint = data['endpoint']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'status': 'error', 'message': 'Invalid subscription'}, status=400)
+
+    if request.method == 'DELETE':
+        PushSubscription.objects.filter(user=request.user, endpoint=endpoint).delete()
+        return JsonResponse({'status': 'success'})
+
+    if request.method == 'POST':
+        keys = data.get('keys') or {}
+        if not keys.get('p256dh') or not keys.get('auth'):
+            return JsonResponse({'status': 'error', 'message': 'Subscription keys missing'}, status=400)
+        subscription, created = PushSubscription.objects.get_or_create(
+            endpoint=endpoint,
+            defaults={'user': request.user, 'p256dh': keys['p256dh'], 'auth': keys['auth']},
+        )
+        if subscription.user_id != request.user.id:
+            # Endpoints are unique; taking over another account's would redirect its pushes
+            return JsonResponse({'status': 'error', 'message': 'Subscription belongs to another account'}, status=409)
+        if not created:
+            PushSubscription.objects.filter(pk=subscription.pk).update(p256dh=keys['p256dh'], auth=keys['auth'])
+        return JsonResponse({'status': 'success'})
+
+    return JsonResponse({'error': 'Invalid request method'}, status=400)
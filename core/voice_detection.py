@@ -1,68 +1,348 @@
-import speech_recognition as sr
-import tempfile
-import os
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
 from django.conf import settings
+from .audio_decoding import decode_audio, AudioDecodeError, DecodedAudio
+from .recognition import get_recognizer
+from .phrase_matching import get_phrase_matcher
+from .recognition_cache import get_recognition_cache, audio_key
+
+# Process-wide counters for the voice activity gate
+_vad_stats = {
+    'clips_seen': 0,
+    'clips_rejected': 0,
+    'recognizer_calls_saved': 0,
+    'seconds_received': 0.0,
+    'seconds_trimmed': 0.0,
+}
+_vad_stats_lock = threading.Lock()
+
+
+def vad_stats():
+    """Snapshot of the voice activity gate counters"""
+    with _vad_stats_lock:
+        return dict(_vad_stats)
+
+
+# Every clip is normalized to this format before voice activity detection and recognition
+TARGET_SAMPLE_RATE = 16000
+
+# Filter taps per polyphase branch; higher is sharper and slower
+TAPS_PER_PHASE = 16
+
+
+def _polyphase_filter(up, down):
+    """Kaiser-windowed sinc low-pass for resampling by up/down, split into `up` branches.
+
+    Branch p holds taps h[p], h[p + up], ... reversed, so that a window of
+    input samples ending at the current position is a plain dot product.
+    Downsampling widens every branch so the filter spans the same stretch
+    of input whatever the ratio.
+    """
+    taps_per_phase = TAPS_PER_PHASE * max(1, -(-down // up))
+    length = up * taps_per_phase
+    cutoff = 0.9 / max(up, down)
+    # Centred on a whole sample, matching the delay AudioNormalizer compensates for
+    n = np.arange(length) - (length - 1) // 2
+    h = up * cutoff * np.sinc(cutoff * n) * np.kaiser(length, 5.0)
+    return np.ascontiguousarray(h.reshape(taps_per_phase, up).T[:, ::-1], dtype=np.float32)
+
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def _get_polyphase_filter(up, down):
+    with _filters_lock:
+        branches = _filters.get((up, down))
+        if branches is None:
+            branches = _filters[(up, down)] = _polyphase_filter(up, down)
+        return branches
+
+
+class AudioNormalizer:
+    """Downmix and resample PCM16 audio to TARGET_SAMPLE_RATE mono.
+
+    Resampling uses a vectorised polyphase FIR filter: each of the `up`
+    branches computes every up-th output sample as one matrix-vector product
+    over a strided view of the input. Working buffers are kept between clips,
+    so one normalizer must not be shared between threads; use
+    get_audio_normalizer().
+    """
+
+    def __init__(self, target_rate=TARGET_SAMPLE_RATE):
+        self.target_rate = target_rate
+        self._mono = np.empty(0, dtype=np.float32)
+        self._padded = np.empty(0, dtype=np.float32)
+        self._output = np.empty(0, dtype=np.float32)
+
+    def _buffer(self, name, size):
+        buffer = getattr(self, name)
+        if len(buffer) < size:
+            # Grow geometrically so a stream of similar clips settles on one allocation
+            buffer = np.empty(max(size, 2 * len(buffer)), dtype=np.float32)
+            setattr(self, name, buffer)
+        return buffer[:size]
+
+    def normalize(self, audio):
+        """Return `audio` as TARGET_SAMPLE_RATE mono PCM16 DecodedAudio"""
+        if audio.sample_rate == self.target_rate and audio.channels == 1:
+            return audio
+
+        frames = audio.samples.shape[0]
+        mono = self._buffer('_mono', frames)
+        if audio.channels == 1:
+            mono[:] = audio.samples[:, 0]
+        else:
+            np.mean(audio.samples, axis=1, dtype=np.float32, out=mono)
+
+        if audio.sample_rate == self.target_rate:
+            resampled = mono
+        else:
+            resampled = self._resample(mono, audio.sample_rate)
+
+        samples = np.empty((len(resampled), 1), dtype=np.int16)
+        np.clip(resampled, -32768, 32767, out=resampled)
+        np.rint(resampled, out=samples[:, 0], casting='unsafe')
+        return DecodedAudio(samples, self.target_rate, 1, audio.container)
+
+    def _resample(self, mono, rate):
+        divisor = math.gcd(self.target_rate, rate)
+        up, down = self.target_rate // divisor, rate // divisor
+        branches = _get_polyphase_filter(up, down)
+        taps = branches.shape[1]
+
+        # Centre the filter so the output is not delayed
+        delay = (up * taps - 1) // 2
+        frames = len(mono)
+        out_frames = -(-frames * up // down)
+        last_base = ((out_frames - 1) * down + delay) // up
+
+        # Zero padding on both sides covers every window the filter touches
+        padded = self._buffer('_padded', max(frames, last_base + 1) + taps)
+        padded[:taps - 1] = 0
+        padded[taps - 1:taps - 1 + frames] = mono
+        padded[taps - 1 + frames:] = 0
+        windows = np.lib.stride_tricks.sliding_window_view(padded, taps)
+
+        output = self._buffer('_output', out_frames)
+        for residue in range(min(up, out_frames)):
+            start = residue * down + delay
+            base = start // up
+            count = len(range(residue, out_frames, up))
+            output[residue::up] = windows[base:base + count * down:down] @ branches[start % up]
+        return output
+
+
+_normalizers = threading.local()
+
+
+def get_audio_normalizer():
+    """The calling thread's normalizer, whose buffers are reused across clips"""
+    normalizer = getattr(_normalizers, 'normalizer', None)
+    if normalizer is None:
+        normalizer = _normalizers.normalizer = AudioNormalizer()
+    return normalizer
+
+
+def normalize_audio(audio):
+    """Downmix and resample decoded audio to 16 kHz mono PCM16"""
+    return get_audio_normalizer().normalize(audio)
+
+
+class VoiceActivityGate:
+    """Cheap speech/no-speech decision run before any recognizer.
+
+    Clips are split into short frames and scored on energy against a running
+    noise floor, zero-crossing rate and spectral flatness. Clips without
+    enough voiced frames are rejected; the rest are trimmed to the voiced
+    region. The noise floor is updated from every clip's unvoiced frames.
+    """
+
+    def __init__(self, frame_seconds=0.02, energy_ratio=4.0, min_speech_seconds=0.2,
+                 padding_seconds=0.2, max_flatness=0.5, max_zero_crossing=0.5,
+                 noise_adapt_rate=0.1, min_noise_rms=30.0):
+        self.frame_seconds = frame_seconds
+        self.energy_ratio = energy_ratio
+        self.min_speech_seconds = min_speech_seconds
+        self.padding_seconds = padding_seconds
+        self.max_flatness = max_flatness
+        self.max_zero_crossing = max_zero_crossing
+        self.noise_adapt_rate = noise_adapt_rate
+        self.min_noise_power = min_noise_rms ** 2
+        self.noise_power = None
+        self._lock = threading.Lock()
+
+    @property
+    def noise_rms(self):
+        """Current noise floor as an RMS amplitude (PCM16 units)"""
+        return float(np.sqrt(self.noise_power or self.min_noise_power))
+
+    @property
+    def speech_threshold_rms(self):
+        """RMS amplitude a frame needs to be considered speech"""
+        return self.noise_rms * float(np.sqrt(self.energy_ratio))
+
+    def calibrate(self, noise_rms):
+        """Start from a previously measured noise floor instead of learning it afresh"""
+        with self._lock:
+            self.noise_power = max(float(noise_rms) ** 2, self.min_noise_power)
+
+    def _update_noise_floor(self, quiet_power):
+        with self._lock:
+            if self.noise_power is None:
+                self.noise_power = quiet_power
+            else:
+                self.noise_power += self.noise_adapt_rate * (quiet_power - self.noise_power)
+            self.noise_power = max(self.noise_power, self.min_noise_power)
+
+    def _voiced_frames(self, frames, loud):
+        """Apply the zero-crossing and flatness tests to the loud frames only"""
+        candidates = frames[loud]
+        signs = np.signbit(candidates)
+        zero_crossing = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / candidates.shape[1]
+
+        power = np.abs(np.fft.rfft(candidates, axis=1)) ** 2 + 1e-10
+        flatness = np.exp(np.log(power).mean(axis=1)) / power.mean(axis=1)
+
+        voiced = loud.copy()
+        voiced[loud] = (zero_crossing < self.max_zero_crossing) & (flatness < self.max_flatness)
+        return voiced
+
+    def process(self, samples, sample_rate):
+        """Return the voiced part of 1-D PCM16 `samples`, or None for no speech"""
+        frame_length = max(1, int(self.frame_seconds * sample_rate))
+        n_frames = len(samples) // frame_length
+        duration = len(samples) / float(sample_rate)
+
+        voiced_region = None
+        if n_frames:
+            frames = samples[:n_frames * frame_length].reshape(n_frames, frame_length).astype(np.float32)
+            power = np.einsum('ij,ij->i', frames, frames) / frame_length
+
+            if self.noise_power is None:
+                self._update_noise_floor(float(np.percentile(power, 10)))
+
+            loud = power > self.noise_power * self.energy_ratio
+            voiced = self._voiced_frames(frames, loud) if loud.any() else loud
+
+            if voiced.sum() * self.frame_seconds >= self.min_speech_seconds:
+                indexes = np.flatnonzero(voiced)
+                padding = int(self.padding_seconds / self.frame_seconds)
+                first = max(0, indexes[0] - padding) * frame_length
+                last = min(n_frames, indexes[-1] + 1 + padding) * frame_length
+                voiced_region = samples[first:last]
+
+            quiet = power[~loud]
+            if quiet.size:
+                self._update_noise_floor(float(quiet.mean()))
+
+        with _vad_stats_lock:
+            _vad_stats['clips_seen'] += 1
+            _vad_stats['seconds_received'] += duration
+            if voiced_region is None:
+                _vad_stats['clips_rejected'] += 1
+                _vad_stats['recognizer_calls_saved'] += 1
+            else:
+                _vad_stats['seconds_trimmed'] += duration - len(voiced_region) / float(sample_rate)
+
+        return voiced_region
+
+
+# One gate (and so one noise floor) per recently active user
+_gates = OrderedDict()
+_gates_lock = threading.Lock()
+MAX_TRACKED_GATES = 1024
+
+
+def get_voice_gate(key):
+    """Return the voice activity gate tracking the noise floor for `key`"""
+    with _gates_lock:
+        gate = _gates.pop(key, None) or VoiceActivityGate()
+        _gates[key] = gate
+        if len(_gates) > MAX_TRACKED_GATES:
+            _gates.popitem(last=False)
+        return gate
+
 
 class VoiceSpeechDetector:
-    def __init__(self):
-        self.recognizer = sr.Recognizer()
-        self.emergency_phrase = "help me"
+    def __init__(self, recognizer=None, gate=None, user_id=None):
+        self.recognizer = recognizer or get_recognizer()
+        self.gate = gate or VoiceActivityGate()
+        self.user_id = user_id
+
+    @property
+    def matcher(self):
+        """The user's compiled phrase matcher, loaded on first use"""
+        return get_phrase_matcher(self.user_id)
     
     def detect_emergency_phrase(self, audio_data):
-        """Detect if the audio contains the emergency phrase 'help me'"""
+        """Detect if the audio contains one of the user's emergency phrases"""
+        cache = get_recognition_cache()
         try:
-            # Create a temporary file to save the audio data
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
-            
-            # Use speech recognition to convert audio to text
-            with sr.AudioFile(temp_file_path) as source:
-                audio = self.recognizer.record(source)
-                
-                # Try to recognize speech
-                try:
-                    text = self.recognizer.recognize_google(audio).lower()
-                    print(f"Recognized text: {text}")
-                    
-                    # Check if the emergency phrase is in the recognized text
-                    is_emergency = self.emergency_phrase in text
-                    
-                    return {
-                        'text': text,
-                        'is_emergency': is_emergency,
-                        'confidence': 1.0 if is_emergency else 0.0
-                    }
-                    
-                except sr.UnknownValueError:
-                    print("Speech recognition could not understand audio")
-                    return {
-                        'text': '',
-                        'is_emergency': False,
-                        'confidence': 0.0
-                    }
-                except sr.RequestError as e:
-                    print(f"Could not request results from speech recognition service; {e}")
-                    return {
-                        'text': '',
-                        'is_emergency': False,
-                        'confidence': 0.0
-                    }
-                    
+            # Retried uploads are answered from the cache before any decoding
+            upload_key = audio_key(audio_data)
+            found, result = cache.get(upload_key)
+            if not found:
+                # Decode the clip in memory (WAV, raw PCM16 or WebM/Opus) and bring it to 16 kHz mono
+                audio = normalize_audio(decode_audio(audio_data))
+                pcm_key = audio_key(audio.samples)
+                found, result = cache.get(pcm_key)
+                if not found:
+                    result = self._recognize(audio)
+                    cache.set(pcm_key, result)
+                cache.set(upload_key, result)
+            return self._match(result)
+        except AudioDecodeError as e:
+            print(f"Error decoding audio: {e}")
         except Exception as e:
             print(f"Error processing audio: {e}")
+        return self._match(None)
+
+    def detect_in_audio(self, audio):
+        """Detect the emergency phrase in already decoded audio"""
+        try:
+            return self._match(self._recognize(audio))
+        except Exception as e:
+            print(f"Error processing audio: {e}")
+            return self._match(None)
+
+    def _recognize(self, audio):
+        """Recognizer result for the voiced part of the clip, or None if it holds no speech"""
+        audio = normalize_audio(audio)
+
+        # Skip recognition entirely for silence and background noise
+        voiced = self.gate.process(audio.mono(), audio.sample_rate)
+        if voiced is None:
+            return None
+        audio = DecodedAudio(voiced.reshape(-1, 1), audio.sample_rate, 1, audio.container)
+
+        # Local keyword spotting, optionally confirmed by Google
+        result = self.recognizer.recognize(audio)
+        if result['text']:
+            print(f"Recognized text: {result['text']} ({result['backend']})")
+        else:
+            print("Speech recognition could not understand audio")
+        return result
+
+    def _match(self, result):
+        """Score every alternative transcript against the user's phrases"""
+        if result is None:
             return {
                 'text': '',
                 'is_emergency': False,
                 'confidence': 0.0
             }
-        finally:
-            # Clean up temporary file
-            if 'temp_file_path' in locals():
-                try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
+
+        match = self.matcher.match(result['alternatives'])
+        return {
+            'text': match['transcript'] if match['is_emergency'] else result['text'],
+            'is_emergency': match['is_emergency'],
+            'phrase': match['phrase'],
+            'confidence': match['confidence']
+        }
 
 # For backward compatibility
 class VoiceEmotionDetector(VoiceSpeechDetector):
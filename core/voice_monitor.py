@@ -1,84 +1,133 @@
-import speech_recognition as sr
-import pyaudio
-import wave
+import functools
+import queue
+import socket
 import threading
 import time
-import os
-import tempfile
-import requests
+import numpy as np
 from django.conf import settings
-from django.core.mail import send_mail
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections
 from .models import UserProfile, EmergencyContact, SafetySession, EmergencyAlert
-from datetime import datetime
+from .recognition import get_recognizer, audio_from_source
+from .voice_detection import VoiceActivityGate, normalize_audio
+from .phrase_matching import get_phrase_matcher
+from .emergency_pipeline import run_emergency_pipeline
+from .http_client import get_http_client
+from .geoip import locate_ip, routable_ip
+from .police_stations import find_nearby_police_stations
+from .events import publish_event, EVENT_MONITORING
+
+# Session states in the VoiceMonitorManager table
+FREE = 0
+ACTIVE = 1
+
+# Noise floor measured on each input device, shared across restarts and workers
+CALIBRATION_KEY = 'voice-calibration:{}:{}'
+CALIBRATION_TIMEOUT = 24 * 60 * 60
+
+
+class MonitorCapacityError(Exception):
+    """Raised when every monitoring slot is in use"""
+
 
 class VoiceMonitor:
+    """Microphone capture, recognition and emergency handling shared by all monitored sessions"""
+
     def __init__(self):
-        self.recognizer = sr.Recognizer()
-        self.microphone = sr.Microphone()
-        self.is_monitoring = False
-        self.emergency_phrase = "help me"
-        self.monitor_thread = None
-        
-        # Adjust for ambient noise
-        with self.microphone as source:
-            self.recognizer.adjust_for_ambient_noise(source, duration=1)
-    
-    def start_monitoring(self, user):
-        """Start monitoring voice for emergency phrases"""
-        if self.is_monitoring:
-            return False
-        
-        self.is_monitoring = True
-        self.monitor_thread = threading.Thread(target=self._monitor_voice, args=(user,))
-        self.monitor_thread.daemon = True
-        self.monitor_thread.start()
-        print(f"Voice monitoring started for user: {user.username}")
-        return True
-    
-    def stop_monitoring(self):
-        """Stop voice monitoring"""
-        self.is_monitoring = False
-        if self.monitor_thread:
-            self.monitor_thread.join(timeout=1)
-        print("Voice monitoring stopped")
-    
-    def _monitor_voice(self, user):
-        """Main monitoring loop"""
-        while self.is_monitoring:
-            try:
-                # Listen for audio input
-                with self.microphone as source:
-                    print("Listening for voice input...")
-                    audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=5)
-                
-                # Try to recognize speech
-                try:
-                    text = self.recognizer.recognize_google(audio).lower()
-                    print(f"Recognized: {text}")
-                    
-                    # Check for emergency phrase
-                    if self.emergency_phrase in text:
-                        print(f"Emergency phrase detected: {text}")
-                        self._handle_emergency(user, text)
-                    
-                except sr.UnknownValueError:
-                    print("Could not understand audio")
-                except sr.RequestError as e:
-                    print(f"Could not request results: {e}")
-                
-                # Small delay to prevent excessive CPU usage
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"Error in voice monitoring: {e}")
-                time.sleep(2)
+        # speech_recognition, PyAudio and the microphone are only touched on first capture,
+        # so importing this module stays cheap and works on servers without audio devices
+        self._recognizer = None
+        self._speech_recognizer = None
+        self._microphone = None
+        self._lock = threading.Lock()
+
+        # The gate tracks the noise floor from every clip instead of a one-off calibration
+        self.gate = VoiceActivityGate()
+
+    @property
+    def recognizer(self):
+        with self._lock:
+            if self._recognizer is None:
+                import speech_recognition as sr
+                self._recognizer = sr.Recognizer()
+                self._recognizer.dynamic_energy_threshold = False
+                self._recognizer.energy_threshold = self.gate.speech_threshold_rms
+            return self._recognizer
+
+    @property
+    def speech_recognizer(self):
+        with self._lock:
+            if self._speech_recognizer is None:
+                self._speech_recognizer = get_recognizer()
+            return self._speech_recognizer
+
+    @property
+    def microphone(self):
+        """Open the input device on first use, seeding the gate from its cached calibration"""
+        with self._lock:
+            if self._microphone is None:
+                import speech_recognition as sr
+                self._microphone = sr.Microphone()
+                noise_rms = cache.get(self._calibration_key())
+                if noise_rms is not None:
+                    self.gate.calibrate(noise_rms)
+                    print(f"Using cached noise floor for input device: {noise_rms:.0f} RMS")
+            return self._microphone
+
+    def _calibration_key(self):
+        device = self._microphone.device_index if self._microphone is not None else None
+        return CALIBRATION_KEY.format(socket.gethostname(), 'default' if device is None else device)
+
+    def capture_clip(self):
+        """Listen for one phrase on the microphone; returns voiced audio or None"""
+        microphone = self.microphone
+        recognizer = self.recognizer
+        with microphone as source:
+            print("Listening for voice input...")
+            audio = recognizer.listen(source, timeout=5, phrase_time_limit=5)
+
+        # Drop silence and noise before it reaches a recognizer
+        clip = normalize_audio(audio_from_source(audio))
+        voiced = self.gate.process(clip.mono(), clip.sample_rate)
+        recognizer.energy_threshold = self.gate.speech_threshold_rms
+        cache.set(self._calibration_key(), self.gate.noise_rms, CALIBRATION_TIMEOUT)
+        if voiced is None:
+            return None
+        clip.samples = voiced.reshape(-1, 1)
+        return clip
+
+    def detect(self, clip, user_id=None):
+        """Return the matching transcript if the clip holds one of the user's emergency phrases, else None"""
+        # Spot the phrase locally, confirming with Google when reachable
+        result = self.speech_recognizer.recognize(clip)
+        text = result['text']
+        if not text:
+            print("Could not understand audio")
+            return None
+
+        print(f"Recognized: {text} ({result['backend']})")
+        match = get_phrase_matcher(user_id).match(result['alternatives'])
+        if match['is_emergency']:
+            print(f"Emergency phrase detected: {match['transcript']} (confidence {match['confidence']:.2f})")
+            return match['transcript']
+        return None
     
-    def _get_user_location(self):
-        """Get user's current location using IP geolocation"""
+    def _get_user_location(self, timeout=None, client_ip=None):
+        """Get user's location from their IP: the offline GeoIP database first, then ipapi.co"""
+        location_info = locate_ip(client_ip)
+        if location_info:
+            print(f"Location detected offline: {location_info['city']}, {location_info['country']} at {location_info['latitude']}, {location_info['longitude']}")
+            return location_info
+
+        if not client_ip or not routable_ip(client_ip) or not settings.GEOIP_REMOTE_LOOKUP:
+            print(f"No location for client IP {client_ip or 'unknown'}")
+            return self._get_fallback_location()
+
         try:
             # Get location from IP
-            print("Attempting to get location from IP...")
-            response = requests.get('https://ipapi.co/json/', timeout=10)
+            print(f"Attempting to get location for {client_ip} from {settings.IP_GEOLOCATION_URL}...")
+            response = get_http_client().get(settings.IP_GEOLOCATION_URL.format(ip=client_ip), timeout=timeout)
             print(f"Response status: {response.status_code}")
             
             if response.status_code == 200:
@@ -93,7 +142,8 @@ class VoiceMonitor:
                     'region': data.get('region', 'Unknown'),
                     'postal': data.get('postal', ''),
                     'timezone': data.get('timezone', 'Unknown'),
-                    'accuracy': 'IP-based (approximate)'
+                    'accuracy': 'IP-based (approximate)',
+                    'source': 'ipapi'
                 }
                 
                 if location_info['latitude'] and location_info['longitude']:
@@ -121,70 +171,16 @@ class VoiceMonitor:
             'region': 'Delhi',
             'postal': '',
             'timezone': 'Asia/Kolkata',
-            'accuracy': 'Fallback (default)'
+            'accuracy': 'Fallback (default)',
+            'source': 'default'
         }
     
     def _find_nearby_police_stations(self, lat, lon):
-        """Find nearby police stations using OpenStreetMap API"""
-        try:
-            # Overpass API query for police stations within 5km
-            query = f"""
-            [out:json][timeout:25];
-            (
-              node["amenity"="police"](around:5000,{lat},{lon});
-            );
-            out body;
-            >;
-            out skel qt;
-            """
-            
-            response = requests.get(
-                'https://overpass-api.de/api/interpreter',
-                params={'data': query}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                stations = []
-                
-                for element in data.get('elements', []):
-                    station = {
-                        'id': element.get('id'),
-                        'lat': element.get('lat'),
-                        'lon': element.get('lon'),
-                        'name': element.get('tags', {}).get('name', 'Police Station'),
-                        'address': element.get('tags', {}).get('addr:street', ''),
-                        'phone': element.get('tags', {}).get('phone', ''),
-                        'distance': self._calculate_distance(lat, lon, element.get('lat'), element.get('lon'))
-                    }
-                    stations.append(station)
-                
-                # Sort by distance
-                stations.sort(key=lambda x: x['distance'])
-                return stations[:5]  # Return top 5 nearest stations
-            
-        except Exception as e:
-            print(f"Error finding police stations: {e}")
-        
-        return []
-    
-    def _calculate_distance(self, lat1, lon1, lat2, lon2):
-        """Calculate distance between two points using Haversine formula"""
-        import math
-        
-        R = 6371  # Earth's radius in kilometers
-        
-        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        
-        return R * c
+        """Find nearby police stations, from the offline index where it covers the location"""
+        return find_nearby_police_stations(lat, lon)
     
     def _handle_emergency(self, user, detected_text):
-        """Handle emergency situation"""
+        """Handle emergency situation: alert contacts at once, then follow up with location"""
         try:
             # Check if user has active safety session
             active_session = SafetySession.objects.filter(
@@ -196,136 +192,282 @@ class VoiceMonitor:
                 print("No active safety session found")
                 return
             
-            # Get user's location
-            location_data = self._get_user_location()
-            location_str = ""
-            
-            if location_data:
-                lat = location_data['latitude']
-                lon = location_data['longitude']
-                location_str = f"{lat},{lon}"
-                
-                # Find nearby police stations
-                police_stations = self._find_nearby_police_stations(lat, lon)
-                print(f"Found {len(police_stations)} nearby police stations")
-                
-                # Create Google Maps links
-                user_maps_link = f"https://maps.google.com/?q={lat},{lon}"
-                nearest_police_maps_link = ""
-                if police_stations:
-                    nearest_police_maps_link = f"https://maps.google.com/?q={police_stations[0]['lat']},{police_stations[0]['lon']}"
-                
-                # Create emergency alert with detailed location
-                alert = EmergencyAlert.objects.create(
-                    safety_session=active_session,
-                    alert_type='voice',
-                    location=location_str,
-                    description=f"Emergency phrase detected: '{detected_text}'. Location: {location_data['city']}, {location_data['country']}. Coordinates: {lat}, {lon}",
-                    shown_to_user=False
-                )
-                
-                # Get user's emergency contacts
-                try:
-                    user_profile = user.userprofile
-                    emergency_contacts = user_profile.emergency_contacts.all()
-                    
-                    if emergency_contacts:
-                        # Send email alerts with location and police stations
-                        for contact in emergency_contacts:
-                            self._send_emergency_email(contact, user, detected_text, location_data, police_stations, user_maps_link, nearest_police_maps_link)
-                        
-                        print(f"Emergency alerts sent to {len(emergency_contacts)} contacts")
-                        
-                        # Print police station information
-                        if police_stations:
-                            print("\n=== NEARBY POLICE STATIONS ===")
-                            for i, station in enumerate(police_stations, 1):
-                                print(f"{i}. {station['name']}")
-                                print(f"   Address: {station['address']}")
-                                print(f"   Phone: {station['phone']}")
-                                print(f"   Distance: {station['distance']:.2f} km")
-                                print(f"   Map: https://maps.google.com/?q={station['lat']},{station['lon']}")
-                                print()
-                            
-                            # Print navigation instruction
-                            if nearest_police_maps_link:
-                                print(f"🚨 EMERGENCY: Navigate to nearest police station: {nearest_police_maps_link}")
-                        else:
-                            print("No nearby police stations found")
-                    else:
-                        print("No emergency contacts found")
-                        
-                except UserProfile.DoesNotExist:
-                    print("User profile not found")
-            else:
-                # Create alert without location
-                alert = EmergencyAlert.objects.create(
-                    safety_session=active_session,
-                    alert_type='voice',
-                    location='',
-                    description=f"Emergency phrase detected: '{detected_text}'. Location unavailable.",
-                    shown_to_user=False
-                )
-                
-                # Send alerts without location
-                try:
-                    user_profile = user.userprofile
-                    emergency_contacts = user_profile.emergency_contacts.all()
-                    
-                    if emergency_contacts:
-                        for contact in emergency_contacts:
-                            self._send_emergency_email(contact, user, detected_text, None, [], "", "")
-                        
-                        print(f"Emergency alerts sent to {len(emergency_contacts)} contacts (no location)")
-                    else:
-                        print("No emergency contacts found")
-                        
-                except UserProfile.DoesNotExist:
-                    print("User profile not found")
+            alert = run_emergency_pipeline(
+                user,
+                active_session,
+                detected_text,
+                functools.partial(self._get_user_location, client_ip=active_session.client_ip),
+                self._find_nearby_police_stations,
+            )
+            if alert is not None:
+                print(f"Emergency pipeline finished for alert {alert.id}")
             
         except Exception as e:
             print(f"Error handling emergency: {e}")
     
-    def _send_emergency_email(self, contact, user, detected_text, location_data=None, police_stations=None, user_maps_link="", nearest_police_maps_link=""):
-        """Send emergency email to contact"""
-        try:
-            # Use the same subject and message as manual emergency alert
-            lat = location_data['latitude'] if location_data and 'latitude' in location_data else None
-            lng = location_data['longitude'] if location_data and 'longitude' in location_data else None
-            map_link = f"https://maps.google.com/?q={lat},{lng}" if lat and lng else "Location not available"
-            location_details = f"Latitude: {lat}, Longitude: {lng}\nGoogle Maps: {map_link}" if lat and lng else "Location not available"
-
-            subject = f"EMERGENCY ALERT: {user.get_full_name()} needs help!"
-            message = (
-                f"EMERGENCY ALERT from {user.get_full_name()}!\n"
-                f"Location: {location_details}\n"
-                f"Description: {detected_text}\n"
-                f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"\nPlease respond immediately!"
-            )
+class SessionTable:
+    """Fixed-capacity, array-backed state for monitored sessions.
 
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [contact.email],
-                fail_silently=False,
-            )
-            print(f"Emergency email sent to {contact.email}")
+    Every session costs one row across a handful of preallocated arrays,
+    so memory use is fixed by the capacity rather than by activity.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.user_id = np.zeros(capacity, dtype=np.int64)
+        self.session_id = np.zeros(capacity, dtype=np.int64)
+        self.state = np.zeros(capacity, dtype=np.int8)
+        self.scheduled = np.zeros(capacity, dtype=np.bool_)
+        self.started_at = np.zeros(capacity, dtype=np.float64)
+        self.last_clip_at = np.zeros(capacity, dtype=np.float64)
+        self.clips = np.zeros(capacity, dtype=np.int32)
+        self.detections = np.zeros(capacity, dtype=np.int32)
+        # At most one clip waits per session; newer clips replace older ones
+        self.pending = np.empty(capacity, dtype=object)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._slots = {}
+
+    @property
+    def bytes_per_session(self):
+        columns = (self.user_id, self.session_id, self.state, self.scheduled,
+                   self.started_at, self.last_clip_at, self.clips, self.detections, self.pending)
+        return sum(column.itemsize for column in columns)
+
+    @property
+    def active_count(self):
+        return len(self._slots)
+
+    def slot_for(self, user_id):
+        return self._slots.get(user_id)
+
+    def active_slots(self):
+        return list(self._slots.values())
+
+    def allocate(self, user_id, session_id):
+        if not self._free:
+            raise MonitorCapacityError(f"All {self.capacity} voice monitoring slots are in use")
+        slot = self._free.pop()
+        self.user_id[slot] = user_id
+        self.session_id[slot] = session_id or 0
+        self.state[slot] = ACTIVE
+        self.scheduled[slot] = False
+        self.started_at[slot] = time.time()
+        self.last_clip_at[slot] = 0.0
+        self.clips[slot] = 0
+        self.detections[slot] = 0
+        self._slots[user_id] = slot
+        return slot
+
+    def release(self, slot):
+        del self._slots[int(self.user_id[slot])]
+        self.state[slot] = FREE
+        self.pending[slot] = None
+        self._free.append(slot)
+
+    def row(self, slot):
+        return {
+            'user_id': int(self.user_id[slot]),
+            'session_id': int(self.session_id[slot]) or None,
+            'is_monitoring': bool(self.state[slot] == ACTIVE),
+            'started_at': float(self.started_at[slot]),
+            'last_clip_at': float(self.last_clip_at[slot]) or None,
+            'clips': int(self.clips[slot]),
+            'detections': int(self.detections[slot]),
+        }
+
+
+class VoiceMonitorManager:
+    """Voice monitoring for many users, served by a fixed pool of worker threads.
+
+    The server microphone belongs to at most one session at a time: the
+    configured VOICE_MONITOR_MICROPHONE_USER, or else the first session
+    started. Its clips are recognized once, for that session only. Every
+    other session is monitored from its own audio, streamed over
+    /ws/voice-stream/ or uploaded to /process-voice/.
+    """
+
+    def __init__(self, monitor=None, capacity=None, workers=None):
+        self.monitor = monitor or VoiceMonitor()
+        self.table = SessionTable(capacity or settings.VOICE_MONITOR_MAX_SESSIONS)
+        self.worker_count = workers or settings.VOICE_MONITOR_WORKERS
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._capture_thread = None
+        self._microphone_slot = None
+
+    def _may_use_microphone(self, user):
+        owner = settings.VOICE_MONITOR_MICROPHONE_USER
+        return self._microphone_slot is None and (not owner or owner == user.username)
+
+    def start(self, user, session_id=None):
+        """Start monitoring for a user; returns False if already monitoring"""
+        with self._lock:
+            if self.table.slot_for(user.id) is not None:
+                return False
+            slot = self.table.allocate(user.id, session_id)
+            if self._may_use_microphone(user):
+                self._microphone_slot = slot
+            self._ensure_threads()
+        print(f"Voice monitoring started for user: {user.username}")
+        publish_event(user.id, EVENT_MONITORING, {'is_monitoring': True})
+        return True
+
+    def stop(self, user):
+        """Stop monitoring for a user; returns False if they were not monitored"""
+        with self._lock:
+            slot = self.table.slot_for(user.id)
+            if slot is None:
+                return False
+            if slot == self._microphone_slot:
+                self._microphone_slot = None
+            self.table.release(slot)
+        print(f"Voice monitoring stopped for user: {user.username}")
+        publish_event(user.id, EVENT_MONITORING, {'is_monitoring': False})
+        return True
+
+    def stop_all(self):
+        with self._lock:
+            slots = self.table.active_slots()
+            user_ids = [int(self.table.user_id[slot]) for slot in slots]
+            for slot in slots:
+                self.table.release(slot)
+            self._microphone_slot = None
+        print("Voice monitoring stopped")
+        for user_id in user_ids:
+            publish_event(user_id, EVENT_MONITORING, {'is_monitoring': False})
+
+    def status(self, user):
+        with self._lock:
+            slot = self.table.slot_for(user.id)
+            if slot is None:
+                return None
+            return {**self.table.row(slot), 'uses_microphone': slot == self._microphone_slot}
+
+    def is_active(self, user=None):
+        with self._lock:
+            if user is None:
+                return self.table.active_count > 0
+            return self.table.slot_for(user.id) is not None
+
+    def stats(self):
+        microphone_user = self._microphone_user()
+        with self._lock:
+            return {
+                'active_sessions': self.table.active_count,
+                'capacity': self.table.capacity,
+                'workers': self.worker_count,
+                'queued': self._queue.qsize(),
+                'microphone_user': microphone_user,
+                'bytes_per_session': self.table.bytes_per_session,
+            }
+
+    def submit_microphone_clip(self, clip, user_id=None):
+        """Hand a microphone clip to the session that owns the microphone, if any.
+
+        With `user_id`, the clip is dropped unless that user still owns the
+        microphone, so audio heard during one session never reaches the next.
+        """
+        with self._lock:
+            slot = self._microphone_slot
+            if slot is None or self.table.state[slot] != ACTIVE:
+                return None
+            if user_id is not None and int(self.table.user_id[slot]) != user_id:
+                return None
+            self.table.pending[slot] = clip
+            if self.table.scheduled[slot]:
+                return slot
+            self.table.scheduled[slot] = True
+        self._queue.put(slot)
+        return slot
+
+    def _microphone_user(self):
+        with self._lock:
+            slot = self._microphone_slot
+            return int(self.table.user_id[slot]) if slot is not None else None
+
+    def _ensure_threads(self):
+        """Start the worker pool and capture thread once a session owns the microphone"""
+        if self._microphone_slot is None:
+            return
+        while len(self._workers) < self.worker_count:
+            worker = threading.Thread(target=self._worker_loop, name=f'voice-monitor-{len(self._workers)}')
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+        if self._capture_thread is None or not self._capture_thread.is_alive():
+            self._capture_thread = threading.Thread(target=self._capture_loop, name='voice-monitor-capture')
+            self._capture_thread.daemon = True
+            self._capture_thread.start()
+
+    def _capture_loop(self):
+        """Listen on the microphone while a session owns it"""
+        import speech_recognition as sr
+
+        while True:
+            user_id = self._microphone_user()
+            if user_id is None:
+                return
+            try:
+                clip = self.monitor.capture_clip()
+            except sr.WaitTimeoutError:
+                continue
+            except Exception as e:
+                print(f"Error in voice monitoring: {e}")
+                time.sleep(2)
+                continue
+
+            if clip is not None:
+                self.submit_microphone_clip(clip, user_id)
+
+    def _worker_loop(self):
+        while True:
+            self.process(self._queue.get())
+
+    def process(self, slot):
+        """Recognize a session's waiting clip and handle a detection for that session's user"""
+        with self._lock:
+            clip = self.table.pending[slot]
+            self.table.pending[slot] = None
+            self.table.scheduled[slot] = False
+            if clip is None or self.table.state[slot] != ACTIVE:
+                return
+            user_id = int(self.table.user_id[slot])
+            self.table.clips[slot] += 1
+            self.table.last_clip_at[slot] = time.time()
+
+        try:
+            text = self.monitor.detect(clip, user_id)
+            if text:
+                with self._lock:
+                    self.table.detections[slot] += 1
+                user = User.objects.get(pk=user_id)
+                self.monitor._handle_emergency(user, text)
         except Exception as e:
-            print(f"Error sending emergency email: {e}")
+            print(f"Error processing voice clip for user {user_id}: {e}")
+        finally:
+            close_old_connections()
 
-# Global voice monitor instance
-voice_monitor = VoiceMonitor()
 
-def start_voice_monitoring_for_user(user):
+# Global voice monitor manager
+voice_monitor_manager = VoiceMonitorManager()
+
+def start_voice_monitoring_for_user(user, session_id=None):
     """Start voice monitoring for a specific user"""
-    return voice_monitor.start_monitoring(user)
+    return voice_monitor_manager.start(user, session_id)
+
+def stop_voice_monitoring(user=None):
+    """Stop voice monitoring for a user, or for everyone"""
+    if user is None:
+        voice_monitor_manager.stop_all()
+        return True
+    return voice_monitor_manager.stop(user)
 
-def stop_voice_monitoring():
-    """Stop voice monitoring"""
-    voice_monitor.stop_monitoring()
+def is_monitoring_active(user=None):
+    """Check if voice monitoring is active for a user, or for anyone"""
+    return voice_monitor_manager.is_active(user)
 
-def is_monitoring_active():
-    """Check if voice monitoring is active"""
-    return voice_monitor.is_monitoring 
\ No newline at end of file
+def get_monitoring_status(user):
+    """Monitoring state for a user, or None if they are not monitored"""
+    return voice_monitor_manager.status(user)
@@ -0,0 +1,132 @@
+import json
+from http import cookies
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, HASH_SESSION_KEY, get_user_model
+from django.db import close_old_connections
+from django.http.request import split_domain_port, validate_host
+from django.utils.crypto import constant_time_compare
+
+from .audio_stream import buffer_frames, detect_windows, StreamError
+from .models import SafetySession
+from .recognition_executor import get_recognition_executor, ExecutorBusy
+
+VOICE_STREAM_PATH = '/ws/voice-stream/'
+
+
+def _headers(scope):
+    return {
+        name.decode('latin1').lower(): value.decode('latin1')
+        for name, value in scope.get('headers', [])
+    }
+
+
+def _origin_allowed(headers):
+    """Reject cross-site WebSocket connections, which CSRF middleware cannot see"""
+    origin = headers.get('origin')
+    if not origin:
+        return False
+    host, _ = split_domain_port(urlsplit(origin).netloc)
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+    return validate_host(host, allowed_hosts)
+
+
+def _authenticate(headers):
+    """Resolve the logged-in user and their active safety session from the session cookie"""
+    close_old_connections()
+    try:
+        cookie = cookies.SimpleCookie(headers.get('cookie', ''))
+        morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+        if morsel is None:
+            return None, None
+
+        session = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value)
+        user_id = session.get(SESSION_KEY)
+        if user_id is None:
+            return None, None
+
+        user = get_user_model()._default_manager.filter(pk=user_id, is_active=True).first()
+        if user is None or not constant_time_compare(session.get(HASH_SESSION_KEY, ''), user.get_session_auth_hash()):
+            return None, None
+
+        active_session = SafetySession.objects.filter(user=user, is_active=True).first()
+        return user, active_session
+    finally:
+        close_old_connections()
+
+
+async def _close(send, code):
+    await send({'type': 'websocket.close', 'code': code})
+
+
+async def voice_stream_socket(scope, receive, send):
+    """Continuous voice streaming over a WebSocket.
+
+    Binary messages carry 16 kHz mono PCM16 frames; text messages carry JSON
+    such as {"location": "lat,lng"}. A JSON result is sent back whenever a
+    detection window completes.
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    headers = _headers(scope)
+    if not _origin_allowed(headers):
+        await _close(send, 4403)
+        return
+
+    user, active_session = await sync_to_async(_authenticate)(headers)
+    if user is None:
+        await _close(send, 4401)
+        return
+    if active_session is None:
+        await _close(send, 4409)
+        return
+
+    await send({'type': 'websocket.accept'})
+    location = ''
+
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            break
+
+        if message.get('text'):
+            try:
+                location = json.loads(message['text']).get('location', location)
+            except (ValueError, AttributeError):
+                pass
+            continue
+
+        payload = message.get('bytes')
+        if not payload:
+            continue
+
+        try:
+            # Frames are buffered right away, so no audio is lost while recognition is busy
+            stream, pending = buffer_frames(user, active_session.id, payload, location)
+        except StreamError as e:
+            await send({'type': 'websocket.send', 'text': json.dumps({'status': 'error', 'message': str(e)})})
+            continue
+        if not pending:
+            continue
+
+        try:
+            # Recognition may block, so it runs on the bounded recognition executor
+            result = await get_recognition_executor().run(user.id, detect_windows, user, stream)
+        except ExecutorBusy as e:
+            # The windows stay pending and are detected with the next frames
+            await send({'type': 'websocket.send', 'text': json.dumps({
+                'status': 'buffered',
+                'message': str(e),
+                'pending_windows': pending,
+            })})
+            continue
+
+        if result['windows']:
+            await send({'type': 'websocket.send', 'text': json.dumps({'status': 'success', **result})})
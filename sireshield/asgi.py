@@ -2,6 +2,9 @@
 ASGI config for sireshield project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django, including the Server-Sent Events stream at /events/,
+which only streams under ASGI; WebSocket connections are routed to the
+handlers in ``websocket_routes``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +16,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sireshield.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up so the handlers can use the ORM
+from core.websocket import VOICE_STREAM_PATH, voice_stream_socket  # noqa: E402
+
+websocket_routes = {
+    VOICE_STREAM_PATH: voice_stream_socket,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        handler = websocket_routes.get(scope['path'])
+        if handler is None:
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        await handler(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -86,6 +86,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'sireshield.wsgi.application'
+ASGI_APPLICATION = 'sireshield.asgi.application'
 
 
 # Database
@@ -175,6 +176,192 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', '')
 
+# Voice Recognition
+# 'cascade' spots the emergency phrase locally and confirms it with Google,
+# 'keyword_spotter' never leaves the server and 'google' transcribes every clip remotely
+VOICE_RECOGNIZER = os.getenv('VOICE_RECOGNIZER', 'cascade')
+VOICE_REMOTE_CONFIRMATION = os.getenv('VOICE_REMOTE_CONFIRMATION', 'True') == 'True'
+KEYWORD_TEMPLATES_DIR = os.getenv('KEYWORD_TEMPLATES_DIR', os.path.join(BASE_DIR, 'keyword_templates'))
+KEYWORD_SPOTTER_THRESHOLD = float(os.getenv('KEYWORD_SPOTTER_THRESHOLD', 0.35))
+
+# Emergency phrases: built-in languages used when a user has not chosen any,
+# and the minimum match confidence (edit-distance score x recognizer confidence)
+EMERGENCY_PHRASE_LANGUAGES = os.getenv('EMERGENCY_PHRASE_LANGUAGES', 'en').split(',')
+EMERGENCY_MATCH_THRESHOLD = float(os.getenv('EMERGENCY_MATCH_THRESHOLD', 0.5))
+
+# Recognition runs on a bounded pool; requests beyond the queue get a 503 with Retry-After
+RECOGNITION_WORKERS = int(os.getenv('RECOGNITION_WORKERS', 4))
+RECOGNITION_QUEUE_SIZE = int(os.getenv('RECOGNITION_QUEUE_SIZE', 16))
+RECOGNITION_PER_USER_LIMIT = int(os.getenv('RECOGNITION_PER_USER_LIMIT', 2))
+RECOGNITION_RETRY_AFTER = int(os.getenv('RECOGNITION_RETRY_AFTER', 5))
+
+# Recognition results cached by audio content so retried uploads skip decoding and recognition;
+# set RECOGNITION_CACHE_ALIAS to a CACHES alias to share results between worker processes
+RECOGNITION_CACHE_SIZE = int(os.getenv('RECOGNITION_CACHE_SIZE', 2048))
+RECOGNITION_CACHE_TTL = int(os.getenv('RECOGNITION_CACHE_TTL', 300))
+RECOGNITION_CACHE_ALIAS = os.getenv('RECOGNITION_CACHE_ALIAS', '')
+
+# Server-side voice monitoring: fixed session table and worker pool per process
+VOICE_MONITOR_MAX_SESSIONS = int(os.getenv('VOICE_MONITOR_MAX_SESSIONS', 512))
+VOICE_MONITOR_WORKERS = int(os.getenv('VOICE_MONITOR_WORKERS', 4))
+
+# Username whose safety session may listen on the server microphone. Empty lets the
+# first monitored session take it; other sessions stream their own audio
+VOICE_MONITOR_MICROPHONE_USER = os.getenv('VOICE_MONITOR_MICROPHONE_USER', '')
+
+# Shared cache for alert coalescing and per-user state. LocMemCache is per process;
+# deployments with several workers should point this at Redis or Memcached, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Dashboards receive alert and monitoring events over Server-Sent Events from /events/, which
+# needs the ASGI server. Each connection buffers up to EVENTS_QUEUE_SIZE events and gets a
+# keepalive comment every EVENTS_KEEPALIVE seconds. With several worker processes, events are
+# relayed through the Redis channel EVENTS_CHANNEL at EVENTS_REDIS_URL (`pip install redis`),
+# which defaults to the cache's Redis when CACHE_BACKEND is a Redis cache
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 100))
+EVENTS_KEEPALIVE = int(os.getenv('EVENTS_KEEPALIVE', 15))
+EVENTS_REDIS_URL = os.getenv(
+    'EVENTS_REDIS_URL',
+    CACHES['default']['LOCATION'] if 'redis' in CACHES['default']['BACKEND'].lower() else '',
+)
+EVENTS_CHANNEL = os.getenv('EVENTS_CHANNEL', 'sireshield-events')
+
+# Clients that poll instead pass back the signed epoch token from their last answer and get
+# a 304 from the cache until an alert or monitoring change bumps the user's epoch. Tokens
+# older than POLL_TOKEN_MAX_AGE seconds go through the full, authenticated check.
+# A per-process LocMemCache cannot see bumps made by other workers, so the 304 fast path is
+# off by default there; enable POLL_FAST_PATH with it only when serving from a single process
+POLL_TOKEN_MAX_AGE = int(os.getenv('POLL_TOKEN_MAX_AGE', 3600))
+POLL_FAST_PATH = os.getenv(
+    'POLL_FAST_PATH', str('locmem' not in CACHES['default']['BACKEND'].lower())
+) == 'True'
+
+# Detections within this many seconds of the last one merge into the open alert,
+# and contacts get at most one follow-up per interval while it stays open
+ALERT_COALESCE_WINDOW = int(os.getenv('ALERT_COALESCE_WINDOW', 120))
+ALERT_FOLLOW_UP_INTERVAL = int(os.getenv('ALERT_FOLLOW_UP_INTERVAL', 60))
+
+# Emergency notifications are written to an outbox and delivered by background workers:
+# OUTBOX_IN_PROCESS_WORKERS threads per web process (0 to rely on `manage.py run_outbox_workers`),
+# retried with exponential backoff up to OUTBOX_MAX_ATTEMPTS times
+OUTBOX_IN_PROCESS_WORKERS = int(os.getenv('OUTBOX_IN_PROCESS_WORKERS', 1))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 20))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 2))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 6))
+OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('OUTBOX_RETRY_BASE_SECONDS', 5))
+OUTBOX_RETRY_MAX_SECONDS = int(os.getenv('OUTBOX_RETRY_MAX_SECONDS', 300))
+
+# Delivery workers share warm SMTP connections; idle ones are NOOP-checked after
+# EMAIL_POOL_KEEPALIVE seconds and closed after EMAIL_POOL_MAX_IDLE
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', 4))
+EMAIL_POOL_KEEPALIVE = int(os.getenv('EMAIL_POOL_KEEPALIVE', 30))
+EMAIL_POOL_MAX_IDLE = int(os.getenv('EMAIL_POOL_MAX_IDLE', 300))
+
+# Socket timeout for every SMTP operation, kept under ALERT_EMAIL_DEADLINE so a hung
+# mail server frees its delivery thread instead of holding it forever
+EMAIL_TIMEOUT = float(os.getenv('EMAIL_TIMEOUT', 10))
+
+# Alert channels besides email: an HTTP SMS gateway, an operator webhook and web push.
+# Each channel is enabled by its settings and gets a hard delivery deadline in seconds
+SMS_GATEWAY_URL = os.getenv('SMS_GATEWAY_URL', '')
+SMS_GATEWAY_TOKEN = os.getenv('SMS_GATEWAY_TOKEN', '')
+ALERT_WEBHOOK_URL = os.getenv('ALERT_WEBHOOK_URL', '')
+ALERT_WEBHOOK_SECRET = os.getenv('ALERT_WEBHOOK_SECRET', '')
+WEBPUSH_VAPID_PUBLIC_KEY = os.getenv('WEBPUSH_VAPID_PUBLIC_KEY', '')
+WEBPUSH_VAPID_PRIVATE_KEY = os.getenv('WEBPUSH_VAPID_PRIVATE_KEY', '')
+WEBPUSH_VAPID_SUBJECT = os.getenv('WEBPUSH_VAPID_SUBJECT', 'mailto:admin@sirenshield.local')
+
+# Web push only reaches contacts who linked their own account by accepting a signed
+# token from the guardian; tokens expire after this many seconds
+CONTACT_LINK_MAX_AGE = int(os.getenv('CONTACT_LINK_MAX_AGE', 7 * 24 * 3600))
+ALERT_CHANNEL_DEADLINES = {
+    'email': float(os.getenv('ALERT_EMAIL_DEADLINE', 15)),
+    'sms': float(os.getenv('ALERT_SMS_DEADLINE', 5)),
+    'webhook': float(os.getenv('ALERT_WEBHOOK_DEADLINE', 3)),
+    'push': float(os.getenv('ALERT_PUSH_DEADLINE', 5)),
+}
+ALERT_CHANNEL_DEFAULT_DEADLINE = 10
+# Delivery threads per channel; each channel has its own, so a stuck gateway only delays itself
+ALERT_DISPATCH_WORKERS = int(os.getenv('ALERT_DISPATCH_WORKERS', 4))
+
+# Voice emergencies alert contacts before any network lookup, then follow up as location and
+# police station enrichment completes within EMERGENCY_PIPELINE_BUDGET seconds. The station lookup
+# gets EMERGENCY_ENRICHMENT_GRACE seconds to join the location update before it is sent alone
+EMERGENCY_PIPELINE_BUDGET = float(os.getenv('EMERGENCY_PIPELINE_BUDGET', 15))
+EMERGENCY_ENRICHMENT_GRACE = float(os.getenv('EMERGENCY_ENRICHMENT_GRACE', 2))
+EMERGENCY_PIPELINE_WORKERS = int(os.getenv('EMERGENCY_PIPELINE_WORKERS', 8))
+
+# Browser location fixes are stored as a track per safety session, posted in batches of at
+# most LOCATION_TRACK_MAX_BATCH. Tracks are served simplified with Douglas-Peucker to
+# LOCATION_TRACK_TOLERANCE_M metres unless the client asks for another resolution, and never
+# with more than LOCATION_TRACK_MAX_POINTS points
+LOCATION_TRACK_MAX_BATCH = int(os.getenv('LOCATION_TRACK_MAX_BATCH', 500))
+LOCATION_TRACK_TOLERANCE_M = float(os.getenv('LOCATION_TRACK_TOLERANCE_M', 10))
+LOCATION_TRACK_MAX_POINTS = int(os.getenv('LOCATION_TRACK_MAX_POINTS', 2000))
+
+# `manage.py archive_incidents` moves ended safety sessions, their alerts, location fixes and
+# notifications, and settled alerts older than ARCHIVE_AFTER_DAYS into monthly files under
+# ARCHIVE_DIR, then deletes them. ARCHIVE_FORMAT is parquet (needs pyarrow), jsonl (gzipped)
+# or auto, which uses Parquet when it can
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', str(BASE_DIR / 'data' / 'archive'))
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 180))
+ARCHIVE_FORMAT = os.getenv('ARCHIVE_FORMAT', 'auto')
+
+# Offline police station index built by `manage.py import_police_stations` from an
+# OSM or GeoJSON extract. Lookups outside the extract fall back to the Overpass API
+POLICE_INDEX_PATH = os.getenv('POLICE_INDEX_PATH', str(BASE_DIR / 'data' / 'police_stations.idx'))
+POLICE_INDEX_CELL_DEGREES = float(os.getenv('POLICE_INDEX_CELL_DEGREES', 0.05))
+POLICE_SEARCH_RADIUS_KM = float(os.getenv('POLICE_SEARCH_RADIUS_KM', 5))
+OVERPASS_TIMEOUT = float(os.getenv('OVERPASS_TIMEOUT', 10))
+OVERPASS_URL = os.getenv('OVERPASS_URL', 'https://overpass-api.de/api/interpreter')
+IP_GEOLOCATION_URL = os.getenv('IP_GEOLOCATION_URL', 'https://ipapi.co/{ip}/json/')
+
+# Client IPs are located offline in a GeoIP range database built by `manage.py import_geoip`.
+# GEOIP_TRUSTED_PROXIES is the number of reverse proxies in front of the app whose
+# X-Forwarded-For entries can be trusted. GEOIP_REMOTE_LOOKUP falls back to IP_GEOLOCATION_URL
+# for addresses the database does not cover
+GEOIP_DATABASE_PATH = os.getenv('GEOIP_DATABASE_PATH', str(BASE_DIR / 'data' / 'geoip.db'))
+GEOIP_CACHE_SIZE = int(os.getenv('GEOIP_CACHE_SIZE', 10000))
+GEOIP_TRUSTED_PROXIES = int(os.getenv('GEOIP_TRUSTED_PROXIES', 0))
+GEOIP_REMOTE_LOOKUP = os.getenv('GEOIP_REMOTE_LOOKUP', 'True') == 'True'
+
+# Outbound HTTP (geolocation, Overpass, SMS and webhook gateways) shares one pooled client.
+# Idempotent requests are retried up to HTTP_RETRIES times, but retries per host are capped
+# at HTTP_RETRY_BUDGET_RATIO of its traffic; HTTP_BREAKER_THRESHOLD consecutive failures
+# open the host's circuit for HTTP_BREAKER_RESET seconds, failing fast instead of waiting
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+HTTP_RETRY_BUDGET_RATIO = float(os.getenv('HTTP_RETRY_BUDGET_RATIO', 0.2))
+HTTP_RETRY_BUDGET_MAX = 10
+HTTP_BREAKER_THRESHOLD = int(os.getenv('HTTP_BREAKER_THRESHOLD', 5))
+HTTP_BREAKER_RESET = float(os.getenv('HTTP_BREAKER_RESET', 30))
+
+# Overpass results are cached per geohash cell (precision 6 is about 1.2 x 0.6 km): fresh for
+# POLICE_CACHE_TTL seconds, then served stale for up to POLICE_CACHE_STALE_TTL more while they
+# refresh in the background. The local cache keeps the POLICE_CACHE_MAX_ENTRIES most recently
+# used cells; with a shared CACHE_BACKEND such as Redis, bound it with maxmemory-policy allkeys-lru
+POLICE_CACHE_GEOHASH_PRECISION = int(os.getenv('POLICE_CACHE_GEOHASH_PRECISION', 6))
+POLICE_CACHE_TTL = int(os.getenv('POLICE_CACHE_TTL', 6 * 3600))
+POLICE_CACHE_STALE_TTL = int(os.getenv('POLICE_CACHE_STALE_TTL', 7 * 24 * 3600))
+POLICE_CACHE_MAX_ENTRIES = int(os.getenv('POLICE_CACHE_MAX_ENTRIES', 5000))
+POLICE_CACHE_ALIAS = 'police-stations'
+if 'CACHE_BACKEND' in os.environ:
+    CACHES[POLICE_CACHE_ALIAS] = dict(CACHES['default'], KEY_PREFIX='police')
+else:
+    CACHES[POLICE_CACHE_ALIAS] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'police-stations',
+        'OPTIONS': {'MAX_ENTRIES': POLICE_CACHE_MAX_ENTRIES},
+    }
+
 # Messages
 MESSAGE_TAGS = {
     messages.DEBUG: 'alert-info',
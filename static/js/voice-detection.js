@@ -1,40 +1,46 @@
 class VoiceDetector {
     constructor() {
-        this.mediaRecorder = null;
-        this.audioChunks = [];
-        this.isRecording = false;
         this.stream = null;
-        this.recordingInterval = null;
+        this.audioContext = null;
+        this.processor = null;
+        this.socket = null;
+        this.pendingFrames = [];
+        this.flushInterval = null;
+        this.isRecording = false;
         this.currentLocation = null;
-        this.emergencyPhrase = "help me";
+        this.targetRate = 16000;  // the server expects 16 kHz mono PCM16
+        this.flushMs = 500;
     }
 
     async startRecording() {
+        if (this.isRecording) {
+            return;
+        }
+
         try {
             // Get location first
             await this.updateLocation();
-            
-            this.stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-            this.mediaRecorder = new MediaRecorder(this.stream);
-            this.audioChunks = [];
+        } catch (error) {
+            console.error('Error getting location:', error);
+        }
 
-            this.mediaRecorder.ondataavailable = (event) => {
-                this.audioChunks.push(event.data);
-            };
+        try {
+            this.stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+            this.audioContext = new (window.AudioContext || window.webkitAudioContext)();
+            const source = this.audioContext.createMediaStreamSource(this.stream);
 
-            this.mediaRecorder.onstop = () => {
-                this.processAudio();
+            // Capture raw samples continuously instead of recording clips
+            this.processor = this.audioContext.createScriptProcessor(4096, 1, 1);
+            this.processor.onaudioprocess = (event) => {
+                this.pendingFrames.push(this.downsample(event.inputBuffer.getChannelData(0)));
             };
+            source.connect(this.processor);
+            this.processor.connect(this.audioContext.destination);
 
-            // Start recording
-            this.mediaRecorder.start();
+            this.openSocket();
+            this.flushInterval = setInterval(() => this.flush(), this.flushMs);
             this.isRecording = true;
 
-            // Record for 5 seconds (longer for better speech recognition)
-            setTimeout(() => {
-                this.stopRecording();
-            }, 5000);
-
         } catch (error) {
             console.error('Error accessing microphone:', error);
             alert('Error accessing microphone. Please ensure you have granted microphone permissions.');
@@ -50,6 +56,7 @@ class VoiceDetector {
                             lat: position.coords.latitude,
                             lng: position.coords.longitude
                         };
+                        this.sendLocation();
                         resolve();
                     },
                     error => {
@@ -68,68 +75,123 @@ class VoiceDetector {
         });
     }
 
-    stopRecording() {
-        if (this.mediaRecorder && this.isRecording) {
-            this.mediaRecorder.stop();
-            this.isRecording = false;
-            this.stream.getTracks().forEach(track => track.stop());
+    locationString() {
+        return this.currentLocation ? `${this.currentLocation.lat},${this.currentLocation.lng}` : '';
+    }
+
+    downsample(input) {
+        // Average the input samples falling into each 16 kHz output sample
+        const ratio = this.audioContext.sampleRate / this.targetRate;
+        const output = new Int16Array(Math.floor(input.length / ratio));
+        for (let i = 0; i < output.length; i++) {
+            const start = Math.floor(i * ratio);
+            const end = Math.min(input.length, Math.floor((i + 1) * ratio));
+            let sum = 0;
+            for (let j = start; j < end; j++) {
+                sum += input[j];
+            }
+            const sample = Math.max(-1, Math.min(1, sum / Math.max(1, end - start)));
+            output[i] = sample * 0x7FFF;
+        }
+        return output;
+    }
+
+    openSocket() {
+        if (!('WebSocket' in window)) {
+            return;
+        }
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/voice-stream/`);
+        socket.binaryType = 'arraybuffer';
+        socket.onopen = () => {
+            this.socket = socket;
+            this.sendLocation();
+        };
+        socket.onmessage = (event) => this.handleResult(JSON.parse(event.data));
+        // Without a WebSocket (e.g. a WSGI deployment) frames are POSTed instead
+        socket.onclose = () => {
+            this.socket = null;
+        };
+    }
+
+    sendLocation() {
+        if (this.socket && this.currentLocation) {
+            this.socket.send(JSON.stringify({ location: this.locationString() }));
         }
     }
 
-    async processAudio() {
-        const audioBlob = new Blob(this.audioChunks, { type: 'audio/wav' });
-        const formData = new FormData();
-        formData.append('audio', audioBlob, 'recording.wav');
+    flush() {
+        if (this.pendingFrames.length === 0) {
+            return;
+        }
+        const total = this.pendingFrames.reduce((length, frame) => length + frame.length, 0);
+        const batch = new Int16Array(total);
+        let offset = 0;
+        for (const frame of this.pendingFrames) {
+            batch.set(frame, offset);
+            offset += frame.length;
+        }
+        this.pendingFrames = [];
 
-        // Add location to form data
-        if (this.currentLocation) {
-            const location = `${this.currentLocation.lat},${this.currentLocation.lng}`;
-            formData.append('location', location);
-            this.sendToServer(formData);
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            this.socket.send(batch.buffer);
         } else {
-            // Try to get location again if not available
-            try {
-                await this.updateLocation();
-                const location = `${this.currentLocation.lat},${this.currentLocation.lng}`;
-                formData.append('location', location);
-                this.sendToServer(formData);
-            } catch (error) {
-                console.error('Error getting location:', error);
-                alert('Unable to get your location. Emergency alerts may not work properly.');
-                this.sendToServer(formData);
-            }
+            this.sendToServer(batch.buffer);
+        }
+    }
+
+    stopRecording() {
+        if (!this.isRecording) {
+            return;
         }
+        clearInterval(this.flushInterval);
+        this.processor.disconnect();
+        this.audioContext.close();
+        this.stream.getTracks().forEach(track => track.stop());
+        if (this.socket) {
+            this.socket.close();
+        }
+        this.pendingFrames = [];
+        this.isRecording = false;
     }
 
-    async sendToServer(formData) {
+    async sendToServer(buffer) {
         try {
-            const response = await fetch('/process-voice/', {
+            const response = await fetch('/stream-voice/', {
                 method: 'POST',
-                body: formData,
+                body: buffer,
                 headers: {
+                    'Content-Type': 'application/octet-stream',
+                    'X-Sample-Rate': String(this.targetRate),
+                    'X-Location': this.locationString(),
                     'X-CSRFToken': getCookie('csrftoken')
                 }
             });
 
-            const data = await response.json();
+            this.handleResult(await response.json());
+        } catch (error) {
+            console.error('Error sending audio to server:', error);
+        }
+    }
 
-            if (data.status === 'success') {
-                if (data.is_emergency) {
-                    alert(`Emergency alert sent! Detected phrase: "${data.detected_text}". Your contacts have been notified.`);
-                    
-                    // Open maps with current location
-                    if (this.currentLocation) {
-                        const mapUrl = `https://maps.google.com/?q=${this.currentLocation.lat},${this.currentLocation.lng}`;
-                        window.open(mapUrl, '_blank');
-                    }
-                } else {
-                    console.log('Voice processed - no emergency detected:', data.detected_text);
+    handleResult(data) {
+        if (data.status === 'success') {
+            if (data.is_emergency) {
+                alert(`Emergency alert sent! Detected phrase: "${data.detected_text}". Your contacts have been notified.`);
+
+                // Open maps with current location
+                if (this.currentLocation) {
+                    const mapUrl = `https://maps.google.com/?q=${this.currentLocation.lat},${this.currentLocation.lng}`;
+                    window.open(mapUrl, '_blank');
                 }
-            } else {
-                console.error('Error processing voice:', data.message);
+            } else if (data.windows) {
+                console.log('Voice processed - no emergency detected:', data.detected_text);
             }
-        } catch (error) {
-            console.error('Error sending audio to server:', error);
+        } else if (data.status === 'buffered') {
+            // Recognition was busy; the audio is kept and checked with the next frames
+            console.log('Voice buffered, detection deferred:', data.message);
+        } else {
+            console.error('Error processing voice:', data.message);
         }
     }
 }
@@ -137,12 +199,14 @@ class VoiceDetector {
 // Initialize voice detector
 const voiceDetector = new VoiceDetector();
 
-// Start voice detection when safety mode is active
+// Start continuous voice streaming when safety mode is active
 function startVoiceDetection() {
     if (document.getElementById('voice-detection-status')) {
+        voiceDetector.startRecording();
+        // Keep the location attached to the stream up to date
         setInterval(() => {
-            voiceDetector.startRecording();
-        }, 15000); // Check every 15 seconds (longer interval for speech recognition)
+            voiceDetector.updateLocation().catch(() => {});
+        }, 60000);
     }
 }
 